@@ -0,0 +1,92 @@
+"""
+Analítica agregada sobre todos los AOIs de un usuario, calculada en PostgreSQL.
+
+Cada consulta agrupa, pondera por área geodésica (columna generada
+AOI.area_m2, en hectáreas) y calcula variaciones interanuales con funciones de ventana en una
+sola ida a la base de datos. Opcionalmente se lee de la vista materializada
+biomass_aoi_year_carbon, que se refresca después de cada análisis.
+"""
+from django.conf import settings
+from django.db import connection
+
+MATERIALIZED_VIEW = 'biomass_aoi_year_carbon'
+
+# Una fila por AOI-año: carbono medio (Mg C/ha), área (ha) y variación respecto
+# del año anterior (solo si el año anterior existe). Es también la definición
+# de la vista materializada (migraciones 0012 y 0015).
+AOI_YEAR_CARBON_SQL = """
+    SELECT aoi_id, user_id, year, mean_carbon, area_ha,
+           CASE WHEN LAG(year) OVER w = year - 1
+                THEN mean_carbon - LAG(mean_carbon) OVER w
+           END AS yoy_delta
+    FROM (
+        SELECT DISTINCT ON (s.aoi_id, s.year)
+               s.aoi_id, a.user_id, s.year, s.mean_carbon,
+               a.area_m2 / 10000.0 AS area_ha
+        FROM biomass_biomassstats s
+        JOIN biomass_aoi a ON a.id = s.aoi_id
+        WHERE a.geometry IS NOT NULL
+        ORDER BY s.aoi_id, s.year, s.id DESC
+    ) stats
+    WINDOW w AS (PARTITION BY aoi_id ORDER BY year)
+"""
+
+
+def _source():
+    if settings.ANALYTICS_USE_MATERIALIZED_VIEW:
+        return MATERIALIZED_VIEW
+    return f"({AOI_YEAR_CARBON_SQL})"
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def carbon_totals_by_year(user_id):
+    """
+    Por año: número de AOIs, área total, carbono total (Mg C) y carbono medio
+    ponderado por área (Mg C/ha).
+    """
+    return _fetch(f"""
+        SELECT year,
+               COUNT(*) AS aoi_count,
+               SUM(area_ha) AS area_ha,
+               SUM(mean_carbon * area_ha) AS total_carbon,
+               SUM(mean_carbon * area_ha) / NULLIF(SUM(area_ha), 0) AS weighted_mean_carbon
+        FROM {_source()} aoi_year
+        WHERE user_id = %s
+        GROUP BY year
+        ORDER BY year
+    """, [user_id])
+
+
+def yoy_change_distribution(user_id):
+    """
+    Por año: distribución de la variación interanual del carbono medio de los
+    AOIs (media, percentiles 10/50/90) y variación total ponderada por área.
+    """
+    rows = _fetch(f"""
+        SELECT year,
+               COUNT(*) AS aoi_count,
+               AVG(yoy_delta) AS mean_delta,
+               percentile_cont(ARRAY[0.1, 0.5, 0.9]) WITHIN GROUP (ORDER BY yoy_delta) AS percentiles,
+               SUM(yoy_delta * area_ha) AS total_carbon_delta
+        FROM {_source()} aoi_year
+        WHERE user_id = %s AND yoy_delta IS NOT NULL
+        GROUP BY year
+        ORDER BY year
+    """, [user_id])
+    for row in rows:
+        row['p10_delta'], row['p50_delta'], row['p90_delta'] = row.pop('percentiles')
+    return rows
+
+
+def refresh_materialized_view():
+    """
+    Refresca la vista materializada sin bloquear lecturas (requiere su índice único).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {MATERIALIZED_VIEW}")
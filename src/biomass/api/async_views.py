@@ -0,0 +1,128 @@
+"""
+Versiones asíncronas (ASGI) de los endpoints de solo lectura más consultados.
+
+Usan el ORM asíncrono y la caché asíncrona, así que una petición que espera a
+PostgreSQL o al backend de resultados no ocupa un hilo del servidor. Se sirven
+con `uvicorn geoapp.asgi:application`; bajo WSGI también funcionan, pero Django
+las ejecuta en un event loop por petición.
+"""
+from asgiref.sync import sync_to_async
+from celery.result import AsyncResult
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from biomass.models import AOI, BiomassStats, BiomassPeriodStats
+from biomass.signals import data_stats_version_key
+from core.ml_models.gee_predictor import PERIOD_GRANULARITIES
+from .serializers import AOISerializer
+from .views import build_data_stats, build_period_stats, build_task_status, AOI_STATUS_BY_TASK_STATE
+from .geometry_formats import requested_geometry_format
+
+# Estados finales de Celery: su respuesta ya no cambia y se puede cachear
+FINAL_TASK_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+
+async def authenticate(request):
+    """
+    Autenticación JWT igual que en DRF. Devuelve el usuario o None.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@require_GET
+async def get_data_stats_async(request):
+    aoi_id = request.GET.get('aoi_id')
+    share_token = request.GET.get('share_token')
+
+    if not aoi_id:
+        return JsonResponse({"error": "aoi_id is required"}, status=400)
+
+    try:
+        aoi = await AOI.objects.aget(id=aoi_id)
+    except (AOI.DoesNotExist, ValueError):
+        return JsonResponse({"error": "AOI no encontrado"}, status=404)
+
+    if share_token:
+        if aoi.share_token != share_token:
+            return JsonResponse({"error": "Token de acceso inválido"}, status=403)
+    else:
+        user = await authenticate(request)
+        if user is None or aoi.user_id != user.id:
+            return JsonResponse({"error": "No tienes permiso para acceder a este AOI."}, status=403)
+
+    granularity = request.GET.get('granularity')
+    if granularity and granularity not in PERIOD_GRANULARITIES:
+        return JsonResponse({"error": "granularity debe ser 'month' o 'season'"}, status=400)
+    try:
+        geometry_format, precision = requested_geometry_format(request)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+
+    # La clave cambia con cada análisis (task_id), con el share_token de la respuesta,
+    # con el formato de la geometría y con cada edición del AOI o de sus estadísticas
+    version = await cache.aget(data_stats_version_key(aoi.id), '')
+    cache_key = (f"data-stats:{aoi.id}:{version}:{aoi.task_id}:{aoi.status}:{aoi.share_token}:"
+                 f"{geometry_format}:{precision}")
+    data = await cache.aget(cache_key)
+    if data is None:
+        biomass_stats = [stat async for stat in BiomassStats.objects.filter(aoi_id=aoi.id)]
+        data = build_data_stats(aoi, biomass_stats, geometry_format, precision)
+        if aoi.status == 'completed':
+            await cache.aset(cache_key, data, settings.ASYNC_VIEWS_CACHE_TIMEOUT)
+    if granularity:
+        # La serie sub-anual se calcula aparte del análisis anual: no se cachea con él
+        period_stats = [stat async for stat in BiomassPeriodStats.objects.filter(aoi_id=aoi.id, granularity=granularity)]
+        data = {**data, "granularity": granularity, "period_stats": build_period_stats(period_stats)}
+    return JsonResponse(data)
+
+
+@require_GET
+async def task_status_async(request, task_id):
+    """
+    Consultar el estado de una tarea en segundo plano
+    """
+    if await authenticate(request) is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    cache_key = f"task-status:{task_id}"
+    response = await cache.aget(cache_key)
+    if response is not None:
+        return JsonResponse(response)
+
+    # El backend de resultados (django-db) solo tiene API síncrona
+    task_result = AsyncResult(task_id)
+    response = await sync_to_async(build_task_status)(task_result)
+    state = response['state']
+
+    if state in AOI_STATUS_BY_TASK_STATE:
+        await (AOI.objects.filter(task_id=task_id)
+               .exclude(status='cancelled')
+               .aupdate(status=AOI_STATUS_BY_TASK_STATE[state]))
+    if state in FINAL_TASK_STATES:
+        await cache.aset(cache_key, response, settings.ASYNC_VIEWS_CACHE_TIMEOUT)
+    return JsonResponse(response)
+
+
+@require_GET
+async def aoi_list_async(request):
+    """
+    Lista de AOIs del usuario logueado (mismo formato que /aois/)
+    """
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    aois = [aoi async for aoi in AOI.objects.filter(user_id=user.id).order_by('id')]
+    try:
+        data = AOISerializer(aois, many=True, context={'request': request}).data
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+    return JsonResponse(data, safe=False)
@@ -0,0 +1,245 @@
+"""
+Coordinación entre procesos (vistas y workers de Celery) usando Redis.
+
+Se usa para no lanzar dos veces el mismo análisis: las solicitudes con la misma
+geometría se enganchan a la tarea que ya está en curso (single-flight) o copian
+las estadísticas de un AOI ya analizado.
+"""
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import AOI, BiomassStats
+
+logger = logging.getLogger(__name__)
+
+# Versión del pipeline de extracción + modelo. Cambiarla invalida la
+# deduplicación contra análisis hechos con una versión anterior.
+PIPELINE_VERSION = 'v1'
+
+_redis_client = None
+
+
+def get_redis():
+    """
+    Cliente Redis compartido (perezoso) apuntando a settings.REDIS_URL.
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+def geometry_fingerprint(geom):
+    """
+    Huella de la geometría normalizada (mismo polígono con otro vértice inicial
+    u otra orientación produce la misma huella) más la versión del pipeline.
+    """
+    normalized = geom.clone()
+    normalized.normalize()
+    digest = hashlib.sha256(bytes(normalized.wkb)).hexdigest()
+    return f"{PIPELINE_VERSION}:{digest}"
+
+
+def _lock_key(fingerprint):
+    return f"biomass:analysis:{fingerprint}"
+
+
+def acquire_analysis(fingerprint, task_id):
+    """
+    Intenta registrar task_id como el análisis en curso para la huella.
+    Devuelve None si lo consiguió (hay que lanzar la tarea) o el task_id de la
+    tarea que ya está analizando esa geometría.
+    Si Redis no está disponible no se deduplica.
+    """
+    key = _lock_key(fingerprint)
+    try:
+        client = get_redis()
+        if client.set(key, task_id, nx=True, ex=settings.ANALYSIS_LOCK_TTL):
+            return None
+        return client.get(key)
+    except redis.RedisError as e:
+        logger.warning("Single-flight deshabilitado, Redis no disponible: %s", e)
+        return None
+
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def release_analysis(fingerprint, task_id):
+    """
+    Libera la huella solo si sigue perteneciendo a task_id.
+    """
+    if not fingerprint:
+        return
+    try:
+        get_redis().eval(_RELEASE_SCRIPT, 1, _lock_key(fingerprint), task_id)
+    except redis.RedisError as e:
+        logger.warning("No se pudo liberar el lock de análisis: %s", e)
+
+
+def find_completed_analysis(fingerprint, exclude_id=None):
+    """
+    Busca un AOI ya analizado con la misma huella que tenga el año en curso.
+    """
+    current_year = datetime.now().year
+    queryset = AOI.objects.filter(
+        fingerprint=fingerprint,
+        status='completed',
+        biomassstats__year=current_year,
+    )
+    if exclude_id is not None:
+        queryset = queryset.exclude(id=exclude_id)
+    return queryset.order_by('-uploaded_at').first()
+
+
+def user_analyses_in_flight(user_id, exclude_aoi_id=None):
+    """
+    Análisis en curso lanzados por el usuario. No cuenta los refrescos de
+    mantenimiento ni los encolados hace más de ANALYSIS_IN_FLIGHT_STALE_AFTER
+    (tareas perdidas que dejaron el AOI en 'analysing'), ni el AOI exclude_aoi_id.
+    """
+    since = timezone.now() - timedelta(seconds=settings.ANALYSIS_IN_FLIGHT_STALE_AFTER)
+    queryset = AOI.objects.filter(
+        user_id=user_id,
+        status='analysing',
+        analysis_origin='user',
+        analysis_started_at__gte=since,
+    )
+    if exclude_aoi_id is not None:
+        queryset = queryset.exclude(id=exclude_aoi_id)
+    return queryset.count()
+
+
+def copy_biomass_stats(source, target):
+    """
+    Copia las estadísticas de source a target (solo los años que target no tiene).
+    """
+    fields = [
+        f.name for f in BiomassStats._meta.concrete_fields
+        if f.name not in ('id', 'aoi')
+    ]
+    existing_years = set(
+        BiomassStats.objects.filter(aoi=target).values_list('year', flat=True)
+    )
+    # ignore_conflicts: un refresco concurrente pudo guardar el año mientras tanto
+    BiomassStats.objects.bulk_create([
+        BiomassStats(aoi=target, **{name: getattr(stat, name) for name in fields})
+        for stat in BiomassStats.objects.filter(aoi=source)
+        if stat.year not in existing_years
+    ], ignore_conflicts=True)
+
+
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('hset', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('expire', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket compartido en Redis: limita cuántas operaciones por segundo
+    lanzan todos los procesos juntos (p. ej. análisis contra la cuota de Earth Engine).
+    """
+
+    def __init__(self, name, rate, capacity=1):
+        self.key = f"biomass:bucket:{name}"
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+
+    def try_acquire(self):
+        """
+        Toma un token. Devuelve 0 si lo consiguió o los segundos a esperar.
+        """
+        wait = get_redis().eval(
+            _TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity, time.time()
+        )
+        return float(wait)
+
+    def acquire(self):
+        """
+        Bloquea hasta obtener un token.
+        """
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class RefreshCheckpoint:
+    """
+    Checkpoint de una corrida de actualización masiva guardado en Redis:
+    fase actual ('favorites' y luego 'others') y último id de AOI encolado.
+    """
+
+    PHASES = ['favorites', 'others']
+
+    def __init__(self, run_key):
+        self.key = f"biomass:refresh:{run_key}"
+
+    def load(self):
+        state = get_redis().hgetall(self.key)
+        return state.get('phase', self.PHASES[0]), int(state.get('last_id', 0))
+
+    def save(self, phase, last_id):
+        client = get_redis()
+        client.hset(self.key, mapping={'phase': phase, 'last_id': last_id})
+        client.expire(self.key, settings.BATCH_REFRESH_CHECKPOINT_TTL)
+
+    def advance(self, phase):
+        """
+        Pasa a la siguiente fase. Devuelve False si ya no quedan fases.
+        """
+        index = self.PHASES.index(phase) + 1
+        if index >= len(self.PHASES):
+            self.save('done', 0)
+            return False
+        self.save(self.PHASES[index], 0)
+        return True
+
+
+def queue_depths():
+    """
+    Mensajes pendientes en cada cola de análisis. Con el broker Redis cada cola
+    es una lista por prioridad: la de prioridad 0 tiene el nombre de la cola y
+    las demás el nombre más el separador de kombu y la prioridad.
+    """
+    client = get_redis()
+    queues = [
+        settings.ANALYSIS_QUEUE_SMALL,
+        settings.ANALYSIS_QUEUE_LARGE,
+        settings.MAINTENANCE_QUEUE,
+    ]
+    options = settings.CELERY_BROKER_TRANSPORT_OPTIONS
+    separator = options.get('sep', '\x06\x16')
+    pipeline = client.pipeline()
+    for queue in queues:
+        for priority in options['priority_steps']:
+            pipeline.llen(f"{queue}{separator}{priority}" if priority else queue)
+    lengths = iter(pipeline.execute())
+    return {queue: sum(next(lengths) for _ in options['priority_steps']) for queue in queues}
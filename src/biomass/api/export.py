@@ -0,0 +1,145 @@
+"""
+Exportación masiva de BiomassStats junto con los metadatos de su AOI.
+
+Las filas se leen con un cursor del servidor (iterator(chunk_size=...)) y se
+escriben como CSV o Parquet por bloques, así que la memoria no depende del
+número de filas exportadas.
+"""
+import csv
+
+from biomass.models import BiomassStats
+
+EXPORT_COLUMNS = [
+    ('aoi_id', 'aoi_id'),
+    ('aoi_name', 'aoi__name'),
+    ('aoi_status', 'aoi__status'),
+    ('aoi_favorite', 'aoi__favorite'),
+    ('aoi_uploaded_at', 'aoi__uploaded_at'),
+    ('user_id', 'aoi__user_id'),
+    ('year', 'year'),
+    ('mean_mg', 'mean_mg'),
+    ('mean_carbon', 'mean_carbon'),
+    ('std_mg', 'std_mg'),
+    ('ci_low_mg', 'ci_low_mg'),
+    ('ci_high_mg', 'ci_high_mg'),
+]
+
+EXPORT_CHUNK_SIZE = 5000
+
+
+def export_queryset(user_id=None, aoi_ids=None):
+    """
+    Filas de BiomassStats + AOI como tuplas, ordenadas por AOI y año.
+    """
+    queryset = BiomassStats.objects.all()
+    if user_id is not None:
+        queryset = queryset.filter(aoi__user_id=user_id)
+    if aoi_ids:
+        queryset = queryset.filter(aoi_id__in=aoi_ids)
+    return queryset.order_by('aoi_id', 'year').values_list(*[field for _, field in EXPORT_COLUMNS])
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """
+    Pseudo-buffer para csv.writer: devuelve la línea en lugar de guardarla.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """
+    Genera el CSV línea a línea (cabecera incluida).
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class _ChunkSink:
+    """
+    Destino de escritura para ParquetWriter que acumula bytes hasta que se
+    recogen con take(). Solo se escribe hacia adelante, sin seek.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('aoi_id', pa.int64()),
+        ('aoi_name', pa.string()),
+        ('aoi_status', pa.string()),
+        ('aoi_favorite', pa.bool_()),
+        ('aoi_uploaded_at', pa.timestamp('us', tz='UTC')),
+        ('user_id', pa.int64()),
+        ('year', pa.int16()),
+        ('mean_mg', pa.float64()),
+        ('mean_carbon', pa.float64()),
+        ('std_mg', pa.float64()),
+        ('ci_low_mg', pa.float64()),
+        ('ci_high_mg', pa.float64()),
+    ])
+
+
+def iter_parquet(rows, batch_size=EXPORT_CHUNK_SIZE):
+    """
+    Genera un archivo Parquet por partes: cada bloque de batch_size filas se
+    escribe como un row group y sus bytes se entregan en cuanto se escriben.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def write_batch(batch):
+        columns = list(zip(*batch))
+        writer.write_batch(pa.record_batch(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        ))
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            write_batch(batch)
+            batch = []
+            yield sink.take()
+    if batch:
+        write_batch(batch)
+    writer.close()
+    yield sink.take()
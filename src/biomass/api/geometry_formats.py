@@ -0,0 +1,180 @@
+"""
+Formatos compactos para las geometrías de los AOIs en las respuestas.
+
+El cliente elige el formato con ?geometry_format=<formato> o con un parámetro
+del Accept (Accept: application/json; geometry=twkb; precision=5):
+
+- geojson   : el formato de siempre (sin cambios).
+- geojson-q : GeoJSON con coordenadas redondeadas a `precision` decimales
+              (6 decimales ≈ 10 cm).
+- wkb       : WKB en base64.
+- twkb      : Tiny WKB en base64 (coordenadas enteras cuantizadas, deltas y varints).
+- delta     : GeoJSON con cada anillo como [x0, y0, dx1, dy1, ...] en enteros
+              cuantizados (x * 10^precision); cada anillo empieza en absoluto.
+
+Las coordenadas se procesan como arreglos de NumPy por anillo.
+"""
+import base64
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from rest_framework.exceptions import ValidationError
+
+GEOMETRY_FORMATS = ('geojson', 'geojson-q', 'wkb', 'twkb', 'delta')
+
+# Códigos de tipo de TWKB
+TWKB_TYPES = {'Polygon': 3, 'MultiPolygon': 6}
+
+
+def requested_geometry_format(request):
+    """
+    (formato, precisión) pedidos por el cliente, o (None, None) si no pidió
+    ninguno. Sirve con peticiones de DRF y de Django (vistas asíncronas).
+    """
+    if request is None:
+        return None, None
+    params = getattr(request, 'query_params', request.GET)
+    accept = {}
+    for part in request.headers.get('Accept', '').split(';')[1:]:
+        key, _, value = part.partition('=')
+        accept[key.strip()] = value.strip()
+
+    geometry_format = params.get('geometry_format') or accept.get('geometry')
+    if not geometry_format:
+        return None, None
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise ValidationError({"geometry_format": f"Debe ser uno de: {', '.join(GEOMETRY_FORMATS)}"})
+
+    precision = params.get('geometry_precision') or accept.get('precision') or settings.GEOMETRY_PRECISION
+    try:
+        precision = int(precision)
+    except ValueError:
+        raise ValidationError({"geometry_precision": "Debe ser un entero"})
+    if not 0 <= precision <= 7:
+        # TWKB guarda la precisión en 4 bits con zigzag (-7..7)
+        raise ValidationError({"geometry_precision": "Debe estar entre 0 y 7"})
+    return geometry_format, precision
+
+
+def _polygons(geometry):
+    if isinstance(geometry, Polygon):
+        return [geometry]
+    if isinstance(geometry, MultiPolygon):
+        return list(geometry)
+    raise ValueError(f"Tipo de geometría no soportado: {geometry.geom_type}")
+
+
+def _rings(polygon):
+    """
+    Anillos del polígono (exterior primero) como arreglos (n, 2) de float64.
+    """
+    return [np.asarray(ring.array, dtype=np.float64)[:, :2] for ring in polygon]
+
+
+def _quantize(coords, precision):
+    return np.round(coords * 10.0 ** precision).astype(np.int64)
+
+
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _varints(values):
+    """
+    Codifica enteros sin signo como varints (LEB128), vectorizado.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return b''
+    lengths = np.ones(values.shape, dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    positions = np.arange(lengths.max())
+    groups = (values[:, None] >> (positions * 7).astype(np.uint64)) & np.uint64(0x7F)
+    groups |= (positions < lengths[:, None] - 1).astype(np.uint64) << np.uint64(7)
+    return groups[positions < lengths[:, None]].astype(np.uint8).tobytes()
+
+
+def to_quantized_geojson(geometry, precision):
+    polygons = [[np.round(ring, precision).tolist() for ring in _rings(polygon)] for polygon in _polygons(geometry)]
+    if geometry.geom_type == 'Polygon':
+        return {"type": "Polygon", "coordinates": polygons[0]}
+    return {"type": "MultiPolygon", "coordinates": polygons}
+
+
+def to_delta(geometry, precision):
+    def encode_ring(ring):
+        quantized = _quantize(ring, precision)
+        quantized[1:] = np.diff(quantized, axis=0)
+        return quantized.ravel().tolist()
+
+    polygons = [[encode_ring(ring) for ring in _rings(polygon)] for polygon in _polygons(geometry)]
+    if geometry.geom_type == 'Polygon':
+        return {"type": "Polygon", "precision": precision, "coordinates": polygons[0]}
+    return {"type": "MultiPolygon", "precision": precision, "coordinates": polygons}
+
+
+def to_twkb(geometry, precision):
+    """
+    TWKB (sin bbox, tamaños ni ids) de un Polygon o MultiPolygon. El delta de
+    cada punto es respecto del punto anterior de toda la geometría.
+    """
+    header = bytes([TWKB_TYPES[geometry.geom_type] | (int(_zigzag(precision)) << 4)])
+    if geometry.empty:
+        return header + bytes([0x10])
+    polygons = [_rings(polygon) for polygon in _polygons(geometry)]
+
+    rings = [ring for polygon in polygons for ring in polygon]
+    quantized = _quantize(np.concatenate(rings), precision)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    encoded = _zigzag(deltas.ravel())
+
+    parts = [header, bytes([0])]
+    if geometry.geom_type == 'MultiPolygon':
+        parts.append(_varints([len(polygons)]))
+    start = 0
+    for polygon in polygons:
+        parts.append(_varints([len(polygon)]))
+        for ring in polygon:
+            parts.append(_varints([len(ring)]))
+            parts.append(_varints(encoded[2 * start:2 * (start + len(ring))]))
+            start += len(ring)
+    return b''.join(parts)
+
+
+def encode_geometry(geometry, geometry_format, precision):
+    """
+    Representación de la geometría en el formato pedido (ver GEOMETRY_FORMATS).
+    """
+    if geometry is None:
+        return None
+    if geometry_format == 'geojson':
+        return geometry.json
+    if geometry_format == 'geojson-q':
+        return to_quantized_geojson(geometry, precision)
+    if geometry_format == 'wkb':
+        return base64.b64encode(bytes(geometry.wkb)).decode('ascii')
+    if geometry_format == 'twkb':
+        return base64.b64encode(to_twkb(geometry, precision)).decode('ascii')
+    if geometry_format == 'delta':
+        return to_delta(geometry, precision)
+    raise ValueError(f"Formato de geometría desconocido: {geometry_format}")
+
+
+def decode_delta(encoded):
+    """
+    Inverso de to_delta (anillos como arreglos (n, 2) de float64).
+    """
+    scale = 10.0 ** encoded['precision']
+
+    def decode_ring(values):
+        return np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / scale
+
+    if encoded['type'] == 'Polygon':
+        return [[decode_ring(ring) for ring in encoded['coordinates']]]
+    return [[decode_ring(ring) for ring in polygon] for polygon in encoded['coordinates']]
@@ -0,0 +1,124 @@
+"""
+Renderer y parser JSON de DRF basados en orjson.
+
+orjson serializa de forma nativa los escalares y arreglos de NumPy
+(OPT_SERIALIZE_NUMPY), las claves no string de los diccionarios (años como
+int en get_data_stats) y las fechas, sin convertir valor por valor en Python.
+Con JSON_FLOAT_PRECISION se redondean los floats antes de serializar (los
+arreglos de NumPy con np.round, sin recorrerlos en Python); sin el setting
+no se recorre la respuesta.
+
+CSVRenderer y ParquetRenderer solo participan en la negociación de contenido
+de las exportaciones: el cuerpo lo genera la vista en streaming.
+"""
+from decimal import Decimal
+
+import numpy as np
+import orjson
+from django.conf import settings
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def default(obj):
+    """
+    Tipos que orjson no serializa por sí mismo (mismo criterio que el encoder de DRF).
+    """
+    if isinstance(obj, Promise):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        # Arreglos no contiguos o de dtype no soportado por orjson
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__getitem__') and hasattr(obj, 'keys'):
+        return dict(obj)
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def round_floats(data, precision):
+    """
+    Copia de data con los floats redondeados a `precision` decimales.
+    """
+    if isinstance(data, float):
+        return round(data, precision)
+    if isinstance(data, dict):
+        return {key: round_floats(value, precision) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [round_floats(value, precision) for value in data]
+    if isinstance(data, np.ndarray) and np.issubdtype(data.dtype, np.floating):
+        return np.round(data, precision)
+    if isinstance(data, np.floating):
+        return round(float(data), precision)
+    return data
+
+
+def dumps(data, precision=None, indent=False):
+    if precision is not None:
+        data = round_floats(data, precision)
+    options = ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+    return orjson.dumps(data, default=default, option=options)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Reemplazo de JSONRenderer. NaN e infinito se escriben como null.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Accept: application/json; indent=N (orjson solo indenta con 2 espacios)
+        indent = bool(accepted_media_type and 'indent=' in accepted_media_type)
+        return dumps(data, precision=settings.JSON_FLOAT_PRECISION, indent=indent)
+
+
+class StreamingExportRenderer(BaseRenderer):
+    """
+    Deja pasar Accept: <media_type> hasta la vista, que responde con un
+    StreamingHttpResponse. Los errores (Response con un dict) se escriben en JSON.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return dumps(data)
+
+
+class CSVRenderer(StreamingExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ParquetRenderer(StreamingExportRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
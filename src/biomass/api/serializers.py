@@ -2,6 +2,7 @@ import re
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from biomass.models import AOI, BiomassStats
+from .geometry_formats import requested_geometry_format, encode_geometry
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -177,19 +178,43 @@ class UserDetailSerializer(serializers.ModelSerializer):
 
 class AnalyzeGeoJSONSerializer(serializers.Serializer):
     geojson = serializers.FileField()
+    # Fuente de las características (por defecto settings.FEATURE_SOURCE)
+    feature_source = serializers.ChoiceField(choices=['auto', 'ee', 'local'], required=False)
 
     class Meta:
-        fields = ['geojson']
+        fields = ['geojson', 'feature_source']
 
 class AOISerializer(serializers.ModelSerializer):
     class Meta:
         model = AOI
-        fields = ['id', 'name', 'file_path', 'uploaded_at', 'geometry', 'task_id', 'user', 'favorite', 'share_token', 'status']
+        fields = ['id', 'name', 'file_path', 'uploaded_at', 'geometry', 'task_id', 'user', 'favorite', 'share_token', 'status', 'area_m2', 'npoints']
+
+    def to_representation(self, instance):
+        # Geometría en el formato compacto pedido (?geometry_format=...), si hay uno
+        data = super().to_representation(instance)
+        geometry_format, precision = requested_geometry_format(self.context.get('request'))
+        if geometry_format:
+            data['geometry'] = encode_geometry(instance.geometry, geometry_format, precision)
+        return data
     
+class AOISummarySerializer(serializers.ModelSerializer):
+    """
+    Representación ligera para búsquedas espaciales: bbox, área (m²) y número de
+    vértices (columnas generadas del AOI) en lugar de la geometría
+    """
+    bbox = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AOI
+        fields = ['id', 'name', 'uploaded_at', 'status', 'favorite', 'bbox', 'area_m2', 'npoints']
+
+    def get_bbox(self, obj):
+        return list(obj.bbox.extent) if obj.bbox else None
+
 class BiomassStatsSerializer(serializers.ModelSerializer):
     class Meta:
         model = BiomassStats
-        fields = ['id', 'aoi', 'year', 'mean_mg', 'mean_carbon', ]
+        fields = ['id', 'aoi', 'year', 'mean_mg', 'mean_carbon', 'std_mg', 'ci_low_mg', 'ci_high_mg']
 
 class ChangePasswordSerializer(serializers.Serializer):
     password = serializers.CharField()
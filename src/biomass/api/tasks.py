@@ -1,22 +1,300 @@
 from celery import shared_task
+from celery.signals import task_revoked
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db.models import Count
 from django.utils import timezone
-from datetime import datetime
-from ..models import AOI, BiomassStats
-from core.ml_models.gee_predictor import extract_features_from_geojson
+from datetime import datetime, date
+from ..models import AOI, BiomassStats, BiomassPeriodStats
+from .coordination import (
+    get_redis, release_analysis, copy_biomass_stats, user_analyses_in_flight, TokenBucket, RefreshCheckpoint
+)
+from .analytics import refresh_materialized_view
+from core.ml_models.gee_predictor import (
+    extract_feature_matrix, extract_feature_matrices_batch, extract_period_features
+)
+from core.ml_models.tree_compiler import compile_model
+from core.ml_models.uncertainty import forest_predict_with_std, bootstrap_mean_ci
+from core.ml_models.ee_client import EEClient, AIMDLimiter, EEQuotaError, set_ee_client
+from core.ml_models.local_features import LocalFeatureSource
 import joblib
+import json
 import os
+import redis
+import signal
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 import numpy as np
+import pandas as pd
 from sklearn.metrics import r2_score, mean_squared_error
 
 # Cargar el modelo - ruta corregida
 model_path = os.path.join(os.path.dirname(__file__), '..', '..', 'core', 'ml_models', 'model.joblib')
 model = joblib.load(model_path)
+compiled_model = compile_model(model) if settings.COMPILED_MODEL_PREDICT else None
 
-@shared_task(bind=True)
-def analyze_geojson_task(self, geojson_data, user_id, aoi_id):
+# Llamadas a Earth Engine con reintentos y concurrencia AIMD compartida entre workers
+set_ee_client(EEClient(
+    limiter=AIMDLimiter(
+        get_redis,
+        initial=settings.EE_CONCURRENCY_INITIAL,
+        minimum=settings.EE_CONCURRENCY_MIN,
+        maximum=settings.EE_CONCURRENCY_MAX,
+    ),
+    max_retries=settings.EE_MAX_RETRIES,
+))
+
+# Mosaicos locales (sin Earth Engine) para las regiones configuradas
+local_feature_source = LocalFeatureSource(settings.LOCAL_FEATURE_REGIONS)
+
+FEATURE_SOURCES = ('auto', 'ee', 'local')
+
+def uses_local_source(geojson_data, year, feature_source=None):
+    """
+    Si las características del AOI para el año salen de los mosaicos locales:
+    'local' siempre, 'auto' si alguna región cubre el AOI y tiene el stack del
+    año, 'ee' nunca.
+    """
+    feature_source = feature_source or settings.FEATURE_SOURCE
+    return feature_source == 'local' or (
+        feature_source == 'auto' and local_feature_source.covers(geojson_data, year)
+    )
+
+def extract_year_features(geojson_data, year, feature_source=None):
+    """
+    Matriz float32 (muestras, características) del AOI para el año, con las
+    columnas en el orden de model.feature_names_in_, o None si no hay muestras.
+    Fuente: 'ee' (Earth Engine), 'local' (mosaicos en disco) o 'auto' (ver
+    uses_local_source); por defecto settings.FEATURE_SOURCE.
+    """
+    if (feature_source or settings.FEATURE_SOURCE) not in FEATURE_SOURCES:
+        raise ValueError(f"Fuente de características desconocida: {feature_source or settings.FEATURE_SOURCE}")
+    if uses_local_source(geojson_data, year, feature_source):
+        df = local_feature_source.extract(geojson_data, year)
+        return df[model.feature_names_in_].to_numpy(dtype=np.float32) if df is not None else None
+    return extract_feature_matrix(geojson_data, year, model.feature_names_in_)
+
+def predict_biomass(X):
+    """
+    Predicción de biomasa (Mg/ha) por muestra y desviación estándar entre los
+    árboles del ensamble (None si el modelo no la permite), en una sola pasada.
+    Usa el evaluador compilado si está activo.
+    """
+    if compiled_model is not None:
+        if compiled_model.average:
+            return compiled_model.predict_with_std(X, n_threads=settings.COMPILED_MODEL_THREADS)
+        return compiled_model.predict(X, n_threads=settings.COMPILED_MODEL_THREADS), None
+    return forest_predict_with_std(model, X)
+
+def save_year_stats(aoi, year, X):
+    """
+    Predice la biomasa de las muestras X del año y guarda sus BiomassStats.
+    Devuelve el resultado del año para la respuesta de la tarea.
+    """
+    pred_biomass, pred_std = predict_biomass(pd.DataFrame(X, columns=model.feature_names_in_, copy=False))
+
+    mean_mg = float(pred_biomass.mean())
+    mean_carbon = float(mean_mg * 0.47)
+    # Incertidumbre: dispersión media entre árboles e IC 95% de la media por bootstrap
+    std_mg = float(pred_std.mean()) if pred_std is not None else None
+    ci_low_mg, ci_high_mg = bootstrap_mean_ci(pred_biomass)
+
+    BiomassStats.objects.update_or_create(
+        aoi=aoi,
+        year=year,
+        defaults={
+            'mean_mg': mean_mg,
+            'mean_carbon': mean_carbon,
+            'std_mg': std_mg,
+            'ci_low_mg': ci_low_mg,
+            'ci_high_mg': ci_high_mg,
+        },
+    )
+    return {
+        "year": year,
+        "biomass": round(mean_mg, 2),
+        "carbon": round(mean_carbon, 2),
+        "co2": round(mean_carbon * 3.67, 2),
+        "biomass_ci": [round(ci_low_mg, 2), round(ci_high_mg, 2)]
+    }
+
+# Primer año con composiciones Sentinel-2 + Cloud Score+ usadas por el modelo
+FIRST_YEAR = 2019
+
+def years_to_analyze(aoi, incremental=False):
+    """
+    Años a procesar para el AOI. En modo incremental solo se calculan los años
+    que faltan en BiomassStats más el año en curso (el único que puede cambiar).
+    """
+    current_year = datetime.now().year
+    years = list(range(FIRST_YEAR, current_year + 1))
+    if not incremental:
+        return years
+    existing = set(BiomassStats.objects.filter(aoi=aoi).values_list('year', flat=True))
+    return [year for year in years if year not in existing or year == current_year]
+
+def estimate_analysis_cost(area_m2, n_years):
+    """
+    Costo estimado de un análisis en km²·año: área geodésica del AOI
+    (columna generada AOI.area_m2) por número de años a procesar.
+    """
+    return (area_m2 or 0) / 1e6 * n_years
+
+def analysis_queue(area_m2, n_years):
+    """
+    Cola según el costo estimado: los análisis grandes van a su propia cola para
+    no bloquear a los pequeños que llegan detrás.
+    """
+    if estimate_analysis_cost(area_m2, n_years) >= settings.ANALYSIS_LARGE_COST_THRESHOLD:
+        return settings.ANALYSIS_QUEUE_LARGE
+    return settings.ANALYSIS_QUEUE_SMALL
+
+def fair_share_priority(user_id, aoi_id=None):
+    """
+    Prioridad del mensaje en el broker para repartir las colas entre usuarios.
+    Con Redis 0 es la prioridad más alta: el primer análisis en curso de cada
+    usuario sale con 0 y cada análisis adicional del mismo usuario baja un
+    nivel, así un envío masivo no deja detrás a los demás usuarios. Solo
+    cuentan los demás análisis lanzados por el usuario (user_analyses_in_flight):
+    aoi_id es el AOI que se está encolando, que puede estar ya marcado 'analysing'.
+    """
+    in_flight = user_analyses_in_flight(user_id, exclude_aoi_id=aoi_id)
+    return min(in_flight, settings.ANALYSIS_PRIORITY_LEVELS - 1)
+
+# Duplicaciones de la tolerancia al simplificar (~10 m a ~3°)
+SIMPLIFY_MAX_ITERATIONS = 16
+
+def _simplify_below(geom, max_vertices):
+    """
+    Simplifica conservando la topología, duplicando la tolerancia hasta quedar
+    en max_vertices o menos. None si no se logra en SIMPLIFY_MAX_ITERATIONS.
+    """
+    # Tolerancia inicial en grados (~10 m)
+    tolerance = 0.0001
+    for _ in range(SIMPLIFY_MAX_ITERATIONS):
+        simplified = geom.simplify(tolerance, preserve_topology=True)
+        if simplified.num_points <= max_vertices:
+            return simplified
+        tolerance *= 2
+    return None
+
+def simplify_to_vertex_limit(geom, max_vertices):
+    """
+    Geometría con max_vertices o menos. Conservando la topología cada anillo
+    queda con al menos 4 puntos, así que con muchos huecos no alcanza: en ese
+    caso se descartan los huecos y, como último recurso, se usa la envolvente
+    convexa o el rectángulo envolvente.
+    """
+    simplified = _simplify_below(geom, max_vertices)
+    if simplified is None:
+        shell = Polygon(geom.exterior_ring, srid=geom.srid)
+        simplified = _simplify_below(shell, max_vertices)
+    if simplified is None:
+        simplified = geom.convex_hull
+        if simplified.num_points > max_vertices:
+            simplified = geom.envelope
+    return simplified
+
+def load_aoi_geometry(aoi, max_vertices=None):
+    """
+    Devuelve la geometría del AOI guardada en PostGIS como dict GeoJSON.
+    Si supera max_vertices se simplifica (ver simplify_to_vertex_limit) para
+    no enviar polígonos enormes a Earth Engine.
+    """
+    if max_vertices is None:
+        max_vertices = settings.AOI_MAX_VERTICES
+
+    geom = aoi.geometry
+    if max_vertices and geom.num_points > max_vertices:
+        geom = simplify_to_vertex_limit(geom, max_vertices)
+
+    return json.loads(geom.json)
+
+class YearTimeLimitExceeded(Exception):
+    pass
+
+@contextmanager
+def time_limit(seconds):
     """
-    Tarea en segundo plano para analizar GeoJSON y calcular biomasa
+    Límite de tiempo blando para un bloque (p. ej. un año con un getInfo colgado).
+    Usa SIGALRM, así que solo aplica en el hilo principal (pool prefork/solo);
+    en otros pools el bloque corre sin límite y queda el time_limit de la tarea.
     """
+    if not seconds or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def handler(signum, frame):
+        raise YearTimeLimitExceeded(f"Tiempo límite de {seconds:.0f}s excedido")
+
+    previous = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def analysis_time_budget(task_request):
+    """
+    Presupuesto total (segundos) del análisis según la cola en la que se recibió.
+    """
+    queue = (task_request.delivery_info or {}).get('routing_key')
+    return settings.ANALYSIS_TIME_BUDGETS.get(queue, settings.ANALYSIS_TIME_BUDGETS['default'])
+
+def analysis_is_wanted(task_id):
+    """
+    El análisis sigue siendo necesario si algún AOI no cancelado apunta a esta
+    tarea (el AOI pudo borrarse, cancelarse o relanzarse con otra tarea).
+    """
+    return AOI.objects.filter(task_id=task_id).exclude(status='cancelled').exists()
+
+def release_task_analysis(task_id):
+    """
+    Libera los locks single-flight que siguen a nombre de task_id (uno por huella
+    de los AOIs que apuntan a la tarea).
+    """
+    fingerprints = (AOI.objects.filter(task_id=task_id)
+                    .exclude(fingerprint__isnull=True)
+                    .values_list('fingerprint', flat=True)
+                    .distinct())
+    for fingerprint in fingerprints:
+        release_analysis(fingerprint, task_id)
+
+def finish_follower(leader_id, follower):
+    """
+    Completa un AOI enganchado a la tarea del AOI leader_id copiando sus
+    estadísticas. Si el líder se borró durante el análisis, el seguidor se
+    vuelve a encolar como análisis propio; si el líder terminó sin
+    estadísticas, el seguidor queda con error (nunca 'completed' y vacío).
+    """
+    if not AOI.objects.filter(id=leader_id).exists():
+        enqueue_refresh(follower.id, origin=follower.analysis_origin)
+        return
+    if BiomassStats.objects.filter(aoi_id=leader_id).exists():
+        copy_biomass_stats(AOI(id=leader_id), follower)
+        follower.status = 'completed'
+    else:
+        follower.status = 'error'
+    follower.save()
+
+@shared_task(bind=True, time_limit=max(settings.ANALYSIS_TIME_BUDGETS.values()) + 300)
+def analyze_geojson_task(self, aoi_id, max_vertices=None, incremental=False, feature_source=None):
+    """
+    Tarea en segundo plano para analizar GeoJSON y calcular biomasa.
+    Solo recibe el id del AOI: la geometría se lee de la base de datos para
+    no serializar las coordenadas en el mensaje del broker.
+    Con incremental=True solo se recalculan los años faltantes y el año en curso.
+    feature_source elige de dónde salen las características (ver extract_year_features).
+    Entre años se comprueba si el análisis se canceló y si queda presupuesto de
+    tiempo; cada año tiene además su propio límite. Los años ya calculados se
+    guardan aunque el análisis no termine.
+    """
+    started = time.monotonic()
+    budget = analysis_time_budget(self.request)
+    cancelled = False
     try:
         # Actualizar el estado de la tarea
         self.update_state(
@@ -26,14 +304,24 @@ def analyze_geojson_task(self, geojson_data, user_id, aoi_id):
         
         # Obtener el AOI
         aoi = AOI.objects.get(id=aoi_id)
+        geojson_data = load_aoi_geometry(aoi, max_vertices)
         
-        current_year = datetime.now().year
-        years = list(range(2019, current_year + 1))
+        years = years_to_analyze(aoi, incremental)
         results = []
-        aoi.task_id = self.request.id
-        aoi.save()
         
         for i, year in enumerate(years):
+            # Cancelación cooperativa y presupuesto total
+            if not analysis_is_wanted(self.request.id):
+                cancelled = True
+                break
+            remaining = budget - (time.monotonic() - started)
+            if remaining <= 0:
+                results.extend({
+                    "year": pending_year,
+                    "error": f"Time budget exceeded before processing year {pending_year}"
+                } for pending_year in years[i:])
+                break
+
             try:
                 # Actualizar progreso
                 progress = int((i / len(years)) * 100)
@@ -47,37 +335,15 @@ def analyze_geojson_task(self, geojson_data, user_id, aoi_id):
                 )
                 
                 # Extraer características y predecir
-                df = extract_features_from_geojson(geojson_data, year)
-                if df is None:
+                with time_limit(min(settings.ANALYSIS_YEAR_TIME_LIMIT, remaining)):
+                    X = extract_year_features(geojson_data, year, feature_source)
+                if X is None:
                     continue
-                X = df[model.feature_names_in_]
-                pred_biomass = model.predict(X)
+                results.append(save_year_stats(aoi, year, X))
 
-                mean_mg = float(pred_biomass.mean())
-                mean_carbon = float(mean_mg * 0.47)
-
-                print(f"Mean MG: {mean_mg}, Mean Carbon: {mean_carbon}")
-                
-                #rmse = np.sqrt(mean_squared_error(df['biomass'], pred_biomass))
-                #r2 = r2_score(df['biomass'], pred_biomass)
-
-                #print(f"RMSE: {rmse}, R2: {r2}")
-                # Guardar estadísticas
-                BiomassStats.objects.create(
-                    aoi=aoi,
-                    year=year,
-                    mean_mg=mean_mg,
-                    mean_carbon=mean_carbon,
-                )
-                
-                results.append({
-                    "year": year,
-                    "biomass": round(mean_mg, 2),
-                    "carbon": round(mean_carbon, 2),
-                    "co2": round(mean_carbon * 3.67, 2)
-                    
-                })
-                
+            except EEQuotaError:
+                # Cuota de EE agotada aun con reintentos: se reintenta la tarea completa
+                raise
             except Exception as e:
                 print(e)
                 results.append({
@@ -85,6 +351,15 @@ def analyze_geojson_task(self, geojson_data, user_id, aoi_id):
                     "error": f"Could not process year {year}: {str(e)}"
                 })
         
+        if cancelled:
+            release_analysis(aoi.fingerprint, self.request.id)
+            return {
+                'aoi_id': aoi_id,
+                'name': aoi.name,
+                'cancelled': True,
+                'results': results
+            }
+
         # Actualizar progreso final
         self.update_state(
             state='SUCCESS',
@@ -96,9 +371,15 @@ def analyze_geojson_task(self, geojson_data, user_id, aoi_id):
             }
         )
         
-        # Actualizar status del AOI a 'completed'
-        aoi.status = 'completed'
-        aoi.save()
+        # Actualizar status del AOI a 'completed' (salvo que se haya cancelado o relanzado)
+        AOI.objects.filter(id=aoi_id, task_id=self.request.id).exclude(status='cancelled').update(status='completed')
+
+        # Copiar resultados a los AOIs que se engancharon a esta tarea (single-flight)
+        followers = AOI.objects.filter(task_id=self.request.id, status='analysing').exclude(id=aoi_id)
+        for follower in followers:
+            finish_follower(aoi_id, follower)
+        release_analysis(aoi.fingerprint, self.request.id)
+        schedule_analytics_refresh()
         
         return {
             'aoi_id': aoi_id,
@@ -106,18 +387,301 @@ def analyze_geojson_task(self, geojson_data, user_id, aoi_id):
             'results': results
         }
         
+    except EEQuotaError as e:
+        # Reintentar más tarde en modo incremental: los años ya calculados se conservan
+        if self.request.retries < settings.EE_QUOTA_TASK_RETRIES:
+            raise self.retry(
+                exc=e,
+                kwargs={'max_vertices': max_vertices, 'incremental': True, 'feature_source': feature_source},
+                countdown=settings.EE_QUOTA_RETRY_COUNTDOWN * (self.request.retries + 1),
+            )
+        fail_analysis(self, aoi_id, e)
+        raise
+
     except Exception as e:
-        # En caso de error, actualizar status del AOI a 'error'
-        try:
-            aoi = AOI.objects.get(id=aoi_id)
-            aoi.status = 'error'
-            aoi.save()
-        except:
-            pass
-        
-        # En caso de error
-        self.update_state(
-            state='FAILURE',
-            meta={'error': str(e)}
-        )
+        fail_analysis(self, aoi_id, e)
+        raise
+
+
+@task_revoked.connect
+def release_revoked_analysis(sender=None, request=None, **kwargs):
+    """
+    Una tarea revocada (antes de empezar o terminada a la fuerza) no llega a su
+    propia limpieza: se libera aquí su lock para que la geometría se pueda
+    volver a analizar sin esperar ANALYSIS_LOCK_TTL.
+    """
+    if sender is not None and sender.name == analyze_geojson_task.name and request is not None:
+        release_task_analysis(request.id)
+
+
+def fail_analysis(task, aoi_id, error):
+    """
+    Marca con error los AOIs de la tarea y libera su lock single-flight.
+    """
+    # En caso de error, actualizar status del AOI a 'error'
+    try:
+        aoi = AOI.objects.get(id=aoi_id)
+        AOI.objects.filter(task_id=task.request.id, status='analysing').update(status='error')
+        release_analysis(aoi.fingerprint, task.request.id)
+    except:
+        pass
+
+    # En caso de error
+    task.update_state(
+        state='FAILURE',
+        meta={'error': str(error)}
+    )
+
+
+def period_years_to_analyze(aoi, granularity):
+    """
+    Años de la serie sub-anual que faltan para el AOI, más el año en curso.
+    """
+    current_year = datetime.now().year
+    existing = set(BiomassPeriodStats.objects.filter(aoi=aoi, granularity=granularity)
+                   .values_list('year', flat=True))
+    return [year for year in range(FIRST_YEAR, current_year + 1)
+            if year not in existing or year == current_year]
+
+@shared_task(bind=True, time_limit=max(settings.ANALYSIS_TIME_BUDGETS.values()) + 300)
+def analyze_period_series_task(self, aoi_id, granularity='month', years=None, max_vertices=None):
+    """
+    Serie mensual o trimestral de biomasa del AOI. Cada año se resuelve con una
+    sola petición a Earth Engine (todas las composiciones del año como bandas de
+    una imagen) y una sola predicción para todos sus periodos. Los resultados se
+    guardan en BiomassPeriodStats; no cambia el status del AOI.
+    """
+    try:
+        aoi = AOI.objects.get(id=aoi_id)
+        geojson_data = load_aoi_geometry(aoi, max_vertices)
+        requested_years = years
+        years = years or period_years_to_analyze(aoi, granularity)
+        results = []
+
+        for i, year in enumerate(years):
+            self.update_state(
+                state='PROGRESS',
+                meta={
+                    'current': int((i / len(years)) * 100),
+                    'total': 100,
+                    'status': f'Procesando serie {granularity} de {year}...'
+                }
+            )
+            try:
+                with time_limit(settings.ANALYSIS_YEAR_TIME_LIMIT):
+                    samples = extract_period_features(geojson_data, year, granularity, model.feature_names_in_)
+                samples = {period: X for period, X in samples.items() if X is not None}
+                if not samples:
+                    continue
+
+                # Una sola predicción para todos los periodos del año
+                X = np.concatenate(list(samples.values()))
+                pred_biomass, pred_std = predict_biomass(pd.DataFrame(X, columns=model.feature_names_in_, copy=False))
+
+                start = 0
+                for period, period_X in samples.items():
+                    stop = start + len(period_X)
+                    period_pred = pred_biomass[start:stop]
+                    mean_mg = float(period_pred.mean())
+                    ci_low_mg, ci_high_mg = bootstrap_mean_ci(period_pred)
+                    BiomassPeriodStats.objects.update_or_create(
+                        aoi=aoi,
+                        granularity=granularity,
+                        year=year,
+                        period=period,
+                        defaults={
+                            'mean_mg': mean_mg,
+                            'mean_carbon': mean_mg * 0.47,
+                            'std_mg': float(pred_std[start:stop].mean()) if pred_std is not None else None,
+                            'ci_low_mg': ci_low_mg,
+                            'ci_high_mg': ci_high_mg,
+                            'n_samples': len(period_X),
+                        },
+                    )
+                    results.append({"year": year, "period": period, "biomass": round(mean_mg, 2)})
+                    start = stop
+
+            except EEQuotaError:
+                raise
+            except Exception as e:
+                print(e)
+                results.append({
+                    "year": year,
+                    "error": f"Could not process year {year}: {str(e)}"
+                })
+
+        return {
+            'aoi_id': aoi_id,
+            'granularity': granularity,
+            'results': results
+        }
+
+    except EEQuotaError as e:
+        # Sin años explícitos, los ya guardados no se repiten al reintentar
+        if self.request.retries < settings.EE_QUOTA_TASK_RETRIES:
+            raise self.retry(
+                exc=e,
+                kwargs={'granularity': granularity, 'years': requested_years, 'max_vertices': max_vertices},
+                countdown=settings.EE_QUOTA_RETRY_COUNTDOWN * (self.request.retries + 1),
+            )
         raise
+
+def refresh_priority():
+    """
+    Los refrescos de mantenimiento van con la prioridad más baja: no compiten
+    con los análisis que piden los usuarios.
+    """
+    return settings.ANALYSIS_PRIORITY_LEVELS - 1
+
+def enqueue_refresh(aoi_id, origin='user'):
+    """
+    Marca el AOI como 'analysing' y encola su reanálisis incremental.
+    El task_id se genera antes para que el AOI ya lo tenga cuando arranque la tarea.
+    origin: 'user' (acción refresh) o 'refresh' (refresco masivo).
+    """
+    aoi = AOI.objects.only('id', 'user_id', 'area_m2').get(id=aoi_id)
+    queue = analysis_queue(aoi.area_m2, len(years_to_analyze(aoi, incremental=True)))
+    task_id = str(uuid.uuid4())
+    AOI.objects.filter(id=aoi_id).update(
+        task_id=task_id, status='analysing', analysis_origin=origin, analysis_started_at=timezone.now(),
+    )
+    priority = refresh_priority() if origin == 'refresh' else fair_share_priority(aoi.user_id, aoi_id)
+    analyze_geojson_task.apply_async(
+        args=[aoi_id], kwargs={'incremental': True}, task_id=task_id, queue=queue, priority=priority,
+    )
+    return task_id
+
+def split_refresh_chunk(aoi_ids):
+    """
+    Separa un bloque del refresco masivo en (AOIs que solo necesitan el año en
+    curso, AOIs a los que les faltan años anteriores). Los primeros se refrescan
+    en grupos con una sola petición a Earth Engine por grupo.
+    """
+    current_year = datetime.now().year
+    complete = set(
+        BiomassStats.objects.filter(aoi_id__in=aoi_ids, year__gte=FIRST_YEAR, year__lt=current_year)
+        .values('aoi_id')
+        .annotate(n_years=Count('year'))
+        .filter(n_years=current_year - FIRST_YEAR)
+        .values_list('aoi_id', flat=True)
+    )
+    return [aoi_id for aoi_id in aoi_ids if aoi_id in complete], [aoi_id for aoi_id in aoi_ids if aoi_id not in complete]
+
+def enqueue_batch_refresh(aoi_ids):
+    """
+    Marca los AOIs como 'analysing' con una tarea compartida y encola el
+    refresco del año en curso de todo el grupo.
+    """
+    area_m2 = sum(area or 0 for area in AOI.objects.filter(id__in=aoi_ids).values_list('area_m2', flat=True))
+    task_id = str(uuid.uuid4())
+    AOI.objects.filter(id__in=aoi_ids).update(
+        task_id=task_id, status='analysing', analysis_origin='refresh', analysis_started_at=timezone.now(),
+    )
+    refresh_current_year_batch_task.apply_async(
+        args=[aoi_ids], task_id=task_id, queue=analysis_queue(area_m2, 1), priority=refresh_priority(),
+    )
+    return task_id
+
+@shared_task(bind=True, time_limit=settings.ANALYSIS_YEAR_TIME_LIMIT + 300)
+def refresh_current_year_batch_task(self, aoi_ids):
+    """
+    Refresco del año en curso de varios AOIs (refresco masivo). Los AOIs que
+    salen de Earth Engine se muestrean en una sola petición y se decodifican en
+    forma columnar a float32; los cubiertos por mosaicos locales se leen del disco.
+    """
+    year = datetime.now().year
+    try:
+        aois = list(AOI.objects.filter(id__in=aoi_ids, task_id=self.request.id).exclude(status='cancelled'))
+        geojsons = {aoi.id: load_aoi_geometry(aoi) for aoi in aois}
+        remote = {aoi_id: geojson for aoi_id, geojson in geojsons.items() if not uses_local_source(geojson, year)}
+
+        with time_limit(settings.ANALYSIS_YEAR_TIME_LIMIT):
+            matrices = extract_feature_matrices_batch(remote, year, model.feature_names_in_) if remote else {}
+            for aoi_id, geojson in geojsons.items():
+                if aoi_id not in remote:
+                    matrices[aoi_id] = extract_year_features(geojson, year)
+
+        results = []
+        for aoi in aois:
+            X = matrices.get(aoi.id)
+            if X is not None:
+                results.append({'aoi_id': aoi.id, **save_year_stats(aoi, year, X)})
+
+        AOI.objects.filter(task_id=self.request.id, status='analysing').update(status='completed')
+        schedule_analytics_refresh()
+        return {'year': year, 'results': results}
+
+    except EEQuotaError as e:
+        if self.request.retries < settings.EE_QUOTA_TASK_RETRIES:
+            raise self.retry(exc=e, countdown=settings.EE_QUOTA_RETRY_COUNTDOWN * (self.request.retries + 1))
+        AOI.objects.filter(task_id=self.request.id, status='analysing').update(status='error')
+        raise
+
+    except Exception:
+        AOI.objects.filter(task_id=self.request.id, status='analysing').update(status='error')
+        raise
+
+@shared_task(bind=True, acks_late=True)
+def batch_refresh_aois(self, run_key=None):
+    """
+    Actualización masiva (Celery beat) del año en curso de todos los AOIs.
+    Procesa un bloque por ejecución recorriendo AOI por id (keyset), primero los
+    favoritos, y se vuelve a encolar para el siguiente bloque. Los AOIs que
+    solo necesitan el año en curso se refrescan en grupos (una petición a Earth
+    Engine por grupo); el resto, uno por uno. Los encolados se limitan con un
+    token bucket ajustado a la cuota de Earth Engine y el avance se guarda en
+    un checkpoint para retomar sin repetir AOIs tras un reinicio.
+    """
+    run_key = run_key or date.today().isoformat()
+    checkpoint = RefreshCheckpoint(run_key)
+    phase, last_id = checkpoint.load()
+    if phase == 'done':
+        return {'run_key': run_key, 'status': 'done'}
+
+    bucket = TokenBucket('ee-refresh', settings.BATCH_REFRESH_RATE, settings.BATCH_REFRESH_BURST)
+    chunk_size = settings.BATCH_REFRESH_CHUNK_SIZE
+    aoi_ids = list(
+        AOI.objects.filter(favorite=(phase == 'favorites'), id__gt=last_id, geometry__isnull=False)
+        .exclude(status='analysing')
+        .order_by('id')
+        .values_list('id', flat=True)[:chunk_size]
+    )
+
+    # Un token por petición a Earth Engine: un grupo de AOIs completos cuenta como una
+    batched, single = split_refresh_chunk(aoi_ids)
+    group_size = settings.BATCH_REFRESH_EE_BATCH_SIZE
+    for start in range(0, len(batched), group_size):
+        bucket.acquire()
+        enqueue_batch_refresh(batched[start:start + group_size])
+    for aoi_id in single:
+        bucket.acquire()
+        enqueue_refresh(aoi_id, origin='refresh')
+    # Los AOIs encolados quedan 'analysing' y la consulta los excluye: si el
+    # worker se reinicia antes del checkpoint no se vuelven a encolar
+    if aoi_ids:
+        checkpoint.save(phase, aoi_ids[-1])
+
+    if len(aoi_ids) < chunk_size and not checkpoint.advance(phase):
+        return {'run_key': run_key, 'status': 'done'}
+
+    batch_refresh_aois.apply_async(args=[run_key])
+    return {'run_key': run_key, 'phase': phase, 'enqueued': len(aoi_ids)}
+
+def schedule_analytics_refresh():
+    """
+    Programa un refresco de la vista materializada de analítica. Los análisis
+    que terminan dentro de la misma ventana comparten un único refresco.
+    """
+    if not settings.ANALYTICS_USE_MATERIALIZED_VIEW:
+        return
+    delay = settings.ANALYTICS_REFRESH_DELAY
+    try:
+        if not get_redis().set('biomass:analytics-refresh', 1, nx=True, ex=delay):
+            return
+    except redis.RedisError:
+        pass
+    refresh_analytics_view.apply_async(countdown=delay)
+
+@shared_task
+def refresh_analytics_view():
+    refresh_materialized_view()
@@ -0,0 +1,59 @@
+"""
+Límites por usuario para los endpoints que encolan análisis.
+
+Un usuario que sube AOIs en bucle llena la cola de Celery y deja esperando a los
+demás. Se limitan las solicitudes por minuto (token bucket en Redis compartido
+por todas las réplicas) y los análisis en curso lanzados por el usuario (sin
+contar los refrescos de mantenimiento ni los que quedaron colgados).
+DRF responde 429 con Retry-After cuando alguno no deja pasar la solicitud.
+"""
+import logging
+
+import redis
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .coordination import TokenBucket, user_analyses_in_flight
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisRateThrottle(BaseThrottle):
+    """
+    Hasta ANALYSIS_RATE_PER_MINUTE análisis por minuto por usuario, con ráfagas
+    del mismo tamaño. Si Redis no responde no se limita.
+    """
+
+    def allow_request(self, request, view):
+        self._wait = None
+        if request.method != 'POST':
+            return True
+        rate = settings.ANALYSIS_RATE_PER_MINUTE
+        bucket = TokenBucket(f"analysis:user:{request.user.id}", rate / 60, capacity=rate)
+        try:
+            wait = bucket.try_acquire()
+        except redis.RedisError as e:
+            logger.warning("No se pudo aplicar el límite de análisis por minuto: %s", e)
+            return True
+        if wait <= 0:
+            return True
+        self._wait = wait
+        return False
+
+    def wait(self):
+        return self._wait
+
+
+class ConcurrentAnalysisThrottle(BaseThrottle):
+    """
+    Hasta ANALYSIS_MAX_IN_FLIGHT análisis en curso por usuario.
+    """
+
+    def allow_request(self, request, view):
+        if request.method != 'POST':
+            return True
+        return user_analyses_in_flight(request.user.id) < settings.ANALYSIS_MAX_IN_FLIGHT
+
+    def wait(self):
+        # No se sabe cuándo termina el próximo análisis: se sugiere volver a intentar
+        return settings.ANALYSIS_IN_FLIGHT_RETRY_AFTER
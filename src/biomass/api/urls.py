@@ -1,5 +1,6 @@
 from django.urls import path, include
 from .views import *
+from .async_views import get_data_stats_async, task_status_async, aoi_list_async
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.routers import DefaultRouter
 
@@ -11,6 +12,14 @@ urlpatterns = [
     path('analyze-geojson/', AnalyzeGeoJSONView.as_view(), name='analyze-geojson'),
     path('task-status/<str:task_id>/', TaskStatusView.as_view(), name='task-status'),
     path('data-stats/', get_data_stats, name='data-stats'),
+    path('export-stats/', ExportStatsView.as_view(), name='export-stats'),
+    path('analytics/', get_analytics, name='analytics'),
+    path('queue-stats/', get_queue_stats, name='queue-stats'),
+
+    # Versiones asíncronas (ASGI) de los endpoints de lectura
+    path('async/data-stats/', get_data_stats_async, name='data-stats-async'),
+    path('async/task-status/<str:task_id>/', task_status_async, name='task-status-async'),
+    path('async/aois/', aoi_list_async, name='aois-async'),
 
     #path('biomass-stats/', BiomassStatsListView.as_view(), name='biomass-stats-list'),
 ]
@@ -2,11 +2,11 @@ from django.shortcuts import redirect
 from django.contrib.auth.models import User
 from rest_framework import generics, status
 from .serializers import (
-    UserSerializer, AnalyzeGeoJSONSerializer, AOISerializer, BiomassStatsSerializer, 
+    UserSerializer, AnalyzeGeoJSONSerializer, AOISerializer, AOISummarySerializer, BiomassStatsSerializer, 
     ChangePasswordSerializer, UserDetailSerializer, PasswordResetRequestSerializer, 
     PasswordResetConfirmSerializer
 )        
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from allauth.socialaccount.models import SocialAccount, SocialToken
 from allauth.account.views import PasswordChangeView
 from django.contrib.auth.decorators import login_required
@@ -18,21 +18,37 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.db import transaction
 from rest_framework.decorators import api_view, action, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from core.ml_models.gee_predictor import extract_features_from_geojson
+from rest_framework.settings import api_settings
+from core.ml_models.gee_predictor import extract_features_from_geojson, PERIOD_GRANULARITIES
 from datetime import datetime
-from biomass.models import AOI, BiomassStats
+from biomass.models import AOI, BiomassStats, BiomassPeriodStats
 from joblib import load
 from django.utils.timezone import now
 import json
-from .tasks import analyze_geojson_task
+from .tasks import (
+    analyze_geojson_task, analyze_period_series_task, enqueue_refresh, analysis_queue, fair_share_priority,
+    finish_follower, years_to_analyze, period_years_to_analyze
+)
+from .analytics import carbon_totals_by_year, yoy_change_distribution
+from .export import export_queryset, export_rows, iter_csv, iter_parquet
+from .geometry_formats import requested_geometry_format, encode_geometry
+from .renderers import CSVRenderer, ParquetRenderer
+from .throttles import AnalysisRateThrottle, ConcurrentAnalysisThrottle
+from .coordination import (
+    geometry_fingerprint, acquire_analysis, release_analysis, find_completed_analysis, copy_biomass_stats,
+    queue_depths
+)
 from celery.result import AsyncResult
-from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.geos import GEOSGeometry, GEOSException, Polygon
+from django.contrib.gis.gdal import GDALException
+from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
 from sklearn.linear_model import LinearRegression
@@ -304,6 +320,10 @@ model = load("core/ml_models/model.joblib")
 class AnalyzeGeoJSONView(APIView):
     #añadir campos para la api "geojson", el user_id se obtiene del token
     serializer_class = AnalyzeGeoJSONSerializer
+    # Límite de análisis en curso y de solicitudes por minuto por usuario (429 + Retry-After).
+    # DRF se detiene en el primero que rechaza: el de análisis en curso va antes para
+    # no gastar un token del límite por minuto en solicitudes que se rechazan igual
+    throttle_classes = [ConcurrentAnalysisThrottle, AnalysisRateThrottle]
 
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -356,6 +376,7 @@ class AnalyzeGeoJSONView(APIView):
                     return Response({"error": "El GeoJSON debe contener un único polígono."}, status=400)
 
             geom = GEOSGeometry(json.dumps(geometry_dict), srid=4326)
+            fingerprint = geometry_fingerprint(geom)
 
             # Crear AOI en base de datos
             aoi = AOI.objects.create(
@@ -363,26 +384,122 @@ class AnalyzeGeoJSONView(APIView):
                 name=f"AOI_{now().date()}",
                 geometry=geom,
                 task_id=None,
-                status='analysing'
+                status='analysing',
+                fingerprint=fingerprint,
+                analysis_origin='user',
+                analysis_started_at=now(),
             )
 
-            # Iniciar tarea en segundo plano
-            task = analyze_geojson_task.delay(geometry_dict, user_id, aoi.id)
-            
-            # Actualizar el task_id del AOI
-            aoi.task_id = task.id
+            # Si la misma geometría ya fue analizada, copiar sus estadísticas
+            source = find_completed_analysis(fingerprint, exclude_id=aoi.id)
+            if source:
+                copy_biomass_stats(source, aoi)
+                aoi.status = 'completed'
+                aoi.save()
+                return Response({
+                    "message": "Análisis reutilizado de un AOI con la misma geometría",
+                    "task_id": None,
+                    "aoi_id": aoi.id,
+                    "name": aoi.name,
+                    "status": "COMPLETED"
+                }, status=200)
+
+            # Single-flight: si ya hay una tarea analizando esta geometría, engancharse a ella
+            task_id = str(uuid.uuid4())
+            leader_task_id = acquire_analysis(fingerprint, task_id)
+            if leader_task_id:
+                task_id = leader_task_id
+
+            # Guardar el task_id antes de encolar: la tarea comprueba al empezar
+            # que algún AOI la sigue esperando (analysis_is_wanted)
+            aoi.task_id = task_id
             aoi.save()
 
+            if not leader_task_id:
+                # Iniciar tarea en segundo plano
+                # Cola según el costo estimado (área x años)
+                queue = analysis_queue(aoi.area_m2, len(years_to_analyze(aoi)))
+                task_kwargs = {'feature_source': serializer.validated_data.get('feature_source')}
+                priority = fair_share_priority(user_id, aoi.id)
+                # Si la vista corre dentro de una transacción, encolar al confirmarla
+                transaction.on_commit(lambda: analyze_geojson_task.apply_async(
+                    args=[aoi.id],
+                    kwargs=task_kwargs,
+                    task_id=task_id,
+                    queue=queue,
+                    priority=priority,
+                ))
+            else:
+                # La tarea pudo terminar antes de guardar el task_id: copiar del AOI líder
+                leader = AOI.objects.filter(task_id=task_id, status='completed').exclude(id=aoi.id).first()
+                if leader:
+                    finish_follower(leader.id, aoi)
+
             return Response({
                 "message": "Análisis iniciado en segundo plano",
-                "task_id": task.id,
+                "task_id": task_id,
                 "aoi_id": aoi.id,
                 "name": aoi.name,
-                "status": "PROCESSING"
+                "status": "PROCESSING",
+                "deduplicated": bool(leader_task_id)
             }, status=202)  # 202 Accepted
 
         except Exception as e:
             return Response({"error": f"Invalid geometry: {str(e)}"}, status=400)
+# Status del AOI según el estado de su tarea en Celery
+AOI_STATUS_BY_TASK_STATE = {
+    'SUCCESS': 'completed',
+    'FAILURE': 'error',
+    'REVOKED': 'error',
+    'PENDING': 'analysing',
+    'PROGRESS': 'analysing',
+}
+
+def update_aois_task_status(task_id, state):
+    """
+    Sincroniza el status de los AOIs asociados a la tarea con su estado en Celery
+    (varios AOIs pueden compartir la tarea si se deduplicó el análisis)
+    """
+    if state in AOI_STATUS_BY_TASK_STATE:
+        (AOI.objects.filter(task_id=task_id)
+            .exclude(status='cancelled')
+            .update(status=AOI_STATUS_BY_TASK_STATE[state]))
+
+def build_task_status(task_result):
+    """
+    Respuesta de estado de una tarea a partir de su AsyncResult
+    """
+    if task_result.state == 'PENDING':
+        response = {
+            'state': task_result.state,
+            'current': 0,
+            'total': 100,
+            'status': 'Tarea pendiente...'
+        }
+    elif task_result.state == 'PROGRESS':
+        response = {
+            'state': task_result.state,
+            'current': task_result.info.get('current', 0),
+            'total': task_result.info.get('total', 100),
+            'status': task_result.info.get('status', '')
+        }
+    elif task_result.state == 'SUCCESS':
+        response = {
+            'state': task_result.state,
+            'current': 100,
+            'total': 100,
+            'status': 'Completado',
+            'result': task_result.result
+        }
+    else:
+        response = {
+            'state': task_result.state,
+            'current': 0,
+            'total': 100,
+            'status': str(task_result.info),
+        }
+    return response
+
 class TaskStatusView(APIView):
     def get(self, request, task_id):
         """
@@ -390,54 +507,19 @@ class TaskStatusView(APIView):
         """
         task_result = AsyncResult(task_id)
         
-        # Buscar el AOI asociado a esta tarea y actualizar su status
+        # Buscar los AOIs asociados a esta tarea y actualizar su status
         try:
-            aoi = AOI.objects.filter(task_id=task_id).first()
-            if aoi:
-                if task_result.state == 'SUCCESS':
-                    aoi.status = 'completed'
-                    aoi.save()
-                elif task_result.state in ['FAILURE', 'REVOKED']:
-                    aoi.status = 'error'
-                    aoi.save()
-                elif task_result.state in ['PENDING', 'PROGRESS']:
-                    aoi.status = 'analysing'
-                    aoi.save()
+            update_aois_task_status(task_id, task_result.state)
         except Exception as e:
             print(f"Error al actualizar status del AOI: {str(e)}")
         
-        if task_result.state == 'PENDING':
-            response = {
-                'state': task_result.state,
-                'current': 0,
-                'total': 100,
-                'status': 'Tarea pendiente...'
-            }
-        elif task_result.state == 'PROGRESS':
-            response = {
-                'state': task_result.state,
-                'current': task_result.info.get('current', 0),
-                'total': task_result.info.get('total', 100),
-                'status': task_result.info.get('status', '')
-            }
-        elif task_result.state == 'SUCCESS':
-            response = {
-                'state': task_result.state,
-                'current': 100,
-                'total': 100,
-                'status': 'Completado',
-                'result': task_result.result
-            }
-        else:
-            response = {
-                'state': task_result.state,
-                'current': 0,
-                'total': 100,
-                'status': str(task_result.info),
-            }
-        
-        return Response(response)
+        return Response(build_task_status(task_result))
     
+class AOISpatialPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
 class AOIListView(viewsets.ModelViewSet):
     serializer_class = AOISerializer
     queryset = AOI.objects.all()
@@ -447,6 +529,37 @@ class AOIListView(viewsets.ModelViewSet):
     def get_queryset(self):
         return super().get_queryset().filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Búsqueda espacial opcional (usa el índice GiST de geometry):
+        ?bbox=minx,miny,maxx,maxy  -> AOIs cuyo bounding box se solapa (&&)
+        ?intersects=<GeoJSON o WKT> -> AOIs que intersectan la geometría
+        Con estos parámetros la respuesta es paginada y ligera (sin la geometría completa).
+        """
+        bbox = request.query_params.get('bbox')
+        intersects = request.query_params.get('intersects')
+        if not bbox and not intersects:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            if bbox:
+                minx, miny, maxx, maxy = [float(value) for value in bbox.split(',')]
+                bbox_geom = Polygon.from_bbox((minx, miny, maxx, maxy))
+                bbox_geom.srid = 4326
+                queryset = queryset.filter(geometry__bboverlaps=bbox_geom)
+            if intersects:
+                queryset = queryset.filter(geometry__intersects=GEOSGeometry(intersects, srid=4326))
+        except (ValueError, GEOSException, GDALException):
+            return Response({"error": "bbox debe ser minx,miny,maxx,maxy e intersects un GeoJSON o WKT válido"}, status=400)
+
+        queryset = (queryset
+                    .defer('geometry', 'centroid', 'file_path')
+                    .order_by('id'))
+        paginator = AOISpatialPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(AOISummarySerializer(page, many=True).data)
+
     @action(detail=True, methods=["post"], url_path="share", permission_classes=[IsAuthenticated])
     def generate_share_link(self, request, pk=None):
         aoi = self.get_object()
@@ -462,6 +575,110 @@ class AOIListView(viewsets.ModelViewSet):
         aoi.save(update_fields=["share_token"])
         return Response({"share_token": None}, status=200)
 
+    @action(detail=True, methods=["post"], url_path="cancel", permission_classes=[IsAuthenticated])
+    def cancel(self, request, pk=None):
+        """
+        Cancela el análisis en curso del AOI. La tarea se revoca (si aún no empezó)
+        y, si ya corre, se detiene antes del siguiente año conservando los años
+        calculados. Si otros AOIs comparten la tarea (análisis deduplicado), solo
+        se desengancha este AOI.
+        """
+        aoi = self.get_object()
+        if aoi.status != 'analysing' or not aoi.task_id:
+            return Response({"error": "El AOI no tiene un análisis en curso."}, status=409)
+
+        task_id = aoi.task_id
+        shared = AOI.objects.filter(task_id=task_id).exclude(id=aoi.id).exclude(status='cancelled').exists()
+        aoi.status = 'cancelled'
+        if shared:
+            aoi.task_id = None
+        aoi.save(update_fields=["status", "task_id"])
+        if not shared:
+            analyze_geojson_task.app.control.revoke(task_id)
+            # Sin otros AOIs esperando la tarea, la geometría se puede volver a analizar
+            release_analysis(aoi.fingerprint, task_id)
+
+        return Response({"aoi_id": aoi.id, "task_id": task_id, "status": "CANCELLED"}, status=200)
+
+    @action(detail=True, methods=["post"], url_path="refresh", permission_classes=[IsAuthenticated],
+            throttle_classes=[ConcurrentAnalysisThrottle, AnalysisRateThrottle])
+    def refresh(self, request, pk=None):
+        """
+        Reanálisis incremental: solo calcula los años que faltan y el año en curso
+        """
+        aoi = self.get_object()
+        if aoi.status == 'analysing':
+            return Response({"error": "El AOI ya se está analizando."}, status=409)
+
+        task_id = enqueue_refresh(aoi.id)
+        return Response({
+            "message": "Actualización iniciada en segundo plano",
+            "task_id": task_id,
+            "aoi_id": aoi.id,
+            "status": "PROCESSING"
+        }, status=202)
+
+    @action(detail=True, methods=["post"], url_path="period-series", permission_classes=[IsAuthenticated])
+    def period_series(self, request, pk=None):
+        """
+        Serie sub-anual de biomasa: {"granularity": "month"|"season", "years": [opcional]}.
+        Sin years se calculan los años que faltan y el año en curso.
+        """
+        aoi = self.get_object()
+        granularity = request.data.get('granularity', 'month')
+        if granularity not in PERIOD_GRANULARITIES:
+            return Response({"error": "granularity debe ser 'month' o 'season'"}, status=400)
+        years = request.data.get('years')
+        if years is not None and (not isinstance(years, list) or not all(isinstance(year, int) for year in years)):
+            return Response({"error": "years debe ser una lista de años"}, status=400)
+
+        n_years = len(years) if years else len(period_years_to_analyze(aoi, granularity))
+        # Cada año son PERIOD_GRANULARITIES[granularity] composiciones en Earth Engine
+        queue = analysis_queue(aoi.area_m2, n_years * PERIOD_GRANULARITIES[granularity])
+        task = analyze_period_series_task.apply_async(
+            args=[aoi.id], kwargs={'granularity': granularity, 'years': years}, queue=queue,
+            priority=fair_share_priority(request.user.id, aoi.id),
+        )
+        return Response({
+            "message": "Serie temporal iniciada en segundo plano",
+            "task_id": task.id,
+            "aoi_id": aoi.id,
+            "granularity": granularity,
+            "status": "PROCESSING"
+        }, status=202)
+
+class ExportStatsView(APIView):
+    """
+    Exporta las estadísticas de todos los AOIs del usuario (o de ?aoi_ids=1,2,3)
+    en streaming como CSV o Parquet (?export_format=csv|parquet o
+    Accept: text/csv | application/vnd.apache.parquet; por defecto CSV)
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer, ParquetRenderer]
+
+    def get(self, request):
+        accepted_format = request.accepted_renderer.format
+        export_format = request.query_params.get(
+            'export_format', accepted_format if accepted_format in ('csv', 'parquet') else 'csv'
+        )
+        aoi_ids = request.query_params.get('aoi_ids')
+        try:
+            aoi_ids = [int(aoi_id) for aoi_id in aoi_ids.split(',')] if aoi_ids else None
+        except ValueError:
+            return Response({"error": "aoi_ids debe ser una lista de enteros separada por comas"}, status=400)
+
+        rows = export_rows(export_queryset(user_id=request.user.id, aoi_ids=aoi_ids))
+        filename = f"biomass_stats_{now().date()}"
+
+        if export_format == 'csv':
+            response = StreamingHttpResponse(iter_csv(rows), content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        elif export_format == 'parquet':
+            response = StreamingHttpResponse(iter_parquet(rows), content_type='application/vnd.apache.parquet')
+            response['Content-Disposition'] = f'attachment; filename="{filename}.parquet"'
+        else:
+            return Response({"error": "export_format debe ser 'csv' o 'parquet'"}, status=400)
+        return response
+
 class BiomassStatsListView(viewsets.ModelViewSet):  
     serializer_class = BiomassStatsSerializer
     queryset = BiomassStats.objects.all()
@@ -486,44 +703,33 @@ class ChangePasswordViewSet(viewsets.ViewSet):
 
     
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def get_data_stats(request):
-    aoi_id = request.query_params.get('aoi_id')
-    share_token = request.query_params.get('share_token')
+# Zoom del mapa según el área del AOI: (área máxima en km², zoom)
+ZOOM_BY_AREA_KM2 = [(1, 15), (10, 14), (100, 12), (1000, 11), (10000, 9)]
 
-    if not aoi_id:
-        return Response({"error": "aoi_id is required"}, status=400)
-    
-    try:
-        aoi = AOI.objects.get(id=aoi_id)
-    except AOI.DoesNotExist:
-        return Response({"error": "AOI no encontrado"}, status=404)
+def map_zoom(area_m2):
+    """
+    Zoom inicial del mapa para que el AOI entre en pantalla: más área, menos zoom.
+    """
+    area_km2 = (area_m2 or 0) / 1e6
+    for max_area, zoom in ZOOM_BY_AREA_KM2:
+        if area_km2 < max_area:
+            return zoom
+    return 8
 
-    if share_token:
-        if aoi.share_token != share_token:
-            return Response({"error": "Token de acceso inválido"}, status=403)
-    else:
-        if not request.user.is_authenticated or aoi.user_id != request.user.id:
-            return Response({"error": "No tienes permiso para acceder a este AOI."}, status=403)
-    #obtener el centro con coordenadas
-    centroid = aoi.geometry.centroid
-    centroid_coords = (centroid.x, centroid.y)
-
-    #calcular el zoom para el mapa según el area del aoi
-    area = aoi.geometry.area
-    if area < 1000000:
-        zoom = 11
-    elif area < 10000000:
-        zoom = 12
-    else:
-        zoom = 13
+def build_data_stats(aoi, biomass_stats, geometry_format=None, precision=None):
+    """
+    Arma el diccionario de estadísticas del dashboard para un AOI a partir de
+    sus BiomassStats (compartido por la vista síncrona y la asíncrona).
+    La geometría va en GeoJSON salvo que se pida otro formato (geometry_formats).
+    """
+    # Centroide y área vienen de las columnas generadas del AOI (sin GEOS por petición)
+    centroid_coords = (aoi.centroid.x, aoi.centroid.y) if aoi.centroid else None
+    zoom = map_zoom(aoi.area_m2)
 
     print("Centroide:", centroid_coords)
     
     
     
-    biomass_stats = BiomassStats.objects.filter(aoi_id=aoi_id)
     mean_mg = 0
     mean_carbon = 0
     mean_co2 = 0
@@ -535,7 +741,18 @@ def get_data_stats(request):
     dict_pred_carbon_stats = {}
     dict_pred_co2_stats = {}
 
+    # Incertidumbre por año (solo años calculados, no interpolados)
+    dict_uncertainty_stats = {}
+
     for stat in biomass_stats:
+        if stat.ci_low_mg is not None:
+            dict_uncertainty_stats[stat.year] = {
+                "std_mg": stat.std_mg,
+                "ci_low_mg": stat.ci_low_mg,
+                "ci_high_mg": stat.ci_high_mg,
+                "ci_low_carbon": stat.ci_low_mg * 0.47,
+                "ci_high_carbon": stat.ci_high_mg * 0.47,
+            }
         dict_biomass_stats[stat.year] = stat.mean_mg
         dict_carbon_stats[stat.year] = stat.mean_carbon
         dict_co2_stats[stat.year] = stat.mean_carbon * 3.67
@@ -590,21 +807,94 @@ def get_data_stats(request):
 
     
 
-    return Response({
+    return {
         "biomass_stats": dict_biomass_stats,
         "carbon_stats": dict_carbon_stats,
         "co2_stats": dict_co2_stats,
         "pred_biomass_stats": dict_pred_biomass_stats,
         "pred_carbon_stats": dict_pred_carbon_stats,
         "pred_co2_stats": dict_pred_co2_stats,
+        "uncertainty_stats": dict(sorted(dict_uncertainty_stats.items())),
         "centroid_coords": centroid_coords,
-        "aoi_geometry": aoi.geometry.json, #corregir para que sea un json valido
+        "aoi_geometry": encode_geometry(aoi.geometry, geometry_format or 'geojson', precision), #corregir para que sea un json valido
         "zoom": zoom,
         "mean_mg": mean_mg,
         "mean_carbon": mean_carbon,
         "mean_co2": mean_co2,
         "share_token": aoi.share_token,
         "aoi_name": aoi.name,
+    }
+
+def build_period_stats(period_stats):
+    """
+    Serie sub-anual ordenada por año y periodo (BiomassPeriodStats).
+    """
+    return [
+        {
+            "year": stat.year,
+            "period": stat.period,
+            "biomass": stat.mean_mg,
+            "carbon": stat.mean_carbon,
+            "co2": stat.mean_carbon * 3.67,
+            "ci_low_mg": stat.ci_low_mg,
+            "ci_high_mg": stat.ci_high_mg,
+            "n_samples": stat.n_samples,
+        }
+        for stat in sorted(period_stats, key=lambda stat: (stat.year, stat.period))
+    ]
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_data_stats(request):
+    aoi_id = request.query_params.get('aoi_id')
+    share_token = request.query_params.get('share_token')
+
+    if not aoi_id:
+        return Response({"error": "aoi_id is required"}, status=400)
+    
+    try:
+        aoi = AOI.objects.get(id=aoi_id)
+    except AOI.DoesNotExist:
+        return Response({"error": "AOI no encontrado"}, status=404)
+
+    if share_token:
+        if aoi.share_token != share_token:
+            return Response({"error": "Token de acceso inválido"}, status=403)
+    else:
+        if not request.user.is_authenticated or aoi.user_id != request.user.id:
+            return Response({"error": "No tienes permiso para acceder a este AOI."}, status=403)
+    # ?granularity=month|season agrega la serie sub-anual
+    granularity = request.query_params.get('granularity')
+    if granularity and granularity not in PERIOD_GRANULARITIES:
+        return Response({"error": "granularity debe ser 'month' o 'season'"}, status=400)
+
+    geometry_format, precision = requested_geometry_format(request)
+    biomass_stats = BiomassStats.objects.filter(aoi_id=aoi_id)
+    data = build_data_stats(aoi, biomass_stats, geometry_format, precision)
+    if granularity:
+        data["granularity"] = granularity
+        data["period_stats"] = build_period_stats(
+            BiomassPeriodStats.objects.filter(aoi_id=aoi_id, granularity=granularity)
+        )
+    return Response(data)
+
+
+@api_view(['GET'])
+def get_analytics(request):
+    """
+    Analítica del portafolio del usuario: carbono total por año (ponderado por
+    área geodésica) y distribución de la variación interanual por AOI
+    """
+    return Response({
+        "totals_by_year": carbon_totals_by_year(request.user.id),
+        "yoy_change": yoy_change_distribution(request.user.id),
     })
 
-    
\ No newline at end of file
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_queue_stats(request):
+    """
+    Mensajes pendientes por cola de Celery (para monitoreo)
+    """
+    return Response(queue_depths())
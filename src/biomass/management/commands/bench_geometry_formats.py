@@ -0,0 +1,57 @@
+import gzip
+import time
+
+import numpy as np
+from django.contrib.gis.geos import Polygon
+from django.core.management.base import BaseCommand
+
+from biomass.api.geometry_formats import GEOMETRY_FORMATS, encode_geometry, to_delta, decode_delta
+from biomass.api.renderers import dumps
+
+
+def synthetic_polygon(n_vertices, rng):
+    """
+    Polígono de n_vertices con borde irregular (~20 km de radio) cerca de Bogotá.
+    """
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    radius = 0.2 * (1 + 0.1 * rng.standard_normal(n_vertices).cumsum() / np.sqrt(n_vertices))
+    coords = np.column_stack([-74.1 + radius * np.cos(angles), 4.6 + radius * np.sin(angles)])
+    coords = np.vstack([coords, coords[:1]])
+    return Polygon(coords.tolist(), srid=4326)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide tamaño (JSON y gzip) y tiempo de codificación de cada formato de "
+        "geometría (geometry_formats) en polígonos grandes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vertices', nargs='+', type=int, default=[1_000, 10_000, 100_000])
+        parser.add_argument('--precision', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        precision = options['precision']
+
+        for n_vertices in options['vertices']:
+            polygon = synthetic_polygon(n_vertices, rng)
+            self.stdout.write(f"{n_vertices:,} vértices (precisión {precision}):")
+            for geometry_format in GEOMETRY_FORMATS:
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    encoded = encode_geometry(polygon, geometry_format, precision)
+                elapsed = (time.perf_counter() - start) / options['repeat']
+                body = dumps({"aoi_geometry": encoded})
+                self.stdout.write(
+                    f"  {geometry_format:<10} {elapsed * 1e3:9.2f} ms | {len(body):>11,} bytes "
+                    f"| gzip {len(gzip.compress(body)):>10,} bytes"
+                )
+
+            # La cuantización no debe mover ningún vértice más de media unidad
+            decoded = decode_delta(to_delta(polygon, precision))[0][0]
+            error = float(np.abs(decoded - np.asarray(polygon[0].array)).max())
+            style = self.style.SUCCESS if error <= 0.5 * 10.0 ** -precision + 1e-12 else self.style.ERROR
+            self.stdout.write(style(f"  error máximo de cuantización: {error:.2e}"))
@@ -0,0 +1,95 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from biomass.api.renderers import ORJSONRenderer, dumps
+
+
+def data_stats_payload(rng, n_years):
+    """
+    Mismo formato que build_data_stats: claves int (años) y valores numpy.float64.
+    """
+    years = range(2019, 2019 + n_years)
+    biomass = {year: np.float64(value) for year, value in zip(years, rng.uniform(50, 300, n_years))}
+    return {
+        "centroid": (-74.1, 4.6),
+        "zoom": 11,
+        "biomass_stats": biomass,
+        "carbon_stats": {year: value * 0.47 for year, value in biomass.items()},
+        "co2_stats": {year: value * 0.47 * 3.67 for year, value in biomass.items()},
+        "mean_biomass": np.float64(np.mean(list(biomass.values()))),
+    }
+
+
+def task_status_payload(rng, n_years):
+    return {
+        "state": "SUCCESS",
+        "result": {
+            "aoi_id": 1,
+            "results": [
+                {"year": 2019 + i, "biomass": float(value), "carbon": float(value) * 0.47,
+                 "co2": float(value) * 0.47 * 3.67, "biomass_ci": [float(value) - 2, float(value) + 2]}
+                for i, value in enumerate(rng.uniform(50, 300, n_years))
+            ],
+        },
+    }
+
+
+def aoi_list_payload(rng, n_aois, n_vertices=200):
+    return [
+        {
+            "id": i, "name": f"AOI {i}", "status": "completed", "favorite": False,
+            "uploaded_at": "2025-01-01T00:00:00Z",
+            "geometry": {"type": "Polygon", "coordinates": [rng.uniform(-80, -60, (n_vertices, 2)).tolist()]},
+        }
+        for i in range(n_aois)
+    ]
+
+
+def array_payload(rng, n_values):
+    return {"values": rng.uniform(0, 300, n_values)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el JSONRenderer de DRF con ORJSONRenderer (tiempo por respuesta y "
+        "tamaño) en respuestas representativas de la API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--precision', type=int, default=None, help='Decimales a comparar además')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        payloads = {
+            'data-stats (20 años)': data_stats_payload(rng, 20),
+            'task-status (20 años)': task_status_payload(rng, 20),
+            'aois (100 x 200 vértices)': aoi_list_payload(rng, 100),
+            'ndarray (10^5 floats)': array_payload(rng, 100_000),
+        }
+        renderers = {
+            'drf': JSONRenderer().render,
+            'orjson': ORJSONRenderer().render,
+        }
+        if options['precision'] is not None:
+            renderers[f"orjson p={options['precision']}"] = lambda data: dumps(data, precision=options['precision'])
+
+        for name, payload in payloads.items():
+            timings = {}
+            for label, render in renderers.items():
+                size = len(render(payload))
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    render(payload)
+                timings[label] = ((time.perf_counter() - start) / options['repeat'], size)
+
+            base = timings['drf'][0]
+            self.stdout.write(f"{name}:")
+            for label, (elapsed, size) in timings.items():
+                self.stdout.write(
+                    f"  {label:<14} {elapsed * 1e6:10.1f} µs | {size:>9,} bytes | x{base / elapsed:6.2f}"
+                )
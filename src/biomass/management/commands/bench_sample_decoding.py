@@ -0,0 +1,96 @@
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from biomass.api.tasks import model
+from core.ml_models.gee_predictor import columns_to_matrix
+
+# Bandas que devuelve sample() además de las del modelo
+EXTRA_BANDS = ['B1', 'B5', 'B6', 'B7', 'B8A', 'B9', 'B12']
+
+
+def feature_payload(values, names):
+    """
+    Respuesta de sample().getInfo(): un Feature JSON por muestra.
+    """
+    return json.dumps({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": None, "id": str(i), "properties": dict(zip(names, row))}
+            for i, row in enumerate(values.tolist())
+        ],
+    })
+
+
+def column_payload(values):
+    """
+    Respuesta de reduceColumns(toList().repeat(n)).getInfo(): una lista por columna.
+    """
+    return json.dumps({"list": values.T.tolist()})
+
+
+def decode_features(payload, feature_names):
+    features = json.loads(payload)['features']
+    df = pd.DataFrame([f['properties'] for f in features])
+    return df[feature_names].to_numpy(dtype=np.float32)
+
+
+def decode_columns(payload, feature_names):
+    return columns_to_matrix(json.loads(payload)['list'])
+
+
+def measure(decode, payload, feature_names):
+    """
+    Tiempo sin tracemalloc (que lo distorsiona) y pico de memoria en una segunda pasada.
+    """
+    start = time.perf_counter()
+    X = decode(payload, feature_names)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    decode(payload, feature_names)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return X, elapsed, peak
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara decodificar las muestras de EE como Features JSON + DataFrame contra "
+        "la forma columnar (reduceColumns) directa a float32: tamaño de la respuesta, "
+        "tiempo y pico de memoria de la decodificación."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', nargs='+', type=int, default=[1_000, 10_000, 100_000])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        feature_names = list(model.feature_names_in_)
+        all_names = feature_names + [name for name in EXTRA_BANDS if name not in feature_names]
+
+        for n_samples in options['samples']:
+            values = rng.uniform(-1, 1, size=(n_samples, len(all_names)))
+            features = feature_payload(values, all_names)
+            # La forma columnar solo trae las columnas del modelo
+            columns = column_payload(values[:, :len(feature_names)])
+
+            X_features, features_time, features_peak = measure(decode_features, features, feature_names)
+            X_columns, columns_time, columns_peak = measure(decode_columns, columns, feature_names)
+            same = np.array_equal(X_features, X_columns)
+
+            style = self.style.SUCCESS if same else self.style.ERROR
+            self.stdout.write(style(f"{n_samples:,} muestras x {len(feature_names)} características (iguales: {same}):"))
+            for label, size, elapsed, peak in (
+                ('features', len(features), features_time, features_peak),
+                ('columnar', len(columns), columns_time, columns_peak),
+            ):
+                self.stdout.write(
+                    f"  {label:<9} {size / 1e6:8.2f} MB respuesta | {elapsed * 1e3:9.1f} ms "
+                    f"| pico {peak / 1e6:8.1f} MB"
+                )
@@ -0,0 +1,81 @@
+import json
+import math
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from kombu.serialization import dumps
+
+from biomass.models import AOI
+from biomass.api.tasks import analyze_geojson_task
+
+
+def synthetic_polygon(vertices, radius=0.05, center=(-99.13, 19.43)):
+    """
+    Genera un polígono circular (GeoJSON) con el número de vértices indicado.
+    """
+    coords = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        coords.append([center[0] + radius * math.cos(angle), center[1] + radius * math.sin(angle)])
+    coords.append(coords[0])
+    return {"type": "Polygon", "coordinates": [coords]}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el tamaño del mensaje del broker y la latencia de encolado de "
+        "analyze_geojson_task enviando la geometría completa vs. solo el aoi_id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aoi-id', type=int, help='Usar la geometría de un AOI existente')
+        parser.add_argument('--vertices', type=int, default=10000, help='Vértices del polígono sintético')
+        parser.add_argument('--runs', type=int, default=200, help='Número de mensajes por variante')
+        parser.add_argument(
+            '--enqueue', action='store_true',
+            help='Encolar de verdad en el broker (cola --queue, que se purga al final)'
+        )
+        parser.add_argument('--queue', default='bench_payload', help='Cola sin workers usada con --enqueue')
+
+    def handle(self, *args, **options):
+        if options['aoi_id']:
+            try:
+                aoi = AOI.objects.get(id=options['aoi_id'])
+            except AOI.DoesNotExist:
+                raise CommandError("AOI no encontrado")
+            geometry_dict = json.loads(aoi.geometry.json)
+            aoi_id = aoi.id
+        else:
+            geometry_dict = synthetic_polygon(options['vertices'])
+            aoi_id = 1
+
+        variants = {
+            'geojson (anterior)': (geometry_dict, 1, aoi_id),
+            'aoi_id (actual)': (aoi_id,),
+        }
+
+        app = analyze_geojson_task.app
+        for label, task_args in variants.items():
+            message = app.amqp.as_task_v2(str(uuid.uuid4()), analyze_geojson_task.name, args=task_args)
+            _, _, body = dumps(message.body, serializer='json')
+            self.stdout.write(f"{label}: cuerpo del mensaje = {len(body):,} bytes")
+
+            start = time.perf_counter()
+            for _ in range(options['runs']):
+                message = app.amqp.as_task_v2(str(uuid.uuid4()), analyze_geojson_task.name, args=task_args)
+                dumps(message.body, serializer='json')
+            elapsed = (time.perf_counter() - start) / options['runs']
+            self.stdout.write(f"{label}: serialización = {elapsed * 1e6:.1f} µs/mensaje")
+
+            if options['enqueue']:
+                start = time.perf_counter()
+                for _ in range(options['runs']):
+                    analyze_geojson_task.apply_async(args=task_args, queue=options['queue'])
+                elapsed = (time.perf_counter() - start) / options['runs']
+                self.stdout.write(f"{label}: encolado = {elapsed * 1e3:.2f} ms/mensaje")
+
+        if options['enqueue']:
+            with app.connection_for_write() as conn:
+                purged = conn.default_channel.queue_purge(options['queue'])
+            self.stdout.write(f"Mensajes purgados de '{options['queue']}': {purged}")
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from biomass.api.tasks import model
+from core.ml_models.tree_compiler import compile_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara model.predict de sklearn con el evaluador NumPy compilado "
+        "(tiempo y diferencia máxima) para 10^3 a 10^N filas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-exp', type=int, default=3)
+        parser.add_argument('--max-exp', type=int, default=7)
+        parser.add_argument('--chunk-size', type=int, default=16384)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        compiled = compile_model(model)
+        self.stdout.write(
+            f"Compilado {type(model).__name__}: {compiled.n_trees} árboles, "
+            f"{len(compiled.feature):,} nodos en {time.perf_counter() - start:.2f}s"
+        )
+
+        # Filas sintéticas dentro del rango de umbrales de cada característica
+        rng = np.random.default_rng(options['seed'])
+        names = list(model.feature_names_in_)
+        lows = np.zeros(len(names))
+        highs = np.ones(len(names))
+        for i in range(len(names)):
+            thresholds = compiled.threshold[(compiled.feature == i) & ~compiled.is_leaf]
+            if thresholds.size:
+                lows[i], highs[i] = thresholds.min(), thresholds.max()
+
+        for exp in range(options['min_exp'], options['max_exp'] + 1):
+            n_rows = 10 ** exp
+            X = pd.DataFrame(
+                rng.uniform(lows, highs, size=(n_rows, len(names))).astype(np.float32),
+                columns=names,
+            )
+
+            start = time.perf_counter()
+            expected = model.predict(X)
+            sklearn_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            predicted = compiled.predict(X, chunk_size=options['chunk_size'], n_threads=options['threads'])
+            compiled_time = time.perf_counter() - start
+
+            max_diff = float(np.max(np.abs(expected - predicted)))
+            style = self.style.SUCCESS if max_diff <= 1e-9 else self.style.ERROR
+            self.stdout.write(style(
+                f"{n_rows:>10,} filas: sklearn {sklearn_time:8.3f}s | compilado {compiled_time:8.3f}s "
+                f"| x{sklearn_time / compiled_time:5.2f} | diferencia máxima {max_diff:.2e}"
+            ))
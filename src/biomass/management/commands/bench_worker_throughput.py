@@ -0,0 +1,283 @@
+import argparse
+import csv
+import importlib.util
+import itertools
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+from celery import maybe_patch_concurrency, states
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Polygon
+from django.core.management.base import BaseCommand, CommandError
+from django_celery_results.models import TaskResult
+
+from biomass.api import tasks
+from biomass.api.tasks import analyze_geojson_task, years_to_analyze
+from biomass.models import AOI
+from geoapp.celery import app
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def process_tree(pid):
+    """
+    pid y todos sus descendientes (leyendo /proc, solo Linux).
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # El nombre del proceso va entre paréntesis y puede tener espacios
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+class RSSSampler(threading.Thread):
+    """
+    Muestrea la RSS del worker (proceso principal más hijos del pool) y guarda el pico.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_process = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            sizes = [rss_bytes(pid) for pid in process_tree(self.pid)]
+            self.peak_total = max(self.peak_total, sum(sizes))
+            self.peak_process = max(self.peak_process, max(sizes, default=0))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class SyntheticFeatureSource:
+    """
+    Fuente para el benchmark: espera `latency` segundos por año (como la espera
+    de red de una extracción en Earth Engine) y devuelve num_pixels muestras
+    aleatorias, así el costo de CPU de la predicción es el real.
+    """
+
+    def __init__(self, latency=0.0, num_pixels=1000):
+        self.latency = latency
+        self.num_pixels = num_pixels
+
+    def feature_matrix(self, year, feature_names):
+        """
+        Matriz float32 (num_pixels, len(feature_names)), reproducible por año.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        rng = np.random.default_rng(year)
+        return rng.uniform(0, 1, (self.num_pixels, len(feature_names))).astype(np.float32)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la capacidad de los workers de Celery para analyze_geojson_task. Por cada "
+        "combinación de pool, concurrencia y prefetch levanta un worker real contra el "
+        "broker Redis, encola --aois análisis con características sintéticas "
+        "(--latency segundos por año, sin Earth Engine) y reporta análisis por hora, "
+        "percentiles del tiempo de finalización (desde el encolado) y RSS del worker. "
+        "Usa la base de datos configurada: los AOIs y resultados creados se borran al final. "
+        "El pool gevent requiere `pip install gevent`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aois', type=int, default=50, help='Análisis encolados por combinación')
+        parser.add_argument('--latency', type=float, default=2.0, help='Latencia simulada por año (s)')
+        parser.add_argument('--pixels', type=int, default=1000, help='Muestras por año')
+        parser.add_argument('--pools', nargs='+', default=['prefork', 'threads', 'gevent'])
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8])
+        parser.add_argument('--prefetch', nargs='+', type=int, default=[1, 4])
+        parser.add_argument('--broker', default=settings.CELERY_BROKER_URL)
+        parser.add_argument('--timeout', type=float, default=900, help='Límite por combinación (s)')
+        parser.add_argument('--csv', help='Guarda los resultados en un CSV (curvas de capacidad)')
+        # Uso interno: el mismo comando levanta cada worker del benchmark
+        parser.add_argument('--serve-worker', action='store_true', help=argparse.SUPPRESS)
+        parser.add_argument('--queue', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['serve_worker']:
+            return self.serve_worker(options)
+
+        pools = []
+        for pool in options['pools']:
+            if pool == 'gevent' and importlib.util.find_spec('gevent') is None:
+                self.stdout.write(self.style.WARNING("gevent no está instalado: se omite ese pool"))
+                continue
+            pools.append(pool)
+        if not pools:
+            raise CommandError("No hay pools para medir")
+
+        app.conf.broker_url = options['broker']
+        user = User.objects.create_user(f"bench-workers-{uuid.uuid4().hex[:8]}")
+        rows = []
+        try:
+            for pool, concurrency, prefetch in itertools.product(pools, options['concurrency'], options['prefetch']):
+                row = self.run_config(user, pool, concurrency, prefetch, options)
+                if row:
+                    rows.append(row)
+        finally:
+            TaskResult.objects.filter(task_id__in=AOI.objects.filter(user=user).values('task_id')).delete()
+            user.delete()
+
+        if options['csv'] and rows:
+            with open(options['csv'], 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+            self.stdout.write(f"Resultados guardados en {options['csv']}")
+
+    def serve_worker(self, options):
+        """
+        Worker de Celery en este proceso con la extracción de características
+        reemplazada por SyntheticFeatureSource. La fuente sintética no existe
+        fuera del benchmark: analyze_geojson_task la usa solo en estos workers.
+        """
+        argv = ['worker', '-P', options['pools'][0], '-c', str(options['concurrency'][0]),
+                '--prefetch-multiplier', str(options['prefetch'][0]), '-Q', options['queue'],
+                '-n', f"{options['queue']}@%h", '--without-gossip', '--without-mingle', '-l', 'warning']
+        # gevent necesita parchear la librería estándar antes de arrancar el worker
+        maybe_patch_concurrency(argv)
+
+        source = SyntheticFeatureSource(options['latency'], options['pixels'])
+
+        def extract_year_features(geojson_data, year, feature_source=None):
+            return source.feature_matrix(year, tasks.model.feature_names_in_)
+
+        tasks.extract_year_features = extract_year_features
+        app.conf.broker_url = options['broker']
+        app.worker_main(argv)
+
+    def start_worker(self, pool, concurrency, prefetch, queue, options):
+        process = subprocess.Popen(
+            [sys.executable, 'manage.py', 'bench_worker_throughput', '--serve-worker', '--queue', queue,
+             '--pools', pool, '--concurrency', str(concurrency), '--prefetch', str(prefetch),
+             '--latency', str(options['latency']), '--pixels', str(options['pixels']),
+             '--broker', options['broker']],
+            cwd=settings.BASE_DIR,
+        )
+
+        # Listo cuando responde al ping de control
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"El worker {pool} c={concurrency} terminó al arrancar")
+            replies = app.control.ping(timeout=1.0)
+            if any(reply_name.startswith(f"{queue}@") for reply in replies for reply_name in reply):
+                return process
+        self.stop_worker(process)
+        raise CommandError(f"El worker {pool} c={concurrency} no respondió al ping")
+
+    def stop_worker(self, process):
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def run_config(self, user, pool, concurrency, prefetch, options):
+        label = f"{pool:<8} c={concurrency:<3} prefetch={prefetch:<3}"
+        # Cola propia: los workers de producción no toman estos mensajes
+        queue = f"bench_{uuid.uuid4().hex[:8]}"
+        process = self.start_worker(pool, concurrency, prefetch, queue, options)
+        sampler = RSSSampler(process.pid)
+        sampler.start()
+
+        aois = []
+        for i in range(options['aois']):
+            minx, miny = -75 + (i % 20) * 0.1, 2 + (i // 20) * 0.1
+            geometry = Polygon.from_bbox((minx, miny, minx + 0.05, miny + 0.05))
+            geometry.srid = 4326
+            aois.append(AOI(user=user, name=f"bench {i}", geometry=geometry, status='analysing',
+                            task_id=str(uuid.uuid4())))
+        aois = AOI.objects.bulk_create(aois)
+        n_years = len(years_to_analyze(aois[0]))
+
+        enqueued = {}
+        started = time.time()
+        for aoi in aois:
+            enqueued[aoi.task_id] = time.time()
+            analyze_geojson_task.apply_async(args=[aoi.id], task_id=aoi.task_id, queue=queue)
+
+        done = {}
+        deadline = time.monotonic() + options['timeout']
+        while len(done) < len(enqueued) and time.monotonic() < deadline:
+            time.sleep(0.5)
+            finished = (TaskResult.objects
+                        .filter(task_id__in=list(enqueued), status__in=states.READY_STATES)
+                        .values_list('task_id', 'date_done', 'status'))
+            done = {task_id: (date_done, status) for task_id, date_done, status in finished}
+
+        sampler.stop()
+        self.stop_worker(process)
+
+        if not done:
+            self.stdout.write(self.style.ERROR(f"{label} sin análisis terminados en {options['timeout']:.0f}s"))
+            return None
+
+        completion = [date_done.timestamp() - enqueued[task_id] for task_id, (date_done, _) in done.items()]
+        failures = sum(status != states.SUCCESS for _, status in done.values())
+        elapsed = max(date_done.timestamp() for date_done, _ in done.values()) - started
+        row = {
+            'pool': pool,
+            'concurrency': concurrency,
+            'prefetch': prefetch,
+            'aois': len(enqueued),
+            'completed': len(done),
+            'failed': failures,
+            'years_per_aoi': n_years,
+            'latency_per_year_s': options['latency'],
+            'analyses_per_hour': round(len(done) / elapsed * 3600, 1),
+            'p50_completion_s': round(statistics.median(completion), 2),
+            'p95_completion_s': round(percentile(completion, 0.95), 2),
+            'worker_rss_mb': round(sampler.peak_total / 2 ** 20, 1),
+            'max_process_rss_mb': round(sampler.peak_process / 2 ** 20, 1),
+        }
+        style = self.style.SUCCESS if not failures and len(done) == len(enqueued) else self.style.WARNING
+        self.stdout.write(style(
+            f"{label} {row['analyses_per_hour']:>9.1f} análisis/h | p50 {row['p50_completion_s']:>7.2f}s "
+            f"p95 {row['p95_completion_s']:>7.2f}s | RSS worker {row['worker_rss_mb']:>7.1f} MB "
+            f"(máx. proceso {row['max_process_rss_mb']:.1f} MB) | {len(done)}/{len(enqueued)} terminados, "
+            f"{failures} fallidos"
+        ))
+        return row
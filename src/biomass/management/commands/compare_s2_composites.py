@@ -0,0 +1,133 @@
+import io
+import json
+import time
+
+import ee
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from biomass.models import AOI
+from core.ml_models.gee_predictor import build_stacked_image, to_ee_geometry
+
+
+def legacy_stacked_image(region, year, grid_scale=100):
+    """
+    Grafo anterior: Cloud Score+ buscado por fecha dentro de .map y
+    proyección calculada con s2.first() sobre la colección global.
+    """
+    s2 = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
+    csp = ee.ImageCollection('GOOGLE/CLOUD_SCORE_PLUS/V1/S2_HARMONIZED')
+    s2_proj = ee.Image(s2.first()).select('B4').projection()
+
+    def link_collection(img):
+        cs_img = csp.filterDate(img.date(), img.date().advance(1, 'day')).first()
+        return img.addBands(cs_img)
+
+    def mask_clouds(img):
+        return img.updateMask(img.select('cs').gte(0.5))
+
+    def scale_bands(img):
+        return img.multiply(0.0001).copyProperties(img, ['system:time_start'])
+
+    def add_indices(img):
+        ndvi = img.normalizedDifference(['B8', 'B4']).rename('ndvi')
+        mndwi = img.normalizedDifference(['B3', 'B11']).rename('mndwi')
+        ndbi = img.normalizedDifference(['B11', 'B8']).rename('ndbi')
+        evi = img.expression(
+            '2.5*((NIR-RED)/(NIR+6*RED-7.5*BLUE+1))',
+            {'NIR': img.select('B8'), 'RED': img.select('B4'), 'BLUE': img.select('B2')}
+        ).rename('evi')
+        bsi = img.expression(
+            '((X+Y)-(A+B))/((X+Y)+(A+B))',
+            {'X': img.select('B11'), 'Y': img.select('B4'),
+             'A': img.select('B8'), 'B': img.select('B2')}
+        ).rename('bsi')
+        return img.addBands([ndvi, mndwi, ndbi, evi, bsi])
+
+    s2_comp = (s2.filterBounds(region)
+               .filterDate(f"{year}-01-01", f"{year}-12-31")
+               .map(link_collection)
+               .map(mask_clouds)
+               .select('B.*')
+               .map(scale_bands)
+               .map(add_indices)
+               .median()
+               .setDefaultProjection(s2_proj))
+
+    dem_ic = ee.ImageCollection('COPERNICUS/DEM/GLO30').filterBounds(region).select('DEM')
+    dem_proj = dem_ic.first().select(0).projection()
+    elev = dem_ic.mosaic().rename('dem').setDefaultProjection(dem_proj)
+    dem_bands = elev.addBands(ee.Terrain.slope(elev))
+
+    grid_proj = ee.Projection('EPSG:3857').atScale(grid_scale)
+    return s2_comp.addBands(dem_bands).reproject(grid_proj)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el grafo de composición S2 actual con el anterior: valores de las "
+        "características muestreadas y tiempo/perfil de cómputo en Earth Engine por AOI-año."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('aoi_ids', nargs='+', type=int)
+        parser.add_argument('--years', nargs='+', type=int, default=[2023])
+        parser.add_argument('--num-pixels', type=int, default=1000)
+        parser.add_argument('--rtol', type=float, default=1e-6)
+        parser.add_argument('--profile', action='store_true', help='Mostrar el perfil de EE (EECU) de cada grafo')
+
+    def run_graph(self, builder, region, year, num_pixels, profile):
+        stacked = builder(region, year)
+        samples = stacked.sample(region=region, scale=100, numPixels=num_pixels, geometries=False)
+        profile_text = io.StringIO()
+        start = time.perf_counter()
+        if profile:
+            with ee.profilePrinting(destination=profile_text):
+                features = samples.getInfo()['features']
+        else:
+            features = samples.getInfo()['features']
+        elapsed = time.perf_counter() - start
+        df = pd.DataFrame([f['properties'] for f in features])
+        return df, elapsed, profile_text.getvalue()
+
+    def handle(self, *args, **options):
+        failures = 0
+        for aoi_id in options['aoi_ids']:
+            try:
+                aoi = AOI.objects.get(id=aoi_id)
+            except AOI.DoesNotExist:
+                raise CommandError(f"AOI {aoi_id} no encontrado")
+            region = to_ee_geometry(json.loads(aoi.geometry.json))
+
+            for year in options['years']:
+                old_df, old_time, old_profile = self.run_graph(
+                    legacy_stacked_image, region, year, options['num_pixels'], options['profile'])
+                new_df, new_time, new_profile = self.run_graph(
+                    build_stacked_image, region, year, options['num_pixels'], options['profile'])
+
+                self.stdout.write(
+                    f"AOI {aoi_id} / {year}: anterior {old_time:.2f}s ({len(old_df)} muestras), "
+                    f"actual {new_time:.2f}s ({len(new_df)} muestras)"
+                )
+                if options['profile']:
+                    self.stdout.write("Perfil anterior:\n" + old_profile)
+                    self.stdout.write("Perfil actual:\n" + new_profile)
+
+                columns = sorted(set(old_df.columns) & set(new_df.columns))
+                if len(old_df) != len(new_df) or set(old_df.columns) != set(new_df.columns):
+                    failures += 1
+                    self.stdout.write(self.style.ERROR("  Distinto número de muestras o de bandas"))
+                    continue
+
+                for column in columns:
+                    old_values = old_df[column].to_numpy(dtype=float)
+                    new_values = new_df[column].to_numpy(dtype=float)
+                    if not np.allclose(old_values, new_values, rtol=options['rtol'], equal_nan=True):
+                        failures += 1
+                        diff = np.nanmax(np.abs(old_values - new_values))
+                        self.stdout.write(self.style.ERROR(f"  {column}: diferencia máxima {diff:.6g}"))
+
+        if failures:
+            raise CommandError(f"{failures} diferencias entre grafos")
+        self.stdout.write(self.style.SUCCESS("Los grafos producen las mismas características"))
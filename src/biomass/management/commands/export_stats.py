@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from biomass.api.export import export_queryset, export_rows, iter_csv, iter_parquet
+
+
+class Command(BaseCommand):
+    help = "Exporta BiomassStats con los metadatos de su AOI a CSV o Parquet en streaming."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Ruta del archivo de salida')
+        parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+        parser.add_argument('--user-id', type=int)
+        parser.add_argument('--aoi-ids', nargs='+', type=int)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rows = export_rows(
+            export_queryset(user_id=options['user_id'], aoi_ids=options['aoi_ids']),
+            chunk_size=options['chunk_size'],
+        )
+        if options['format'] == 'csv':
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                for line in iter_csv(rows):
+                    f.write(line)
+        else:
+            with open(options['output'], 'wb') as f:
+                for chunk in iter_parquet(rows, batch_size=options['chunk_size']):
+                    f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Exportado a {options['output']}"))
@@ -0,0 +1,84 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def fetch(host, port, path, headers):
+    """
+    GET HTTP/1.1 mínimo sobre una conexión nueva; devuelve el código de estado.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+    request += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write((request + "\r\n").encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+async def run_level(host, port, path, headers, concurrency, duration):
+    """
+    Mantiene `concurrency` clientes haciendo peticiones durante `duration` segundos.
+    """
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await fetch(host, port, path, headers)
+            except (OSError, ValueError, IndexError):
+                errors += 1
+                continue
+            if status >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de un endpoint con N conexiones concurrentes. Ejecutar contra "
+        "el mismo código servido por WSGI (gunicorn geoapp.wsgi) y por ASGI "
+        "(uvicorn geoapp.asgi:application) con los mismos workers para comparar capacidad."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='p. ej. http://localhost:8000/api/biomass/async/aois/')
+        parser.add_argument('--token', help='Access token JWT')
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[10, 50, 100, 200])
+        parser.add_argument('--duration', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError("Solo se soporta http://")
+        path = url.path + (f"?{url.query}" if url.query else "")
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+
+        for concurrency in options['concurrency']:
+            latencies, errors = asyncio.run(run_level(
+                url.hostname, url.port or 80, path, headers, concurrency, options['duration']
+            ))
+            if not latencies:
+                self.stdout.write(self.style.ERROR(f"c={concurrency}: sin respuestas correctas ({errors} errores)"))
+                continue
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            self.stdout.write(
+                f"c={concurrency:>4}: {len(latencies) / options['duration']:8.1f} req/s | "
+                f"p50 {statistics.median(latencies) * 1e3:7.1f} ms | p95 {p95 * 1e3:7.1f} ms | "
+                f"errores {errors}"
+            )
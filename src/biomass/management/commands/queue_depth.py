@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from biomass.api.coordination import queue_depths
+
+
+class Command(BaseCommand):
+    help = "Muestra los mensajes pendientes por cola de Celery (opcionalmente cada N segundos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Repetir cada N segundos')
+
+    def handle(self, *args, **options):
+        while True:
+            depths = queue_depths()
+            self.stdout.write(" | ".join(f"{queue}: {depth}" for queue, depth in depths.items()))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica que biomass_aoi.geometry tiene un índice GiST y que las búsquedas "
+        "por bbox (&&) y ST_Intersects lo usan en el plan de ejecución."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE tablename = 'biomass_aoi' AND indexdef ILIKE '%%USING gist%%(geometry)%%'
+            """)
+            indexes = cursor.fetchall()
+            if not indexes:
+                raise CommandError("No hay índice GiST sobre biomass_aoi.geometry")
+            for name, definition in indexes:
+                self.stdout.write(f"Índice: {definition}")
+            index_names = [name for name, _ in indexes]
+
+            envelope = "ST_MakeEnvelope(-100, 19, -99, 20, 4326)"
+            queries = {
+                'bbox (&&)': f"SELECT id FROM biomass_aoi WHERE geometry && {envelope}",
+                'ST_Intersects': f"SELECT id FROM biomass_aoi WHERE ST_Intersects(geometry, {envelope})",
+            }
+            # Con tablas pequeñas el planificador prefiere seq scan; se desactiva solo para verificar
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            for label, sql in queries.items():
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+                if not any(name in plan for name in index_names):
+                    raise CommandError(f"{label} no usa el índice GiST:\n{plan}")
+                self.stdout.write(self.style.SUCCESS(f"{label} usa el índice GiST"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0009_update_existing_aois_to_completed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aoi',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=80, null=True),
+        ),
+    ]
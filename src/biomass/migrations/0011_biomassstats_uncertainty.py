@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0010_aoi_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='biomassstats',
+            name='std_mg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='biomassstats',
+            name='ci_low_mg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='biomassstats',
+            name='ci_high_mg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
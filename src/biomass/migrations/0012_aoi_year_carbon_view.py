@@ -0,0 +1,38 @@
+# Vista materializada para la analítica agregada (biomass/api/analytics.py)
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0011_biomassstats_uncertainty'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE MATERIALIZED VIEW biomass_aoi_year_carbon AS
+                SELECT aoi_id, user_id, year, mean_carbon, area_ha,
+                       CASE WHEN LAG(year) OVER w = year - 1
+                            THEN mean_carbon - LAG(mean_carbon) OVER w
+                       END AS yoy_delta
+                FROM (
+                    SELECT DISTINCT ON (s.aoi_id, s.year)
+                           s.aoi_id, a.user_id, s.year, s.mean_carbon,
+                           ST_Area(a.geometry::geography) / 10000.0 AS area_ha
+                    FROM biomass_biomassstats s
+                    JOIN biomass_aoi a ON a.id = s.aoi_id
+                    WHERE a.geometry IS NOT NULL
+                    ORDER BY s.aoi_id, s.year, s.id DESC
+                ) stats
+                WINDOW w AS (PARTITION BY aoi_id ORDER BY year);
+
+                CREATE UNIQUE INDEX biomass_aoi_year_carbon_pk
+                    ON biomass_aoi_year_carbon (aoi_id, year);
+                CREATE INDEX biomass_aoi_year_carbon_user_year
+                    ON biomass_aoi_year_carbon (user_id, year);
+            """,
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS biomass_aoi_year_carbon;",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0012_aoi_year_carbon_view'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aoi',
+            name='status',
+            field=models.CharField(choices=[('analysing', 'Analysing'), ('completed', 'Completed'), ('error', 'Error'), ('cancelled', 'Cancelled')], default='analysing', max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0013_alter_aoi_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BiomassPeriodStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.SmallIntegerField()),
+                ('granularity', models.CharField(choices=[('month', 'Month'), ('season', 'Season')], max_length=10)),
+                ('period', models.SmallIntegerField()),
+                ('mean_mg', models.FloatField()),
+                ('mean_carbon', models.FloatField()),
+                ('std_mg', models.FloatField(blank=True, null=True)),
+                ('ci_low_mg', models.FloatField(blank=True, null=True)),
+                ('ci_high_mg', models.FloatField(blank=True, null=True)),
+                ('n_samples', models.IntegerField()),
+                ('aoi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='biomass.aoi')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('aoi', 'granularity', 'year', 'period'), name='unique_aoi_period_stats')],
+            },
+        ),
+    ]
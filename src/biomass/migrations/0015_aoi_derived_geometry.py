@@ -0,0 +1,78 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:40
+
+import django.contrib.gis.db.models.fields
+import django.contrib.gis.db.models.functions
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# Vista materializada de la analítica (0012) leyendo el área de la columna generada
+AOI_YEAR_CARBON_VIEW = """
+    CREATE MATERIALIZED VIEW biomass_aoi_year_carbon AS
+    SELECT aoi_id, user_id, year, mean_carbon, area_ha,
+           CASE WHEN LAG(year) OVER w = year - 1
+                THEN mean_carbon - LAG(mean_carbon) OVER w
+           END AS yoy_delta
+    FROM (
+        SELECT DISTINCT ON (s.aoi_id, s.year)
+               s.aoi_id, a.user_id, s.year, s.mean_carbon,
+               {area} / 10000.0 AS area_ha
+        FROM biomass_biomassstats s
+        JOIN biomass_aoi a ON a.id = s.aoi_id
+        WHERE a.geometry IS NOT NULL
+        ORDER BY s.aoi_id, s.year, s.id DESC
+    ) stats
+    WINDOW w AS (PARTITION BY aoi_id ORDER BY year);
+
+    CREATE UNIQUE INDEX biomass_aoi_year_carbon_pk
+        ON biomass_aoi_year_carbon (aoi_id, year);
+    CREATE INDEX biomass_aoi_year_carbon_user_year
+        ON biomass_aoi_year_carbon (user_id, year);
+"""
+
+DROP_VIEW = "DROP MATERIALIZED VIEW IF EXISTS biomass_aoi_year_carbon;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0014_biomassperiodstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aoi',
+            name='area_m2',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(models.F('geometry'), output_field=models.FloatField(), template='ST_Area(%(expressions)s::geography)'), output_field=models.FloatField()),
+        ),
+        migrations.AddField(
+            model_name='aoi',
+            name='centroid',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.gis.db.models.functions.Centroid('geometry'), output_field=django.contrib.gis.db.models.fields.PointField(srid=4326)),
+        ),
+        migrations.AddField(
+            model_name='aoi',
+            name='bbox',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.gis.db.models.functions.Envelope('geometry'), output_field=django.contrib.gis.db.models.fields.PolygonField(srid=4326)),
+        ),
+        migrations.AddField(
+            model_name='aoi',
+            name='npoints',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.gis.db.models.functions.NumPoints('geometry'), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='aoi',
+            index=models.Index(fields=['area_m2'], name='biomass_aoi_area_m2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aoi',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['centroid'], name='biomass_aoi_centroid_gist'),
+        ),
+        migrations.AddIndex(
+            model_name='aoi',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['bbox'], name='biomass_aoi_bbox_gist'),
+        ),
+        migrations.RunSQL(
+            sql=[DROP_VIEW, AOI_YEAR_CARBON_VIEW.format(area='a.area_m2')],
+            reverse_sql=[DROP_VIEW, AOI_YEAR_CARBON_VIEW.format(area='ST_Area(a.geometry::geography)')],
+        ),
+    ]
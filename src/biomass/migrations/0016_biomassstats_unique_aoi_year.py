@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0015_aoi_derived_geometry'),
+    ]
+
+    operations = [
+        # Antes de la restricción se borran los duplicados (aoi, year) dejando
+        # la fila más reciente, la misma que usa la analítica (DISTINCT ON ... id DESC)
+        migrations.RunSQL(
+            sql="""
+                DELETE FROM biomass_biomassstats s
+                USING biomass_biomassstats newer
+                WHERE newer.aoi_id = s.aoi_id
+                  AND newer.year = s.year
+                  AND newer.id > s.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='biomassstats',
+            constraint=models.UniqueConstraint(fields=('aoi', 'year'), name='unique_aoi_year_stats'),
+        ),
+    ]
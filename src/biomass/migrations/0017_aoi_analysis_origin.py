@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 23:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('biomass', '0016_biomassstats_unique_aoi_year'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aoi',
+            name='analysis_origin',
+            field=models.CharField(choices=[('user', 'User'), ('refresh', 'Refresh')], default='user', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='aoi',
+            name='analysis_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,12 +1,19 @@
 from django.db import models
 from django.contrib.auth.models import User  # Importas el modelo existente
 from django.contrib.gis.db import models as gis_models
+from django.contrib.gis.db.models.functions import Centroid, Envelope, NumPoints
+from django.contrib.postgres.indexes import GistIndex
 
 class AOI(models.Model):
     STATUS_CHOICES = [
         ('analysing', 'Analysing'),
         ('completed', 'Completed'),
         ('error', 'Error'),
+        ('cancelled', 'Cancelled'),
+    ]
+    ANALYSIS_ORIGIN_CHOICES = [
+        ('user', 'User'),  # Subida o reanálisis pedido por el usuario
+        ('refresh', 'Refresh'),  # Refresco masivo de mantenimiento
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -18,12 +25,77 @@ class AOI(models.Model):
     favorite = models.BooleanField(default=False)
     share_token = models.CharField(max_length=64, null=True, blank=True, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='analysing')
+    fingerprint = models.CharField(max_length=80, null=True, blank=True, db_index=True)  # Huella de geometría + versión del pipeline
+    # Quién lanzó el último análisis y cuándo se encoló (límites de análisis en curso por usuario)
+    analysis_origin = models.CharField(max_length=10, choices=ANALYSIS_ORIGIN_CHOICES, default='user')
+    analysis_started_at = models.DateTimeField(null=True, blank=True)
+
+    # Derivados de la geometría que mantiene PostgreSQL (columnas generadas): se
+    # calculan al insertar/actualizar y las vistas no hacen cálculos con GEOS
+    area_m2 = models.GeneratedField(  # Área geodésica (sobre el esferoide) en m²
+        expression=models.Func(models.F('geometry'), template='ST_Area(%(expressions)s::geography)',
+                               output_field=models.FloatField()),
+        output_field=models.FloatField(),
+        db_persist=True,
+    )
+    centroid = models.GeneratedField(
+        expression=Centroid('geometry'),
+        output_field=gis_models.PointField(srid=4326),
+        db_persist=True,
+    )
+    bbox = models.GeneratedField(
+        expression=Envelope('geometry'),
+        output_field=gis_models.PolygonField(srid=4326),
+        db_persist=True,
+    )
+    npoints = models.GeneratedField(
+        expression=NumPoints('geometry'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['area_m2'], name='biomass_aoi_area_m2_idx'),
+            GistIndex(fields=['centroid'], name='biomass_aoi_centroid_gist'),
+            GistIndex(fields=['bbox'], name='biomass_aoi_bbox_gist'),
+        ]
 
 class BiomassStats(models.Model):
     aoi = models.ForeignKey(AOI, on_delete=models.CASCADE)
     year = models.SmallIntegerField()
     mean_mg = models.FloatField()
     mean_carbon = models.FloatField()
+    std_mg = models.FloatField(null=True, blank=True)  # Desviación media entre árboles del modelo
+    ci_low_mg = models.FloatField(null=True, blank=True)  # IC 95% (bootstrap) de mean_mg
+    ci_high_mg = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['aoi', 'year'], name='unique_aoi_year_stats'),
+        ]
+
+class BiomassPeriodStats(models.Model):
+    GRANULARITY_CHOICES = [
+        ('month', 'Month'),
+        ('season', 'Season'),
+    ]
+
+    aoi = models.ForeignKey(AOI, on_delete=models.CASCADE)
+    year = models.SmallIntegerField()
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    period = models.SmallIntegerField()  # Mes (1-12) o trimestre (1-4)
+    mean_mg = models.FloatField()
+    mean_carbon = models.FloatField()
+    std_mg = models.FloatField(null=True, blank=True)
+    ci_low_mg = models.FloatField(null=True, blank=True)
+    ci_high_mg = models.FloatField(null=True, blank=True)
+    n_samples = models.IntegerField()  # Píxeles sin nubes usados en el periodo
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['aoi', 'granularity', 'year', 'period'], name='unique_aoi_period_stats'),
+        ]
 
 class BiomassRaster(models.Model):
     aoi = models.ForeignKey(AOI, on_delete=models.CASCADE)
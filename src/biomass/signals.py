@@ -0,0 +1,44 @@
+"""
+Invalidación de la caché de /data-stats/ (vistas asíncronas).
+
+La respuesta cacheada incluye el nombre del AOI y sus BiomassStats, que se pueden
+editar sin que cambie el task_id ni el status. Cada escritura renueva la versión
+del AOI y la clave de la caché la incluye, así que las entradas viejas dejan de
+leerse (expiran solas con ASYNC_VIEWS_CACHE_TIMEOUT).
+"""
+import logging
+import uuid
+
+import redis
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AOI, BiomassStats
+
+logger = logging.getLogger(__name__)
+
+
+def data_stats_version_key(aoi_id):
+    return f"data-stats-version:{aoi_id}"
+
+
+def bump_data_stats_version(aoi_id):
+    # Sin expiración: si la versión desapareciera antes que las entradas se
+    # volverían a leer respuestas viejas
+    try:
+        cache.set(data_stats_version_key(aoi_id), uuid.uuid4().hex, None)
+    except redis.RedisError as e:
+        logger.warning("No se pudo invalidar la caché de data-stats del AOI %s: %s", aoi_id, e)
+
+
+# Tras el commit: antes, otra petición podría cachear los datos viejos con la versión nueva
+@receiver([post_save, post_delete], sender=AOI)
+def aoi_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_data_stats_version(instance.id))
+
+
+@receiver([post_save, post_delete], sender=BiomassStats)
+def biomass_stats_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_data_stats_version(instance.aoi_id))
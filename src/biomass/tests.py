@@ -1,3 +1,1650 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import redis
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import GEOSGeometry, LinearRing, MultiPolygon, Polygon
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now as django_now
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+from biomass.api.coordination import (
+    RefreshCheckpoint, TokenBucket, acquire_analysis, copy_biomass_stats, find_completed_analysis,
+    geometry_fingerprint, get_redis, release_analysis,
+)
+from biomass.api.analytics import carbon_totals_by_year, refresh_materialized_view, yoy_change_distribution
+from biomass.api.export import EXPORT_COLUMNS, iter_csv, iter_parquet
+from biomass.api.geometry_formats import (
+    _varints, _zigzag, decode_delta, encode_geometry, requested_geometry_format, to_twkb,
+)
+from biomass.api.renderers import ORJSONParser, ORJSONRenderer
+from biomass.api.views import build_data_stats, map_zoom
+from biomass.api import tasks as tasks_module
+from biomass.api.throttles import AnalysisRateThrottle, ConcurrentAnalysisThrottle
+from biomass.api.tasks import (
+    FIRST_YEAR, YearTimeLimitExceeded, analysis_queue, analyze_geojson_task, analyze_period_series_task,
+    batch_refresh_aois, enqueue_refresh, extract_year_features, fair_share_priority, finish_follower,
+    period_years_to_analyze, estimate_analysis_cost, load_aoi_geometry, model, refresh_current_year_batch_task,
+    release_revoked_analysis, simplify_to_vertex_limit, split_refresh_chunk, years_to_analyze,
+)
+from core.ml_models import gee_predictor
+from geoapp import middleware as middleware_module
+from geoapp.middleware import RequestProfilingMiddleware
+from core.ml_models.ee_client import (
+    AIMDLimiter, EEClient, EEPermanentError, EEQuotaError, EETransientError, classify_ee_exception,
+)
+from core.ml_models.tree_compiler import compile_model
+from core.ml_models.uncertainty import bootstrap_mean_ci, forest_predict_with_std
+from core.ml_models.local_features import LocalFeatureSource, lonlat_to_mercator, rasterize_rings
+from core.ml_models.gee_predictor import columns_to_matrix, period_prefix, period_ranges, split_columns_by_aoi
+from biomass.models import AOI, BiomassPeriodStats, BiomassStats
+
+
+def redis_available():
+    try:
+        return get_redis().ping()
+    except redis.RedisError:
+        return False
+
+
+# Las pruebas de scripts Lua y locks necesitan el Redis de settings.REDIS_URL
+REDIS_AVAILABLE = redis_available()
+
+
+class DictRedis:
+    """
+    Redis mínimo en memoria (hashes) para probar la lógica sin servidor.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({field: str(value) for field, value in mapping.items()})
+
+    def expire(self, key, seconds):
+        return True
+
+
+def square(minx, miny, size, srid=4326):
+    polygon = Polygon.from_bbox((minx, miny, minx + size, miny + size))
+    polygon.srid = srid
+    return polygon
+
+
+def circle(n_points, radius=0.1):
+    angles = np.linspace(0, 2 * np.pi, n_points, endpoint=False)
+    coords = [(radius * np.cos(a), radius * np.sin(a)) for a in angles]
+    return Polygon(coords + coords[:1], srid=4326)
+
+
+def add_stats(aoi, years):
+    BiomassStats.objects.bulk_create([
+        BiomassStats(aoi=aoi, year=year, mean_mg=100.0 + i, mean_carbon=47.0 + i)
+        for i, year in enumerate(years)
+    ])
+
+
+def geojson_upload(polygon):
+    content = json.dumps({"type": "Feature", "geometry": json.loads(polygon.json), "properties": {}})
+    return SimpleUploadedFile('aoi.geojson', content.encode('utf-8'), content_type='application/geo+json')
+
+
+class LoadAOIGeometryTests(SimpleTestCase):
+
+    def test_simplifies_dense_polygon_below_limit(self):
+        geojson = load_aoi_geometry(AOI(geometry=circle(2000)), max_vertices=100)
+        self.assertEqual(geojson['type'], 'Polygon')
+        self.assertLessEqual(sum(len(ring) for ring in geojson['coordinates']), 100)
+
+    def test_polygon_with_many_holes_terminates_under_limit(self):
+        # 60 huecos de 5 puntos: conservando la topología nunca baja de ~300 puntos
+        holes = [
+            LinearRing(square(0.05 + (i % 10) * 0.09, 0.05 + (i // 10) * 0.15, 0.03).exterior_ring.coords)
+            for i in range(60)
+        ]
+        polygon = Polygon(square(0, 0, 1).exterior_ring, *holes, srid=4326)
+        self.assertGreater(polygon.num_points, 300)
+
+        simplified = simplify_to_vertex_limit(polygon, 100)
+        self.assertLessEqual(simplified.num_points, 100)
+        self.assertTrue(simplified.valid)
+        self.assertAlmostEqual(simplified.extent[2], 1.0)
+
+    def test_geometry_under_limit_is_unchanged(self):
+        polygon = square(-74, 4, 0.1)
+        geojson = load_aoi_geometry(AOI(geometry=polygon), max_vertices=100)
+        self.assertEqual(geojson, json.loads(polygon.json))
+
+
+class AnalyzeGeoJSONMessageTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('analyst', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('biomass.api.views.acquire_analysis', return_value=None)
+    @mock.patch('biomass.api.views.analyze_geojson_task.apply_async')
+    def test_task_message_carries_only_aoi_id(self, apply_async, _acquire):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/biomass/analyze-geojson/', {'geojson': geojson_upload(square(-74, 4, 0.1))}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 202)
+        aoi = AOI.objects.get(id=response.json()['aoi_id'])
+        self.assertEqual(apply_async.call_args.kwargs['args'], [aoi.id])
+        self.assertNotIn('coordinates', json.dumps(apply_async.call_args.kwargs.get('kwargs', {})))
+
+    @mock.patch('biomass.api.views.acquire_analysis', return_value=None)
+    @mock.patch('biomass.api.views.analyze_geojson_task.apply_async')
+    def test_queue_follows_area_times_years(self, apply_async, _acquire):
+        for polygon, queue in [(square(-74, 4, 0.01), 'biomass_small'), (square(-74, 4, 1), 'biomass_large')]:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    '/api/biomass/analyze-geojson/', {'geojson': geojson_upload(polygon)}, format='multipart'
+                )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(apply_async.call_args.kwargs['queue'], queue)
+
+    @override_settings(ANALYTICS_USE_MATERIALIZED_VIEW=False)
+    @mock.patch('biomass.api.views.acquire_analysis', return_value=None)
+    @mock.patch('biomass.api.tasks.extract_year_features')
+    def test_eager_task_sees_its_aoi(self, extract, _acquire):
+        # La tarea corre en cuanto se encola: el AOI ya debe tener su task_id
+        rng = np.random.default_rng(0)
+        extract.side_effect = lambda *args: rng.random((4, len(model.feature_names_in_)), dtype=np.float32)
+        conf = analyze_geojson_task.app.conf
+        self.addCleanup(setattr, conf, 'task_always_eager', conf.task_always_eager)
+        conf.task_always_eager = True
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/biomass/analyze-geojson/', {'geojson': geojson_upload(square(-74, 4, 0.1))}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 202)
+        aoi = AOI.objects.get(id=response.json()['aoi_id'])
+        self.assertEqual(aoi.task_id, response.json()['task_id'])
+        self.assertEqual(aoi.status, 'completed')
+        self.assertEqual(aoi.biomassstats_set.count(), len(years_to_analyze(aoi)))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsyncDataStatsCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cached', password='secret')
+        self.aoi = AOI.objects.create(user=self.user, name='Antes', geometry=square(-74, 4, 0.1),
+                                      status='completed', task_id=str(uuid.uuid4()), share_token='cache-token')
+        add_stats(self.aoi, [2020, 2021])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def data_stats(self):
+        response = self.client.get('/api/biomass/async/data-stats/',
+                                   {'aoi_id': self.aoi.id, 'share_token': 'cache-token'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rename_invalidates_cached_response(self):
+        self.assertEqual(self.data_stats()['aoi_name'], 'Antes')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/biomass/aois/{self.aoi.id}/', {'name': 'Después'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.data_stats()['aoi_name'], 'Después')
+
+    def test_stats_edit_invalidates_cached_response(self):
+        self.assertEqual(self.data_stats()['biomass_stats']['2020'], 100.0)
+        stat = BiomassStats.objects.get(aoi=self.aoi, year=2020)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/biomass/biomass-stats/{stat.id}/', {'mean_mg': 250.0}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.data_stats()['biomass_stats']['2020'], 250.0)
+
+    def test_unchanged_aoi_is_served_from_cache(self):
+        self.data_stats()
+        # Sin señales (update() directo): la respuesta sigue saliendo de la caché
+        BiomassStats.objects.filter(aoi=self.aoi, year=2020).update(mean_mg=999.0)
+        self.assertEqual(self.data_stats()['biomass_stats']['2020'], 100.0)
+
+
+@override_settings(ANALYSIS_LARGE_COST_THRESHOLD=1000,
+                   ANALYSIS_QUEUE_SMALL='biomass_small', ANALYSIS_QUEUE_LARGE='biomass_large')
+class AnalysisQueueTests(SimpleTestCase):
+
+    def test_cost_is_area_in_km2_times_years(self):
+        self.assertEqual(estimate_analysis_cost(250e6, 4), 1000)
+        self.assertEqual(estimate_analysis_cost(None, 4), 0)
+
+    def test_routes_by_cost_threshold(self):
+        self.assertEqual(analysis_queue(100e6, 9), 'biomass_small')
+        self.assertEqual(analysis_queue(100e6, 10), 'biomass_large')
+        # Un AOI grande con un solo año pendiente (refresco) sigue siendo pequeño
+        self.assertEqual(analysis_queue(500e6, 1), 'biomass_small')
+        self.assertEqual(analysis_queue(None, 10), 'biomass_small')
+
+
+class GeometryFingerprintTests(SimpleTestCase):
+
+    def test_same_polygon_with_other_start_vertex_and_orientation(self):
+        polygon = square(-74, 4, 0.1)
+        coords = polygon.exterior_ring.coords[:-1]
+        rotated = Polygon(coords[2:] + coords[:2] + coords[2:3], srid=4326)
+        reversed_ring = Polygon(tuple(reversed(polygon.exterior_ring.coords)), srid=4326)
+        self.assertEqual(geometry_fingerprint(polygon), geometry_fingerprint(rotated))
+        self.assertEqual(geometry_fingerprint(polygon), geometry_fingerprint(reversed_ring))
+
+    def test_different_polygons(self):
+        self.assertNotEqual(geometry_fingerprint(square(-74, 4, 0.1)), geometry_fingerprint(square(-74, 4, 0.2)))
+
+
+class SingleFlightLockTests(SimpleTestCase):
+
+    @mock.patch('biomass.api.coordination.get_redis')
+    def test_second_request_gets_leader_task(self, get_redis_mock):
+        get_redis_mock.return_value.set.return_value = False
+        get_redis_mock.return_value.get.return_value = 'leader-task'
+        self.assertEqual(acquire_analysis('v1:abc', 'follower-task'), 'leader-task')
+
+    @mock.patch('biomass.api.coordination.get_redis')
+    def test_redis_down_disables_deduplication(self, get_redis_mock):
+        get_redis_mock.return_value.set.side_effect = redis.ConnectionError
+        self.assertIsNone(acquire_analysis('v1:abc', 'task'))
+
+    @unittest.skipUnless(REDIS_AVAILABLE, "Redis no disponible")
+    def test_release_only_by_owner(self):
+        fingerprint = f"test:{uuid.uuid4().hex}"
+        self.assertIsNone(acquire_analysis(fingerprint, 'leader'))
+        self.assertEqual(acquire_analysis(fingerprint, 'other'), 'leader')
+        release_analysis(fingerprint, 'other')
+        self.assertEqual(acquire_analysis(fingerprint, 'other'), 'leader')
+        release_analysis(fingerprint, 'leader')
+        self.assertIsNone(acquire_analysis(fingerprint, 'other'))
+        release_analysis(fingerprint, 'other')
+
+
+class CompletedAnalysisReuseTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('analyst', password='secret')
+        self.geometry = square(-74, 4, 0.1)
+        self.fingerprint = geometry_fingerprint(self.geometry)
+
+    def test_finds_completed_aoi_with_current_year(self):
+        source = AOI.objects.create(user=self.user, name='a', geometry=self.geometry,
+                                    status='completed', fingerprint=self.fingerprint)
+        add_stats(source, [datetime.now().year - 1, datetime.now().year])
+        target = AOI.objects.create(user=self.user, name='b', geometry=self.geometry,
+                                    status='analysing', fingerprint=self.fingerprint)
+
+        self.assertEqual(find_completed_analysis(self.fingerprint, exclude_id=target.id), source)
+        copy_biomass_stats(source, target)
+        self.assertEqual(
+            sorted(BiomassStats.objects.filter(aoi=target).values_list('year', flat=True)),
+            [datetime.now().year - 1, datetime.now().year],
+        )
+
+    def test_ignores_stale_analysis(self):
+        source = AOI.objects.create(user=self.user, name='a', geometry=self.geometry,
+                                    status='completed', fingerprint=self.fingerprint)
+        add_stats(source, [datetime.now().year - 1])
+        self.assertIsNone(find_completed_analysis(self.fingerprint))
+
+
+@mock.patch('biomass.api.views.analyze_geojson_task.app.control.revoke')
+@mock.patch('biomass.api.views.release_analysis')
+class CancelAnalysisTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('canceller', password='secret')
+        self.geometry = square(-74, 4, 0.1)
+        self.fingerprint = geometry_fingerprint(self.geometry)
+        self.task_id = str(uuid.uuid4())
+        self.aoi = AOI.objects.create(user=self.user, name='a', geometry=self.geometry, status='analysing',
+                                      task_id=self.task_id, fingerprint=self.fingerprint)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cancel(self):
+        return self.client.post(f'/api/biomass/aois/{self.aoi.id}/cancel/')
+
+    def test_cancel_revokes_and_releases_lock(self, release, revoke):
+        self.assertEqual(self.cancel().status_code, 200)
+        revoke.assert_called_once_with(self.task_id)
+        release.assert_called_once_with(self.fingerprint, self.task_id)
+        self.aoi.refresh_from_db()
+        self.assertEqual(self.aoi.status, 'cancelled')
+
+    def test_shared_task_keeps_running_and_keeps_lock(self, release, revoke):
+        AOI.objects.create(user=self.user, name='b', geometry=self.geometry, status='analysing',
+                           task_id=self.task_id, fingerprint=self.fingerprint)
+        self.assertEqual(self.cancel().status_code, 200)
+        revoke.assert_not_called()
+        release.assert_not_called()
+        self.aoi.refresh_from_db()
+        self.assertIsNone(self.aoi.task_id)
+
+    def test_cancel_without_analysis_in_flight(self, release, revoke):
+        AOI.objects.filter(id=self.aoi.id).update(status='completed')
+        self.assertEqual(self.cancel().status_code, 409)
+        release.assert_not_called()
+
+
+@mock.patch('biomass.api.tasks.release_analysis')
+class RevokedAnalysisTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('revoked', password='secret')
+        self.task_id = str(uuid.uuid4())
+        self.fingerprints = [geometry_fingerprint(square(-74, 4, 0.1)), geometry_fingerprint(square(-73, 4, 0.1))]
+        for fingerprint in self.fingerprints:
+            AOI.objects.create(user=user, name='a', geometry=square(-74, 4, 0.1), status='cancelled',
+                               task_id=self.task_id, fingerprint=fingerprint)
+
+    def test_revoked_analysis_releases_its_locks(self, release):
+        release_revoked_analysis(sender=analyze_geojson_task, request=mock.Mock(id=self.task_id))
+        self.assertEqual(sorted(call.args for call in release.call_args_list),
+                         sorted((fingerprint, self.task_id) for fingerprint in self.fingerprints))
+
+    def test_other_revoked_tasks_are_ignored(self, release):
+        release_revoked_analysis(sender=refresh_current_year_batch_task, request=mock.Mock(id=self.task_id))
+        release.assert_not_called()
+
+
+@override_settings(ANALYTICS_USE_MATERIALIZED_VIEW=False)
+@mock.patch('biomass.api.tasks.release_analysis')
+@mock.patch('biomass.api.tasks.analyze_geojson_task.apply_async')
+class FollowerCompletionTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('follower', password='secret')
+        self.task_id = str(uuid.uuid4())
+        self.leader, self.follower = [
+            AOI.objects.create(user=user, name=name, geometry=square(-74, 4, 0.1), status='analysing',
+                               task_id=self.task_id, analysis_origin='user', analysis_started_at=django_now())
+            for name in ('líder', 'seguidor')
+        ]
+
+    def test_follower_copies_the_leader_stats(self, apply_async, _release):
+        add_stats(self.leader, [2020, 2021])
+        finish_follower(self.leader.id, self.follower)
+        self.follower.refresh_from_db()
+        self.assertEqual(self.follower.status, 'completed')
+        self.assertEqual(BiomassStats.objects.filter(aoi=self.follower).count(), 2)
+        apply_async.assert_not_called()
+
+    def test_leader_without_stats_fails_the_follower(self, apply_async, _release):
+        finish_follower(self.leader.id, self.follower)
+        self.follower.refresh_from_db()
+        self.assertEqual(self.follower.status, 'error')
+        apply_async.assert_not_called()
+
+    @mock.patch('biomass.api.tasks.extract_year_features')
+    def test_deleted_leader_requeues_the_follower(self, extract, apply_async, _release):
+        def delete_leader(*args):
+            AOI.objects.filter(id=self.leader.id).delete()
+            return None
+
+        extract.side_effect = delete_leader
+        analyze_geojson_task.apply(args=[self.leader.id], task_id=self.task_id)
+        self.follower.refresh_from_db()
+        self.assertEqual(self.follower.status, 'analysing')
+        self.assertNotEqual(self.follower.task_id, self.task_id)
+        self.assertEqual(apply_async.call_args.kwargs['args'], [self.follower.id])
+        self.assertEqual(apply_async.call_args.kwargs['task_id'], self.follower.task_id)
+
+
+class IncrementalRefreshTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('analyst')
+        self.aoi = AOI.objects.create(user=user, name='a', geometry=square(-74, 4, 0.1), status='completed')
+        self.current_year = datetime.now().year
+
+    def test_only_missing_years_and_current_year(self):
+        add_stats(self.aoi, [FIRST_YEAR, FIRST_YEAR + 1, self.current_year])
+        self.assertEqual(
+            years_to_analyze(self.aoi, incremental=True),
+            list(range(FIRST_YEAR + 2, self.current_year + 1)),
+        )
+        self.assertEqual(years_to_analyze(self.aoi), list(range(FIRST_YEAR, self.current_year + 1)))
+
+    def test_one_row_per_aoi_and_year(self):
+        add_stats(self.aoi, [self.current_year])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            add_stats(self.aoi, [self.current_year])
+
+    def test_copy_keeps_years_the_target_already_has(self):
+        source = AOI.objects.create(user=self.aoi.user, name='b', geometry=self.aoi.geometry, status='completed')
+        add_stats(source, [FIRST_YEAR, self.current_year])
+        BiomassStats.objects.create(aoi=self.aoi, year=self.current_year, mean_mg=1.0, mean_carbon=0.47)
+        copy_biomass_stats(source, self.aoi)
+        stats = dict(BiomassStats.objects.filter(aoi=self.aoi).values_list('year', 'mean_mg'))
+        self.assertEqual(stats, {FIRST_YEAR: 100.0, self.current_year: 1.0})
+
+
+class RefreshCheckpointTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('biomass.api.coordination.get_redis', return_value=DictRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_phases_in_order(self):
+        checkpoint = RefreshCheckpoint('2026-01-01')
+        self.assertEqual(checkpoint.load(), ('favorites', 0))
+        checkpoint.save('favorites', 42)
+        self.assertEqual(checkpoint.load(), ('favorites', 42))
+        self.assertTrue(checkpoint.advance('favorites'))
+        self.assertEqual(checkpoint.load(), ('others', 0))
+        self.assertFalse(checkpoint.advance('others'))
+        self.assertEqual(checkpoint.load(), ('done', 0))
+
+
+@unittest.skipUnless(REDIS_AVAILABLE, "Redis no disponible")
+class TokenBucketTests(SimpleTestCase):
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(f"test:{uuid.uuid4().hex}", rate=1.0, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        wait = bucket.try_acquire()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 1.0)
+
+
+class BatchRefreshTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('analyst')
+        self.favorites = [
+            AOI.objects.create(user=user, name=f"f{i}", geometry=square(-74, 4, 0.1), status='completed', favorite=True)
+            for i in range(2)
+        ]
+        self.others = [
+            AOI.objects.create(user=user, name=f"o{i}", geometry=square(-74, 4, 0.1), status='completed')
+            for i in range(3)
+        ]
+        AOI.objects.create(user=user, name='busy', geometry=square(-74, 4, 0.1), status='analysing')
+        for target, kwargs in [
+            ('biomass.api.coordination.get_redis', {'return_value': DictRedis()}),
+            ('biomass.api.tasks.TokenBucket.acquire', {}),
+        ]:
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @mock.patch('biomass.api.tasks.batch_refresh_aois.apply_async')
+    @mock.patch('biomass.api.tasks.analyze_geojson_task.apply_async')
+    def test_favorites_first_then_others_then_done(self, analyze, reschedule):
+        with self.settings(BATCH_REFRESH_CHUNK_SIZE=2):
+            batch_refresh_aois('run')  # favoritos
+            batch_refresh_aois('run')  # favoritos (bloque vacío) -> others
+            batch_refresh_aois('run')  # others
+            result = batch_refresh_aois('run')  # último bloque de others -> done
+
+        enqueued = [call.kwargs['args'][0] for call in analyze.call_args_list]
+        self.assertEqual(enqueued, [aoi.id for aoi in self.favorites + self.others])
+        self.assertEqual(result['status'], 'done')
+        self.assertEqual(batch_refresh_aois('run'), {'run_key': 'run', 'status': 'done'})
+
+    @mock.patch('biomass.api.tasks.batch_refresh_aois.apply_async')
+    @mock.patch('biomass.api.tasks.analyze_geojson_task.apply_async')
+    def test_maintenance_refreshes_are_marked_and_lowest_priority(self, analyze, _reschedule):
+        batch_refresh_aois('run')
+        self.assertEqual({call.kwargs['priority'] for call in analyze.call_args_list},
+                         {settings.ANALYSIS_PRIORITY_LEVELS - 1})
+        for aoi in self.favorites:
+            aoi.refresh_from_db()
+            self.assertEqual((aoi.status, aoi.analysis_origin), ('analysing', 'refresh'))
+
+
+class BatchExtractionTests(SimpleTestCase):
+
+    def test_split_columns_by_aoi(self):
+        columns = [[1.0, 2.0, 3.0], [10.0, 20.0, 30.0], [7, 9, 7]]
+        matrices = split_columns_by_aoi(columns, [7, 9, 11])
+        np.testing.assert_array_equal(matrices[7], np.array([[1, 10], [3, 30]], dtype=np.float32))
+        self.assertEqual(matrices[7].dtype, np.float32)
+        np.testing.assert_array_equal(matrices[9], np.array([[2, 20]], dtype=np.float32))
+        self.assertIsNone(matrices[11])
+
+    def test_no_samples(self):
+        self.assertEqual(split_columns_by_aoi([[], []], [1]), {1: None})
+
+
+class BatchedCurrentYearRefreshTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('analyst')
+        self.current_year = datetime.now().year
+        self.complete = [
+            AOI.objects.create(user=user, name=f"c{i}", geometry=square(-74 + i, 4, 0.1), status='completed')
+            for i in range(3)
+        ]
+        for aoi in self.complete:
+            add_stats(aoi, range(FIRST_YEAR, self.current_year))
+        self.missing = AOI.objects.create(user=user, name='m', geometry=square(-70, 4, 0.1), status='completed')
+        add_stats(self.missing, [FIRST_YEAR])
+        patcher = mock.patch('biomass.api.tasks.schedule_analytics_refresh')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_split_chunk(self):
+        ids = [aoi.id for aoi in self.complete] + [self.missing.id]
+        self.assertEqual(split_refresh_chunk(ids), ([aoi.id for aoi in self.complete], [self.missing.id]))
+
+    @mock.patch('biomass.api.tasks.batch_refresh_aois.apply_async')
+    @mock.patch('biomass.api.tasks.analyze_geojson_task.apply_async')
+    @mock.patch('biomass.api.tasks.refresh_current_year_batch_task.apply_async')
+    @mock.patch('biomass.api.tasks.TokenBucket.acquire')
+    @mock.patch('biomass.api.coordination.get_redis', return_value=DictRedis())
+    def test_one_token_and_one_task_per_group(self, _redis, acquire, batch_task, analyze, _reschedule):
+        with self.settings(BATCH_REFRESH_EE_BATCH_SIZE=2):
+            batch_refresh_aois('run')  # favoritos (ninguno) -> others
+            batch_refresh_aois('run')
+
+        groups = [call.kwargs['args'][0] for call in batch_task.call_args_list]
+        self.assertEqual(groups, [[self.complete[0].id, self.complete[1].id], [self.complete[2].id]])
+        self.assertEqual([call.kwargs['args'][0] for call in analyze.call_args_list], [self.missing.id])
+        self.assertEqual(acquire.call_count, 3)
+        self.assertEqual(AOI.objects.filter(status='analysing').count(), 4)
+
+    @mock.patch('biomass.api.tasks.uses_local_source', return_value=False)
+    @mock.patch('biomass.api.tasks.extract_feature_matrices_batch')
+    def test_batch_task_saves_current_year(self, extract_batch, _local):
+        task_id = str(uuid.uuid4())
+        ids = [aoi.id for aoi in self.complete]
+        AOI.objects.filter(id__in=ids).update(task_id=task_id, status='analysing')
+        rng = np.random.default_rng(0)
+        n_features = len(model.feature_names_in_)
+        extract_batch.return_value = {
+            ids[0]: rng.uniform(0, 1, (50, n_features)).astype(np.float32),
+            ids[1]: rng.uniform(0, 1, (50, n_features)).astype(np.float32),
+            ids[2]: None,
+        }
+
+        result = refresh_current_year_batch_task.apply(args=[ids], task_id=task_id).get()
+
+        self.assertEqual(extract_batch.call_count, 1)
+        self.assertEqual(sorted(extract_batch.call_args.args[0]), sorted(ids))
+        self.assertEqual([row['aoi_id'] for row in result['results']], ids[:2])
+        self.assertTrue(BiomassStats.objects.filter(aoi_id=ids[0], year=self.current_year).exists())
+        self.assertFalse(BiomassStats.objects.filter(aoi_id=ids[2], year=self.current_year).exists())
+        self.assertEqual(AOI.objects.filter(id__in=ids, status='completed').count(), 3)
+
+
+class S2ProjectionTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(gee_predictor, '_s2_projection', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('core.ml_models.gee_predictor.ee')
+    @mock.patch('core.ml_models.gee_predictor.initialize_ee')
+    @mock.patch('core.ml_models.gee_predictor.get_ee_client')
+    def test_projection_is_requested_once_per_process(self, get_client, _initialize, ee_mock):
+        get_client.return_value.get_info.return_value = {'crs': 'EPSG:32618', 'transform': [10, 0, 0, 0, -10, 0]}
+        first = gee_predictor.get_s2_projection()
+        second = gee_predictor.get_s2_projection()
+
+        self.assertIs(first, second)
+        self.assertEqual(get_client.return_value.get_info.call_count, 1)
+        ee_mock.Projection.assert_called_once_with('EPSG:32618', [10, 0, 0, 0, -10, 0])
+
+
+class TreeCompilerTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(0)
+        cls.X_train = rng.uniform(0, 1, (400, 6)).astype(np.float32)
+        cls.y_train = cls.X_train @ np.arange(1, 7) + rng.normal(0, 0.1, 400)
+        cls.X = rng.uniform(-0.2, 1.2, (1000, 6)).astype(np.float32)
+
+    def assert_matches_sklearn(self, estimator):
+        estimator.fit(self.X_train, self.y_train)
+        compiled = compile_model(estimator)
+        np.testing.assert_allclose(compiled.predict(self.X, chunk_size=128), estimator.predict(self.X), rtol=1e-6)
+        return compiled
+
+    def test_random_forest(self):
+        forest = RandomForestRegressor(n_estimators=15, max_depth=8, random_state=0)
+        compiled = self.assert_matches_sklearn(forest)
+        per_tree = np.stack([tree.predict(self.X) for tree in forest.estimators_], axis=1)
+        mean, std = compiled.predict_with_std(self.X, n_threads=2)
+        np.testing.assert_allclose(mean, per_tree.mean(axis=1), rtol=1e-6)
+        np.testing.assert_allclose(std, per_tree.std(axis=1), rtol=1e-5, atol=1e-9)
+
+    def test_gradient_boosting(self):
+        compiled = self.assert_matches_sklearn(GradientBoostingRegressor(n_estimators=20, random_state=0))
+        with self.assertRaises(ValueError):
+            compiled.predict_with_std(self.X)
+
+    def test_single_tree(self):
+        self.assert_matches_sklearn(DecisionTreeRegressor(max_depth=6, random_state=0))
+
+    def test_unsupported_model(self):
+        with self.assertRaises(ValueError):
+            compile_model(LinearRegression().fit(self.X_train, self.y_train))
+
+
+class UncertaintyTests(SimpleTestCase):
+
+    def test_forest_std_matches_per_tree_predictions(self):
+        rng = np.random.default_rng(1)
+        X = rng.uniform(0, 1, (200, 4))
+        forest = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, X.sum(axis=1))
+        mean, std = forest_predict_with_std(forest, X)
+        np.testing.assert_allclose(mean, forest.predict(X), rtol=1e-6)
+        self.assertTrue((std >= 0).all())
+
+    def test_models_without_trees_have_no_std(self):
+        X = np.arange(20, dtype=float).reshape(10, 2)
+        prediction, std = forest_predict_with_std(LinearRegression().fit(X, X[:, 0]), X)
+        self.assertEqual(prediction.shape, (10,))
+        self.assertIsNone(std)
+
+    def test_bootstrap_ci_contains_mean_and_is_reproducible(self):
+        values = np.random.default_rng(2).normal(100, 10, 500)
+        low, high = bootstrap_mean_ci(values)
+        self.assertLess(low, values.mean())
+        self.assertGreater(high, values.mean())
+        # Error estándar ≈ 10 / sqrt(500) ≈ 0.45: el IC 95% mide ≈ 1.8
+        self.assertAlmostEqual(high - low, 1.75, delta=0.3)
+        self.assertEqual((low, high), bootstrap_mean_ci(values))
+
+
+def export_row(aoi_id, year):
+    return (aoi_id, f"AOI {aoi_id}", 'completed', False, datetime(2026, 1, 1, tzinfo=timezone.utc),
+            7, year, 100.0 + year % 10, 47.0, None, None, None)
+
+
+class ExportStreamTests(SimpleTestCase):
+
+    def test_csv_stream_has_header_and_one_line_per_row(self):
+        lines = list(iter_csv(export_row(1, year) for year in (2020, 2021)))
+        self.assertEqual(len(lines), 3)
+        parsed = list(csv.reader(io.StringIO(''.join(lines))))
+        self.assertEqual(parsed[0], [name for name, _ in EXPORT_COLUMNS])
+        self.assertEqual(parsed[2][:2], ['1', 'AOI 1'])
+        self.assertEqual(parsed[2][6], '2021')
+
+    def test_parquet_stream_round_trips_in_row_groups(self):
+        import pyarrow.parquet as pq
+
+        rows = [export_row(aoi_id, year) for aoi_id in range(5) for year in range(2015, 2020)]
+        chunks = list(iter_parquet(iter(rows), batch_size=10))
+        # Un bloque por row group completo más el cierre del archivo
+        self.assertEqual(len(chunks), 3)
+
+        parquet = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        table = parquet.read()
+        self.assertEqual(table.num_rows, len(rows))
+        self.assertEqual(table.column_names, [name for name, _ in EXPORT_COLUMNS])
+        self.assertEqual(table.column('year').to_pylist(), [row[6] for row in rows])
+        self.assertEqual(table.column('std_mg').null_count, len(rows))
+
+    def test_empty_parquet_export_is_valid(self):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(b''.join(iter_parquet(iter([])))))
+        self.assertEqual(table.num_rows, 0)
+
+
+class ExportStatsViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', password='secret')
+        self.aois = [
+            AOI.objects.create(user=self.user, name=f"AOI {i}", geometry=square(-74 + i, 4, 0.1), status='completed')
+            for i in range(2)
+        ]
+        for aoi in self.aois:
+            add_stats(aoi, [2020, 2021])
+        other = User.objects.create_user('other', password='secret')
+        add_stats(AOI.objects.create(user=other, name='Ajeno', geometry=square(-70, 4, 0.1)), [2020])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export_csv(self, **params):
+        response = self.client.get('/api/biomass/export-stats/', params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.DictReader(io.StringIO(content)))
+
+    def test_exports_only_own_aois(self):
+        rows = self.export_csv()
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['aoi_name'] for row in rows}, {'AOI 0', 'AOI 1'})
+
+    def test_filters_by_aoi_ids(self):
+        rows = self.export_csv(aoi_ids=str(self.aois[1].id))
+        self.assertEqual([(row['aoi_id'], row['year']) for row in rows],
+                         [(str(self.aois[1].id), '2020'), (str(self.aois[1].id), '2021')])
+
+    def test_parquet_export(self):
+        import pyarrow.parquet as pq
+
+        response = self.client.get('/api/biomass/export-stats/', {'export_format': 'parquet'})
+        self.assertEqual(response.status_code, 200)
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 4)
+
+    def test_format_from_accept_header(self):
+        import pyarrow.parquet as pq
+
+        response = self.client.get('/api/biomass/export-stats/', HTTP_ACCEPT='application/vnd.apache.parquet')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        self.assertEqual(pq.read_table(io.BytesIO(b''.join(response.streaming_content))).num_rows, 4)
+
+        response = self.client.get('/api/biomass/export-stats/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        response = self.client.get('/api/biomass/export-stats/', {'aoi_ids': '1,a'}, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_rejects_unknown_format_and_bad_ids(self):
+        self.assertEqual(self.client.get('/api/biomass/export-stats/', {'export_format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/biomass/export-stats/', {'aoi_ids': '1,a'}).status_code, 400)
+
+
+class PortfolioAnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('portfolio', password='secret')
+        self.small = AOI.objects.create(user=self.user, name='Pequeño', geometry=square(-74, 4, 0.1))
+        self.large = AOI.objects.create(user=self.user, name='Grande', geometry=square(-73, 4, 0.2))
+        # Pequeño: 2020 y 2021 seguidos; Grande: 2020 y 2022 (sin 2021 no hay variación en 2022)
+        for aoi, year, carbon in [(self.small, 2020, 40.0), (self.small, 2021, 50.0),
+                                  (self.large, 2020, 60.0), (self.large, 2022, 30.0)]:
+            BiomassStats.objects.create(aoi=aoi, year=year, mean_mg=carbon / 0.47, mean_carbon=carbon)
+        other = User.objects.create_user('other-portfolio', password='secret')
+        add_stats(AOI.objects.create(user=other, name='Ajeno', geometry=square(-70, 4, 0.1)), [2020])
+        self.small.refresh_from_db()
+        self.large.refresh_from_db()
+
+    def check_totals(self):
+        totals = {row['year']: row for row in carbon_totals_by_year(self.user.id)}
+        self.assertEqual(sorted(totals), [2020, 2021, 2022])
+        self.assertEqual(totals[2020]['aoi_count'], 2)
+
+        small_ha, large_ha = self.small.area_m2 / 10000, self.large.area_m2 / 10000
+        self.assertAlmostEqual(totals[2020]['area_ha'], small_ha + large_ha, places=3)
+        self.assertAlmostEqual(totals[2020]['total_carbon'], 40 * small_ha + 60 * large_ha, places=1)
+        self.assertAlmostEqual(totals[2020]['weighted_mean_carbon'],
+                               (40 * small_ha + 60 * large_ha) / (small_ha + large_ha), places=6)
+
+        yoy = yoy_change_distribution(self.user.id)
+        self.assertEqual([row['year'] for row in yoy], [2021])
+        self.assertAlmostEqual(yoy[0]['mean_delta'], 10.0)
+        self.assertAlmostEqual(yoy[0]['p50_delta'], 10.0)
+        self.assertAlmostEqual(yoy[0]['total_carbon_delta'], 10 * small_ha, places=1)
+
+    def test_aggregates_weighted_by_geodesic_area(self):
+        self.assertGreater(self.large.area_m2, 3.9 * self.small.area_m2)
+        self.check_totals()
+
+    def test_materialized_view_matches_live_query(self):
+        refresh_materialized_view()
+        with self.settings(ANALYTICS_USE_MATERIALIZED_VIEW=True):
+            self.check_totals()
+
+    def test_endpoint_returns_only_own_portfolio(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/biomass/analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['year'] for row in response.json()['totals_by_year']], [2020, 2021, 2022])
+
+
+class AOISpatialSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('spatial', password='secret')
+        self.bogota = AOI.objects.create(user=self.user, name='Bogotá', geometry=square(-74.2, 4.5, 0.2))
+        self.cali = AOI.objects.create(user=self.user, name='Cali', geometry=square(-76.6, 3.3, 0.2))
+        other = User.objects.create_user('spatial-other', password='secret')
+        AOI.objects.create(user=other, name='Ajeno', geometry=square(-74.2, 4.5, 0.2))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.get('/api/biomass/aois/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_bbox_returns_overlapping_own_aois_without_geometry(self):
+        data = self.search(bbox='-75,4,-73,5')
+        self.assertEqual(data['count'], 1)
+        result = data['results'][0]
+        self.assertEqual(result['id'], self.bogota.id)
+        self.assertNotIn('geometry', result)
+        self.assertEqual(result['npoints'], 5)
+        self.assertGreater(result['area_m2'], 0)
+
+    def test_intersects_accepts_geojson_and_wkt(self):
+        point = {"type": "Point", "coordinates": [-76.5, 3.4]}
+        self.assertEqual([r['id'] for r in self.search(intersects=json.dumps(point))['results']], [self.cali.id])
+        self.assertEqual(self.search(intersects='POINT(-70 0)')['count'], 0)
+
+    def test_invalid_bbox_is_rejected(self):
+        for bbox in ('1,2,3', 'a,b,c,d'):
+            self.assertEqual(self.client.get('/api/biomass/aois/', {'bbox': bbox}).status_code, 400)
+
+    def test_without_spatial_params_lists_all_own_aois(self):
+        self.assertEqual(len(self.search()), 2)
+
+
+class StubLimiter:
+    """
+    Limitador que solo registra el resultado de cada llamada.
+    """
+
+    def __init__(self):
+        self.outcomes = []
+
+    def acquire(self):
+        return len(self.outcomes)
+
+    def release(self, lease, outcome):
+        self.outcomes.append(outcome)
+
+
+def stub_ee_call(*effects):
+    """
+    Callable que lanza (excepción) o devuelve cada efecto en orden.
+    """
+    return mock.Mock(side_effect=list(effects))
+
+
+class EEClassificationTests(SimpleTestCase):
+
+    def test_http_status_and_messages(self):
+        import httplib2
+        from ee.ee_exception import EEException
+        from googleapiclient.errors import HttpError
+
+        self.assertIsInstance(classify_ee_exception(HttpError(httplib2.Response({'status': 429}), b'')), EEQuotaError)
+        self.assertIsInstance(classify_ee_exception(HttpError(httplib2.Response({'status': 503}), b'')), EETransientError)
+        self.assertIsInstance(classify_ee_exception(EEException('Too many concurrent aggregations.')), EEQuotaError)
+        self.assertIsInstance(classify_ee_exception(EEException('Internal error.')), EETransientError)
+        self.assertIsInstance(classify_ee_exception(EEException('Image.load: Asset not found.')), EEPermanentError)
+        self.assertIsInstance(classify_ee_exception(ConnectionResetError('reset by peer')), EETransientError)
+
+    def test_other_exceptions_are_not_converted(self):
+        for exc in (ValueError('quota exceeded'), KeyError('features'), YearTimeLimitExceeded('límite')):
+            self.assertIs(classify_ee_exception(exc), exc)
+
+
+class EEClientRetryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.limiter = StubLimiter()
+        self.sleeps = []
+        self.client = EEClient(limiter=self.limiter, max_retries=2, sleep=self.sleeps.append)
+
+    def test_retries_transient_errors_until_success(self):
+        fn = stub_ee_call(ConnectionResetError('reset'), EETransientError('backend error'), 'ok')
+        self.assertEqual(self.client.call(fn), 'ok')
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(self.limiter.outcomes, ['other', 'other', 'ok'])
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_quota_errors_report_quota_and_give_up_after_max_retries(self):
+        fn = stub_ee_call(*[EEQuotaError('too many requests')] * 3)
+        with self.assertRaises(EEQuotaError):
+            self.client.call(fn)
+        self.assertEqual(self.limiter.outcomes, ['quota'] * 3)
+
+    def test_permanent_errors_are_not_retried(self):
+        from ee.ee_exception import EEException
+
+        with self.assertRaises(EEPermanentError):
+            self.client.call(stub_ee_call(EEException('Invalid argument')))
+        self.assertEqual(self.limiter.outcomes, ['other'])
+        self.assertEqual(self.sleeps, [])
+
+    def test_non_ee_exceptions_propagate_unchanged(self):
+        for exc in (TypeError('bug'), YearTimeLimitExceeded('límite')):
+            with self.assertRaises(type(exc)) as raised:
+                self.client.call(stub_ee_call(exc))
+            self.assertIs(raised.exception, exc)
+        # Sin reintentos y sin tocar el límite AIMD
+        self.assertEqual(self.limiter.outcomes, ['other', 'other'])
+        self.assertEqual(self.sleeps, [])
+
+
+@unittest.skipUnless(REDIS_AVAILABLE, "Redis no disponible")
+class AIMDLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.limiter = AIMDLimiter(get_redis, name=f"test:{uuid.uuid4().hex}", initial=4, minimum=1, maximum=6,
+                                   poll_interval=0.01)
+        self.addCleanup(get_redis().delete, self.limiter.leases_key, self.limiter.limit_key)
+
+    def test_additive_increase_multiplicative_decrease(self):
+        self.assertAlmostEqual(self.limiter.release(self.limiter.acquire(), 'ok'), 4.25)
+        self.assertAlmostEqual(self.limiter.release(self.limiter.acquire(), 'quota'), 2.125)
+        self.assertAlmostEqual(self.limiter.release(self.limiter.acquire(), 'other'), 2.125)
+        for _ in range(3):
+            self.limiter.release(self.limiter.acquire(), 'quota')
+        self.assertEqual(self.limiter.current_limit(), 1.0)
+
+    def test_limit_is_capped_at_maximum(self):
+        for _ in range(40):
+            self.limiter.release(self.limiter.acquire(), 'ok')
+        self.assertEqual(self.limiter.current_limit(), 6.0)
+
+    def test_acquire_waits_for_a_free_slot(self):
+        leases = [self.limiter.acquire() for _ in range(4)]
+        self.assertEqual(get_redis().zcard(self.limiter.leases_key), 4)
+        with mock.patch('core.ml_models.ee_client.time.sleep', side_effect=RuntimeError('esperando')):
+            with self.assertRaises(RuntimeError):
+                self.limiter.acquire()
+        self.limiter.release(leases[0], 'other')
+        self.limiter.acquire()
+
+
+def server_timing(response):
+    return dict(
+        (metric.split(';')[0], metric) for metric in response['Server-Timing'].split(', ')
+    )
+
+
+@override_settings(REQUEST_PROFILING=True, PROFILING_TRACEMALLOC=False, PROFILING_SAMPLE_RATE=0,
+                   PROFILING_HEADER_TOKEN='secreto')
+class RequestProfilingMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_disabled_middleware_is_not_used(self):
+        with self.settings(REQUEST_PROFILING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                RequestProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_adds_server_timing_and_keeps_previous_metrics(self):
+        def view(request):
+            response = HttpResponse()
+            response['Server-Timing'] = 'cache;desc="hit"'
+            return response
+
+        response = RequestProfilingMiddleware(view)(self.factory.get('/api/biomass/aois/'))
+        metrics = server_timing(response)
+        self.assertEqual(list(metrics), ['cache', 'db', 'app', 'total'])
+        self.assertIn('desc="0 queries"', metrics['db'])
+        self.assertEqual(response['Timing-Allow-Origin'], '*')
+        self.assertNotIn('profile', metrics)
+
+    def test_memory_peak_with_tracemalloc(self):
+        with self.settings(PROFILING_TRACEMALLOC=True):
+            middleware = RequestProfilingMiddleware(lambda request: HttpResponse(bytes(1 << 20)))
+        self.addCleanup(tracemalloc.stop)
+        response = middleware(self.factory.get('/'))
+        self.assertRegex(server_timing(response)['mem'], r'peak \d+ KiB')
+        # tracemalloc sigue activo para las peticiones concurrentes
+        self.assertTrue(tracemalloc.is_tracing())
+
+        # Otra petición está midiendo la memoria: esta omite la métrica
+        with middleware_module._memory_lock:
+            response = middleware(self.factory.get('/'))
+        self.assertNotIn('mem', server_timing(response))
+
+    async def test_async_view_is_awaited_without_adapter(self):
+        async def view(request):
+            return HttpResponse()
+
+        middleware = RequestProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(self.factory.get('/api/biomass/async/aois/'))
+        self.assertEqual(list(server_timing(response)), ['db', 'app', 'total'])
+
+    def test_profile_header_dumps_prof_file(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(PROFILING_DIR=directory):
+            middleware = RequestProfilingMiddleware(lambda request: HttpResponse())
+            middleware(self.factory.get('/api/biomass/aois/', HTTP_X_PROFILE='otro'))
+            self.assertEqual(os.listdir(directory), [])
+
+            response = middleware(self.factory.get('/api/biomass/aois/', HTTP_X_PROFILE='secreto'))
+            [filename] = os.listdir(directory)
+            self.assertRegex(filename, r'^\d+-GET-api_biomass_aois-\d+ms\.prof$')
+            self.assertIn(filename, server_timing(response)['profile'])
+
+
+@override_settings(REQUEST_PROFILING=True, PROFILING_TRACEMALLOC=False, PROFILING_SAMPLE_RATE=0)
+class RequestProfilingQueryCountTests(TestCase):
+
+    def test_counts_queries_of_the_request(self):
+        def view(request):
+            User.objects.count()
+            User.objects.filter(is_staff=True).exists()
+            return HttpResponse()
+
+        response = RequestProfilingMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('desc="2 queries"', server_timing(response)['db'])
+
+
+BUDGET_PASSWORD = 'query-budget-password'
+
+# Límite de consultas y de tamaño de respuesta (bytes, con el seed grande) por ruta.
+# Los conteos no deben crecer con el número de AOIs/años: si crecen hay un N+1.
+# Cada fila: (nombre, método, ruta, usuario, datos POST, máx. consultas, máx. bytes)
+ROUTE_BUDGETS = [
+    ('aois-list', 'get', '/api/biomass/aois/', 'owner', None, 2, 32 * 1024),
+    ('aois-twkb', 'get', '/api/biomass/aois/?geometry_format=twkb', 'owner', None, 2, 16 * 1024),
+    ('aois-bbox', 'get', '/api/biomass/aois/?bbox=-80,-5,-60,15', 'owner', None, 3, 16 * 1024),
+    ('aois-detail', 'get', '/api/biomass/aois/{aoi_id}/', 'owner', None, 2, 2 * 1024),
+    ('biomass-stats', 'get', '/api/biomass/biomass-stats/?aoi={aoi_id}', 'owner', None, 2, 4 * 1024),
+    ('data-stats', 'get', '/api/biomass/data-stats/?aoi_id={aoi_id}', 'owner', None, 3, 16 * 1024),
+    ('data-stats-shared', 'get', '/api/biomass/data-stats/?aoi_id={aoi_id}&share_token={share_token}', None, None, 2, 16 * 1024),
+    ('export-csv', 'get', '/api/biomass/export-stats/?export_format=csv', 'owner', None, 2, 64 * 1024),
+    ('export-parquet', 'get', '/api/biomass/export-stats/?export_format=parquet', 'owner', None, 2, 64 * 1024),
+    ('analytics', 'get', '/api/biomass/analytics/', 'owner', None, 3, 8 * 1024),
+    # AsyncResult de una tarea PENDING consulta el backend en cada acceso a state/info
+    ('task-status', 'get', '/api/biomass/task-status/{task_id}/', 'owner', None, 6, 2 * 1024),
+    ('queue-stats', 'get', '/api/biomass/queue-stats/', 'admin', None, 1, 1024),
+    ('data-stats-async', 'get', '/api/biomass/async/data-stats/?aoi_id={aoi_id}', 'owner', None, 3, 16 * 1024),
+    ('task-status-async', 'get', '/api/biomass/async/task-status/{task_id}/', 'owner', None, 6, 2 * 1024),
+    ('aois-async', 'get', '/api/biomass/async/aois/', 'owner', None, 2, 32 * 1024),
+    ('user-detail', 'get', '/api/auth/user/', 'owner', None, 1, 1024),
+    # Al final: cambian el share_token que usan las rutas compartidas
+    ('aois-share', 'post', '/api/biomass/aois/{aoi_id}/share/', 'owner', {}, 3, 1024),
+    ('aois-revoke-share', 'post', '/api/biomass/aois/{aoi_id}/revoke-share/', 'owner', {}, 3, 1024),
+    ('token-obtain', 'post', '/api/token/', None, {'username': '{username}', 'password': BUDGET_PASSWORD}, 2, 2 * 1024),
+]
+# Sin presupuesto: analyze-geojson, cancel y refresh (encolan o revocan tareas), registro,
+# cambio y recuperación de contraseña (crean usuarios o envían correos) y las rutas de
+# admin, allauth y Google
+
+
+def seed_budget_data(n_aois, n_years):
+    """
+    Usuario con n_aois AOIs completados y n_years años de estadísticas cada uno,
+    más un administrador. Devuelve los valores usados para armar las rutas.
+    """
+    suffix = uuid.uuid4().hex[:8]
+    owner = User.objects.create_user(f"budget-{suffix}", f"budget-{suffix}@example.com", BUDGET_PASSWORD)
+    admin = User.objects.create_user(f"budget-admin-{suffix}", password=BUDGET_PASSWORD, is_staff=True)
+
+    task_id = str(uuid.uuid4())
+    aois = AOI.objects.bulk_create([
+        AOI(user=owner, name=f"AOI {i}", geometry=square(-75 + (i % 10) * 0.5, 2 + (i // 10) * 0.5, 0.2),
+            status='completed', task_id=task_id if i == 0 else str(uuid.uuid4()),
+            share_token=uuid.uuid4().hex if i == 0 else None)
+        for i in range(n_aois)
+    ])
+    BiomassStats.objects.bulk_create([
+        BiomassStats(aoi=aoi, year=2019 + year, mean_mg=100.0 + year, mean_carbon=47.0 + year * 0.47,
+                     std_mg=5.0, ci_low_mg=98.0 + year, ci_high_mg=102.0 + year)
+        for aoi in aois for year in range(n_years)
+    ])
+    return {
+        'users': {'owner': owner, 'admin': admin},
+        'values': {'aoi_id': aois[0].id, 'share_token': aois[0].share_token,
+                   'task_id': task_id, 'username': owner.username},
+    }
+
+
+def run_budget_route(client, route, seeded):
+    """
+    Ejecuta la ruta y devuelve (status, bytes de respuesta, consultas SQL).
+    Las respuestas en streaming se consumen dentro de la medición.
+    """
+    name, method, path, user, data, _, _ = route
+    values = seeded['values']
+    headers = {}
+    if user:
+        headers['HTTP_AUTHORIZATION'] = f"Bearer {RefreshToken.for_user(seeded['users'][user]).access_token}"
+    if data is not None:
+        data = {key: value.format(**values) for key, value in data.items()}
+
+    with CaptureQueriesContext(connection) as queries:
+        if method == 'post':
+            response = client.post(path.format(**values), data, content_type='application/json', **headers)
+        else:
+            response = client.get(path.format(**values), **headers)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+    return response.status_code, size, [query['sql'] for query in queries.captured_queries]
+
+
+# Sin Redis: caché en memoria y profundidad de colas fija
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch('biomass.api.views.queue_depths', return_value={})
+class QueryBudgetTests(TestCase):
+
+    def test_routes_stay_within_query_and_size_budgets(self, _queue_depths):
+        results = {}
+        for size, (n_aois, n_years) in {'small': (3, 3), 'large': (30, 7)}.items():
+            seeded = seed_budget_data(n_aois, n_years)
+            client = Client()
+            for route in ROUTE_BUDGETS:
+                results.setdefault(route[0], {})[size] = run_budget_route(client, route, seeded)
+
+        for name, _, _, _, _, max_queries, max_bytes in ROUTE_BUDGETS:
+            with self.subTest(route=name):
+                small_status, _, small_sql = results[name]['small']
+                status, size, sql = results[name]['large']
+                queries = '\n'.join(sql)
+                self.assertLess(small_status, 400)
+                self.assertLess(status, 400)
+                self.assertLessEqual(len(sql), max_queries, queries)
+                self.assertEqual(len(sql), len(small_sql), f"Las consultas crecen con los datos:\n{queries}")
+                self.assertLessEqual(size, max_bytes)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+
+    def render(self, data):
+        return json.loads(ORJSONRenderer().render(data))
+
+    def test_numpy_values_and_int_keys(self):
+        data = {2020: np.float32(1.5), 'values': np.arange(3, dtype=np.float64), 'count': np.int64(7),
+                'strided': np.arange(6.0)[::2]}
+        self.assertEqual(self.render(data), {'2020': 1.5, 'values': [0.0, 1.0, 2.0], 'count': 7,
+                                             'strided': [0.0, 2.0, 4.0]})
+
+    @override_settings(JSON_FLOAT_PRECISION=None)
+    def test_floats_are_not_rounded(self):
+        self.assertEqual(self.render({'mean': 123.456789012345}), {'mean': 123.456789012345})
+
+    @override_settings(JSON_FLOAT_PRECISION=2)
+    def test_floats_are_rounded_when_precision_is_set(self):
+        data = {2020: {'mean': 123.456789, 'values': np.array([0.125, 1.987654]), 'std': np.float32(0.33333),
+                       'series': [(1.005, 7)], 'count': np.int64(7)}}
+        self.assertEqual(self.render(data), {'2020': {'mean': 123.46, 'values': [0.12, 1.99], 'std': 0.33,
+                                                      'series': [[1.0, 7]], 'count': 7}})
+
+    def test_python_types_like_drf(self):
+        from decimal import Decimal
+        from django.utils.translation import gettext_lazy
+
+        data = {'decimal': Decimal('1.25'), 'lazy': gettext_lazy('hola'), 'nan': float('nan'), 'set': {1}}
+        self.assertEqual(self.render(data), {'decimal': 1.25, 'lazy': 'hola', 'nan': None, 'set': [1]})
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_parser_round_trip_and_errors(self):
+        from rest_framework.exceptions import ParseError
+
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(b'{"a": [1, 2.5]}')), {'a': [1, 2.5]})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"a": '))
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def decode_twkb(data):
+    """
+    Decodificador TWKB mínimo (Polygon/MultiPolygon sin metadatos) para las pruebas.
+    """
+    geom_type, precision = data[0] & 0x0F, data[0] >> 4
+    precision = (precision >> 1) ^ -(precision & 1)
+    offset, x, y, polygons = 2, 0, 0, []
+    n_polygons = 1
+    if geom_type == 6:
+        n_polygons, offset = read_varint(data, offset)
+    for _ in range(n_polygons):
+        n_rings, offset = read_varint(data, offset)
+        rings = []
+        for _ in range(n_rings):
+            n_points, offset = read_varint(data, offset)
+            ring = []
+            for _ in range(n_points):
+                dx, offset = read_varint(data, offset)
+                dy, offset = read_varint(data, offset)
+                x += (dx >> 1) ^ -(dx & 1)
+                y += (dy >> 1) ^ -(dy & 1)
+                ring.append((x / 10 ** precision, y / 10 ** precision))
+            rings.append(ring)
+        polygons.append(rings)
+    return geom_type, precision, polygons
+
+
+class GeometryFormatsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.polygon = Polygon(
+            ((-74.1234567, 4.1), (-73.9, 4.1), (-73.9, 4.3765432), (-74.1234567, 4.1)),
+            ((-74.0, 4.15), (-73.95, 4.15), (-73.95, 4.2), (-74.0, 4.15)),
+            srid=4326,
+        )
+        self.multipolygon = MultiPolygon(self.polygon, square(-72, 3, 0.5), srid=4326)
+
+    def assertRingsAlmostEqual(self, decoded, geometry, precision):
+        expected = [[ring.coords for ring in polygon] for polygon in
+                    ([geometry] if geometry.geom_type == 'Polygon' else list(geometry))]
+        self.assertEqual([len(rings) for rings in decoded], [len(rings) for rings in expected])
+        for rings, expected_rings in zip(decoded, expected):
+            for ring, expected_ring in zip(rings, expected_rings):
+                np.testing.assert_allclose(np.asarray(ring), np.asarray(expected_ring)[:, :2],
+                                           atol=0.5 * 10 ** -precision + 1e-12)
+
+    def test_zigzag_and_varints(self):
+        self.assertEqual(_zigzag([0, -1, 1, -2, 2]).tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(_varints([0, 127, 128, 300]), bytes([0x00, 0x7F, 0x80, 0x01, 0xAC, 0x02]))
+        self.assertEqual(_varints([]), b'')
+
+    def test_delta_round_trip(self):
+        for geometry in (self.polygon, self.multipolygon):
+            for precision in (0, 3, 6):
+                encoded = encode_geometry(geometry, 'delta', precision)
+                self.assertEqual(encoded['type'], geometry.geom_type)
+                self.assertRingsAlmostEqual(decode_delta(json.loads(json.dumps(encoded))), geometry, precision)
+
+    def test_twkb_round_trip(self):
+        for geometry, type_code in ((self.polygon, 3), (self.multipolygon, 6)):
+            for precision in (0, 5, 7):
+                data = base64.b64decode(encode_geometry(geometry, 'twkb', precision))
+                geom_type, decoded_precision, polygons = decode_twkb(data)
+                self.assertEqual((geom_type, decoded_precision), (type_code, precision))
+                self.assertRingsAlmostEqual(polygons, geometry, precision)
+
+    def test_empty_twkb(self):
+        self.assertEqual(to_twkb(Polygon(srid=4326), 6), bytes([0xC3, 0x10]))
+
+    def test_quantized_geojson_and_wkb(self):
+        quantized = encode_geometry(self.polygon, 'geojson-q', 3)
+        self.assertEqual(quantized['coordinates'][0][0], [-74.123, 4.1])
+        wkb = GEOSGeometry(memoryview(base64.b64decode(encode_geometry(self.polygon, 'wkb', None))))
+        self.assertTrue(wkb.equals_exact(self.polygon))
+        self.assertEqual(encode_geometry(self.polygon, 'geojson', None), self.polygon.json)
+        self.assertIsNone(encode_geometry(None, 'twkb', 6))
+
+
+@override_settings(GEOMETRY_PRECISION=6)
+class RequestedGeometryFormatTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_query_params_and_accept_header(self):
+        self.assertEqual(requested_geometry_format(self.factory.get('/')), (None, None))
+        self.assertEqual(requested_geometry_format(self.factory.get('/', {'geometry_format': 'twkb'})), ('twkb', 6))
+        request = self.factory.get('/', HTTP_ACCEPT='application/json; geometry=delta; precision=4')
+        self.assertEqual(requested_geometry_format(request), ('delta', 4))
+        request = self.factory.get('/', {'geometry_format': 'wkb', 'geometry_precision': '2'},
+                                   HTTP_ACCEPT='application/json; geometry=delta; precision=4')
+        self.assertEqual(requested_geometry_format(request), ('wkb', 2))
+
+    def test_invalid_values(self):
+        from rest_framework.exceptions import ValidationError
+
+        for params in ({'geometry_format': 'kml'}, {'geometry_format': 'twkb', 'geometry_precision': 'x'},
+                       {'geometry_format': 'twkb', 'geometry_precision': '8'}):
+            with self.assertRaises(ValidationError):
+                requested_geometry_format(self.factory.get('/', params))
+
+
+class FeatureSourceTests(SimpleTestCase):
+
+    def test_unknown_sources_are_rejected(self):
+        with self.assertRaises(ValueError):
+            extract_year_features({}, 2024, 'synthetic')
+        with self.settings(FEATURE_SOURCE='synthetic'), self.assertRaises(ValueError):
+            extract_year_features({}, 2024)
+
+    @mock.patch('biomass.api.tasks.extract_feature_matrix', return_value=None)
+    def test_ee_source_skips_local_mosaics(self, extract):
+        with mock.patch('biomass.api.tasks.local_feature_source') as local:
+            self.assertIsNone(extract_year_features({}, 2024, 'ee'))
+        local.covers.assert_not_called()
+        extract.assert_called_once()
+
+
+class PeriodSeriesTests(SimpleTestCase):
+
+    def test_period_ranges(self):
+        months = period_ranges(2024, 'month')
+        self.assertEqual(len(months), 12)
+        self.assertEqual(months[0], (1, '2024-01-01', '2024-02-01'))
+        self.assertEqual(months[-1], (12, '2024-12-01', '2025-01-01'))
+        self.assertEqual(period_ranges(2024, 'season'), [
+            (1, '2024-01-01', '2024-04-01'), (2, '2024-04-01', '2024-07-01'),
+            (3, '2024-07-01', '2024-10-01'), (4, '2024-10-01', '2025-01-01'),
+        ])
+        self.assertEqual(period_prefix(3), 'p03_')
+
+    @mock.patch('core.ml_models.gee_predictor.build_period_image')
+    @mock.patch('core.ml_models.gee_predictor.to_ee_geometry')
+    @mock.patch('core.ml_models.gee_predictor.ee')
+    @mock.patch('core.ml_models.gee_predictor.get_ee_client')
+    def test_extract_period_features_splits_by_prefix(self, get_client, _ee, _geometry, _image):
+        # Trimestre 1 con un píxel nublado, trimestre 2 nublado, 3 y 4 sin imágenes
+        nodata = gee_predictor.PERIOD_NODATA
+        get_client.return_value.get_info.return_value = {
+            'bands': ['p01_B2', 'p01_ndvi', 'p02_B2', 'p02_ndvi', 'dem', 'slope'],
+            'columns': [[0.1, nodata], [0.5, nodata], [nodata, nodata], [nodata, nodata],
+                        [100.0, 120.0], [2.0, 3.0]],
+        }
+
+        results = gee_predictor.extract_period_features({}, 2024, 'season', ['ndvi', 'B2', 'slope', 'dem'])
+        self.assertEqual(sorted(results), [1, 2, 3, 4])
+        self.assertEqual(results[1].dtype, np.float32)
+        np.testing.assert_allclose(results[1], [[0.5, 0.1, 2.0, 100.0]], rtol=1e-6)
+        self.assertIsNone(results[2])
+        self.assertIsNone(results[3])
+        self.assertEqual(get_client.return_value.get_info.call_count, 1)
+
+        get_client.return_value.get_info.return_value = {'bands': ['dem', 'slope'], 'columns': [[], []]}
+        results = gee_predictor.extract_period_features({}, 2024, 'season', ['B2', 'dem'])
+        self.assertEqual(results, {1: None, 2: None, 3: None, 4: None})
+
+
+class PeriodSeriesTaskTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('seasons')
+        self.aoi = AOI.objects.create(user=user, name='s', geometry=square(-74, 4, 0.1), status='completed')
+
+    def test_years_to_analyze_skips_existing_except_current(self):
+        current_year = datetime.now().year
+        BiomassPeriodStats.objects.create(aoi=self.aoi, year=FIRST_YEAR, granularity='month', period=1,
+                                          mean_mg=1, mean_carbon=0.47, n_samples=1)
+        BiomassPeriodStats.objects.create(aoi=self.aoi, year=current_year, granularity='month', period=1,
+                                          mean_mg=1, mean_carbon=0.47, n_samples=1)
+        years = period_years_to_analyze(self.aoi, 'month')
+        self.assertNotIn(FIRST_YEAR, years)
+        self.assertEqual(years[-1], current_year)
+        self.assertIn(FIRST_YEAR, period_years_to_analyze(self.aoi, 'season'))
+
+    @mock.patch('biomass.api.tasks.extract_period_features')
+    def test_one_prediction_per_year_saved_per_period(self, extract):
+        rng = np.random.default_rng(0)
+
+        def samples(n):
+            return rng.random((n, len(model.feature_names_in_)), dtype=np.float32)
+
+        extract.return_value = {1: samples(5), 2: None, 3: samples(3), 4: None}
+        with mock.patch('biomass.api.tasks.predict_biomass', wraps=tasks_module.predict_biomass) as predict:
+            result = analyze_period_series_task.apply(args=[self.aoi.id],
+                                                      kwargs={'granularity': 'season', 'years': [2023]}).get()
+        self.assertEqual(predict.call_count, 1)
+        self.assertEqual([(r['year'], r['period']) for r in result['results']], [(2023, 1), (2023, 3)])
+        stats = BiomassPeriodStats.objects.filter(aoi=self.aoi, granularity='season').order_by('period')
+        self.assertEqual([(stat.period, stat.n_samples) for stat in stats], [(1, 5), (3, 3)])
+
+
+class RasterizeRingsTests(SimpleTestCase):
+
+    def test_square_with_hole(self):
+        outer = np.array([[1, 1], [9, 1], [9, 9], [1, 9], [1, 1]], dtype=float)
+        hole = np.array([[4, 4], [6, 4], [6, 6], [4, 6], [4, 4]], dtype=float)
+        mask = rasterize_rings([outer, hole], 10, 10)
+        self.assertEqual(mask.sum(), 8 * 8 - 2 * 2)
+        self.assertTrue(mask[1, 1])
+        self.assertFalse(mask[0, 0])
+        self.assertFalse(mask[5, 5])
+
+    def test_clips_to_grid(self):
+        ring = np.array([[-5, -5], [20, -5], [20, 20], [-5, 20], [-5, -5]], dtype=float)
+        self.assertTrue(rasterize_rings([ring], 4, 6).all())
+
+
+class LocalFeatureSourceTests(SimpleTestCase):
+
+    BANDS = ['B2', 'B3', 'B4', 'B8', 'B11', 'dem']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.write_stack(2024)
+        self.source = LocalFeatureSource([{'name': 'test', 'bbox': [-74.1, 3.9, -73.9, 4.1], 'path': self.directory}])
+        self.aoi = json.loads(square(-74.05, 3.95, 0.1).json)
+
+    def write_stack(self, year):
+        # Stack sobre -74.1..-73.9 / 3.9..4.1 en la grilla de EE (EPSG:3857, 100 m)
+        x0, y0 = lonlat_to_mercator(-74.1, 4.1)
+        x1, y1 = lonlat_to_mercator(-73.9, 3.9)
+        n_rows, n_cols = int((y0 - y1) // 100), int((x1 - x0) // 100)
+        data = np.empty((len(self.BANDS), n_rows, n_cols), dtype=np.int16)
+        for i, value in enumerate([1000, 1500, 2000, 4000, 3000, 500]):
+            data[i] = value
+        data[0, :, :10] = 0  # nodata en el borde oeste
+        np.save(os.path.join(self.directory, f'{year}.npy'), data)
+        with open(os.path.join(self.directory, f'{year}.json'), 'w') as f:
+            json.dump({'bands': self.BANDS, 'transform': [x0, 100, 0, y0, 0, -100], 'scale': 0.0001, 'nodata': 0}, f)
+
+    def test_covers_only_inside_region_and_year(self):
+        self.assertTrue(self.source.covers(self.aoi, 2024))
+        self.assertFalse(self.source.covers(self.aoi, 2023))
+        self.assertFalse(self.source.covers(json.loads(square(-74.5, 3.95, 0.1).json), 2024))
+        with self.assertRaises(ValueError):
+            self.source.extract(self.aoi, 2023)
+
+    def test_extract_matches_ee_columns(self):
+        df = self.source.extract(self.aoi, 2024, num_pixels=200)
+        self.assertEqual(len(df), 200)
+        self.assertEqual(set(df.columns), {'B2', 'B3', 'B4', 'B8', 'B11', 'ndvi', 'mndwi', 'ndbi', 'evi', 'bsi',
+                                           'dem', 'slope'})
+        np.testing.assert_allclose(df['B8'], 0.4)
+        np.testing.assert_allclose(df['ndvi'], (0.4 - 0.2) / (0.4 + 0.2))
+        np.testing.assert_allclose(df['slope'], 0.0)
+        # Misma semilla, mismos píxeles
+        self.assertTrue(df.equals(self.source.extract(self.aoi, 2024, num_pixels=200)))
+
+    def test_nodata_pixels_are_dropped(self):
+        west = json.loads(square(-74.1, 3.95, 0.005).json)
+        self.assertIsNone(self.source.extract(west, 2024))
+
+    def test_stack_added_later_is_picked_up(self):
+        self.assertFalse(self.source.covers(self.aoi, 2023))
+        self.write_stack(2023)
+        self.assertTrue(self.source.covers(self.aoi, 2023))
+
+
+class ColumnarExtractionTests(SimpleTestCase):
+
+    def test_columns_to_matrix(self):
+        X = columns_to_matrix([[1.0, 2.0, 3.0], [4, 5, 6]])
+        self.assertEqual(X.dtype, np.float32)
+        self.assertTrue(X.flags['C_CONTIGUOUS'])
+        np.testing.assert_array_equal(X, np.array([[1, 4], [2, 5], [3, 6]], dtype=np.float32))
+        self.assertEqual(columns_to_matrix([]).shape, (0, 0))
+
+    @mock.patch('core.ml_models.gee_predictor.build_stacked_image')
+    @mock.patch('core.ml_models.gee_predictor.ee')
+    @mock.patch('core.ml_models.gee_predictor.get_ee_client')
+    def test_extract_feature_matrix_keeps_feature_order(self, get_client, _ee, stacked):
+        get_client.return_value.get_info.return_value = {'list': [[0.1, 0.2], [30.0, 40.0]]}
+        X = gee_predictor.extract_feature_matrix({}, 2024, ['ndvi', 'dem'])
+        reduce_columns = stacked.return_value.sample.return_value.reduceColumns
+        self.assertEqual(reduce_columns.call_args.kwargs['selectors'], ['ndvi', 'dem'])
+        np.testing.assert_allclose(X, [[0.1, 30.0], [0.2, 40.0]], rtol=1e-6)
+
+        get_client.return_value.get_info.return_value = {'list': [[], []]}
+        self.assertIsNone(gee_predictor.extract_feature_matrix({}, 2024, ['ndvi', 'dem']))
+
+
+class MapZoomTests(SimpleTestCase):
+
+    def test_zoom_decreases_with_area(self):
+        self.assertEqual(map_zoom(None), 15)
+        self.assertEqual(map_zoom(0.5e6), 15)
+        self.assertEqual(map_zoom(5e6), 14)
+        self.assertEqual(map_zoom(50e6), 12)
+        self.assertEqual(map_zoom(500e6), 11)
+        self.assertEqual(map_zoom(5000e6), 9)
+        self.assertEqual(map_zoom(50000e6), 8)
+
+
+class AOIDerivedGeometryTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('derived')
+        self.aoi = AOI.objects.create(user=user, name='d', geometry=square(-74, 4, 0.1))
+        self.aoi.refresh_from_db()
+
+    def test_generated_columns(self):
+        # 0.1° x 0.1° a 4°N sobre el elipsoide: ~11.06 km x ~11.10 km
+        self.assertAlmostEqual(self.aoi.area_m2 / 1e6, 122.8, delta=1.2)
+        self.assertAlmostEqual(self.aoi.centroid.x, -73.95)
+        self.assertAlmostEqual(self.aoi.centroid.y, 4.05)
+        self.assertEqual(self.aoi.bbox.extent, (-74.0, 4.0, -73.9, 4.1))
+        self.assertEqual(self.aoi.npoints, 5)
+
+    def test_columns_follow_geometry_updates(self):
+        self.aoi.geometry = circle(40, radius=0.01)
+        self.aoi.save()
+        self.aoi.refresh_from_db()
+        self.assertEqual(self.aoi.npoints, 41)
+        self.assertLess(self.aoi.area_m2, 4e6)
+        self.assertAlmostEqual(self.aoi.centroid.x, 0, places=6)
+
+    def test_data_stats_uses_generated_columns(self):
+        add_stats(self.aoi, [2020, 2021])
+        data = build_data_stats(self.aoi, list(BiomassStats.objects.filter(aoi=self.aoi)))
+        self.assertEqual(data['zoom'], 11)
+        self.assertAlmostEqual(data['centroid_coords'][0], -73.95)
+
+
+@override_settings(ANALYSIS_MAX_IN_FLIGHT=2, ANALYSIS_IN_FLIGHT_STALE_AFTER=3600, ANALYSIS_PRIORITY_LEVELS=10)
+class AnalysisInFlightTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('busy-user')
+        self.factory = RequestFactory()
+
+    def add_aoi(self, origin='user', started_ago=timedelta(minutes=5), status='analysing'):
+        return AOI.objects.create(
+            user=self.user, name='a', geometry=square(-74, 4, 0.1), status=status, analysis_origin=origin,
+            analysis_started_at=django_now() - started_ago if started_ago is not None else None,
+        )
+
+    def post_allowed(self):
+        request = self.factory.post('/api/biomass/analyze-geojson/')
+        request.user = self.user
+        return ConcurrentAnalysisThrottle().allow_request(request, None)
+
+    def test_maintenance_stale_and_finished_analyses_do_not_count(self):
+        self.add_aoi(origin='refresh')
+        self.add_aoi(started_ago=timedelta(hours=2))
+        self.add_aoi(started_ago=None)
+        self.add_aoi(status='completed')
+        first = self.add_aoi()
+        self.assertTrue(self.post_allowed())
+        self.assertEqual(fair_share_priority(self.user.id), 1)
+        self.assertEqual(fair_share_priority(self.user.id, first.id), 0)
+
+        self.add_aoi()
+        self.assertFalse(self.post_allowed())
+        self.assertEqual(fair_share_priority(self.user.id, first.id), 1)
+        self.assertEqual(ConcurrentAnalysisThrottle().wait(), settings.ANALYSIS_IN_FLIGHT_RETRY_AFTER)
+
+    def test_only_post_is_limited(self):
+        self.add_aoi()
+        self.add_aoi()
+        request = self.factory.get('/api/biomass/aois/')
+        request.user = self.user
+        self.assertTrue(ConcurrentAnalysisThrottle().allow_request(request, None))
+
+    @mock.patch('biomass.api.tasks.analyze_geojson_task.apply_async')
+    def test_user_refresh_counts_and_maintenance_refresh_does_not(self, apply_async):
+        aoi = self.add_aoi(status='completed', started_ago=None)
+        enqueue_refresh(aoi.id, origin='refresh')
+        self.assertEqual(apply_async.call_args.kwargs['priority'], 9)
+        self.assertTrue(self.post_allowed())
+
+        AOI.objects.filter(id=aoi.id).update(status='completed')
+        enqueue_refresh(aoi.id)
+        aoi.refresh_from_db()
+        self.assertEqual(aoi.analysis_origin, 'user')
+        self.assertEqual(apply_async.call_args.kwargs['priority'], 0)
+
+
+    @mock.patch('biomass.api.views.acquire_analysis', return_value=None)
+    @mock.patch('biomass.api.views.analyze_period_series_task.apply_async')
+    @mock.patch('biomass.api.tasks.analyze_geojson_task.apply_async')
+    def test_every_submission_path_gets_the_same_priority(self, apply_async, period_apply_async, _acquire):
+        # Un análisis del usuario ya en curso: lo que se encola ahora sale un nivel más abajo
+        self.add_aoi()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/biomass/analyze-geojson/', {'geojson': geojson_upload(square(-70, 4, 0.1))},
+                                   format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(apply_async.call_args.kwargs['priority'], 1)
+        AOI.objects.filter(id=response.json()['aoi_id']).update(status='completed')
+
+        aoi = self.add_aoi(status='completed', started_ago=None)
+        response = client.post(f'/api/biomass/aois/{aoi.id}/period-series/', {'granularity': 'season'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(period_apply_async.call_args.kwargs['priority'], 1)
+
+        enqueue_refresh(aoi.id)
+        self.assertEqual(apply_async.call_args.kwargs['priority'], 1)
+
+    @mock.patch('biomass.api.throttles.TokenBucket.try_acquire', return_value=0)
+    def test_rejected_by_concurrency_without_spending_rate_tokens(self, try_acquire):
+        self.add_aoi()
+        self.add_aoi()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/biomass/analyze-geojson/', {'geojson': geojson_upload(square(-70, 4, 0.1))},
+                               format='multipart')
+        self.assertEqual(response.status_code, 429)
+        try_acquire.assert_not_called()
+
+
+class AnalysisRateThrottleTests(SimpleTestCase):
+
+    def request(self, method='post'):
+        request = getattr(RequestFactory(), method)('/api/biomass/analyze-geojson/')
+        request.user = mock.Mock(id=1)
+        return request
+
+    @mock.patch('biomass.api.throttles.TokenBucket.try_acquire', return_value=4.5)
+    def test_empty_bucket_blocks_with_wait(self, _acquire):
+        throttle = AnalysisRateThrottle()
+        self.assertFalse(throttle.allow_request(self.request(), None))
+        self.assertEqual(throttle.wait(), 4.5)
+        self.assertTrue(AnalysisRateThrottle().allow_request(self.request('get'), None))
+
+    @mock.patch('biomass.api.throttles.TokenBucket.try_acquire', side_effect=redis.ConnectionError)
+    def test_fails_open_without_redis(self, _acquire):
+        self.assertTrue(AnalysisRateThrottle().allow_request(self.request(), None))
@@ -0,0 +1,233 @@
+"""
+Cliente para las llamadas síncronas a Earth Engine (getInfo).
+
+- Clasifica los errores de EE en cuota/límite de tasa, transitorios y permanentes.
+- Reintenta cuota y transitorios con backoff exponencial con jitter.
+- Limita las llamadas concurrentes de todos los workers con un limitador AIMD
+  compartido en Redis: el límite sube de a poco con cada éxito y se reduce a la
+  mitad con cada error de cuota, buscando el máximo que EE acepta.
+
+La llamada a EE es un callable cualquiera, así que se puede probar con un EE falso.
+Solo se clasifican las excepciones de EE, HTTP y red (EE_CALL_EXCEPTIONS): el
+resto (errores de programación, límites de tiempo de la tarea) se propaga tal cual.
+"""
+import random
+import socket
+import time
+import uuid
+
+
+class EEError(Exception):
+    """Error de Earth Engine ya clasificado."""
+
+
+class EEQuotaError(EEError):
+    """Límite de concurrencia o de tasa: reintentar más tarde con menos carga."""
+
+
+class EETransientError(EEError):
+    """Fallo temporal del servicio o de la red: reintentar."""
+
+
+class EEPermanentError(EEError):
+    """Error del cálculo o de la petición: reintentar no sirve."""
+
+
+QUOTA_MESSAGES = (
+    'too many concurrent aggregations',
+    'too many requests',
+    'quota exceeded',
+    'rate limit',
+    'resource exhausted',
+)
+
+TRANSIENT_MESSAGES = (
+    'internal error',
+    'service unavailable',
+    'backend error',
+    'deadline exceeded',
+    'connection reset',
+    'temporarily unavailable',
+)
+
+
+def _optional_exception(module, name):
+    try:
+        return getattr(__import__(module, fromlist=[name]), name)
+    except (ImportError, AttributeError):
+        return None
+
+
+def _available(*exceptions):
+    return tuple(exc for exc in exceptions if exc is not None)
+
+
+# Fallos de red: siempre transitorios. Las librerías que no estén instaladas
+# simplemente no aportan su clase
+NETWORK_EXCEPTIONS = _available(
+    ConnectionError,
+    TimeoutError,
+    socket.gaierror,
+    _optional_exception('httplib2', 'HttpLib2Error'),
+    _optional_exception('requests.exceptions', 'ConnectionError'),
+    _optional_exception('requests.exceptions', 'Timeout'),
+)
+
+# Excepciones que puede lanzar una llamada a EE (las que se clasifican y reintentan)
+EE_CALL_EXCEPTIONS = _available(
+    EEError,
+    _optional_exception('ee.ee_exception', 'EEException'),
+    _optional_exception('googleapiclient.errors', 'HttpError'),
+    _optional_exception('requests.exceptions', 'HTTPError'),
+) + NETWORK_EXCEPTIONS
+
+
+def classify_ee_exception(exc):
+    """
+    Convierte una excepción de EE (o de HTTP/red) en la subclase de EEError que
+    corresponda, según el código HTTP o el mensaje. Cualquier otra excepción
+    se devuelve sin cambios para que el llamador la propague.
+    """
+    if isinstance(exc, EEError) or not isinstance(exc, EE_CALL_EXCEPTIONS):
+        return exc
+
+    # googleapiclient: exc.resp.status; requests: exc.response.status_code
+    status = (getattr(getattr(exc, 'resp', None), 'status', None)
+              or getattr(getattr(exc, 'response', None), 'status_code', None))
+    message = str(exc).lower()
+    if status == 429 or any(text in message for text in QUOTA_MESSAGES):
+        return EEQuotaError(str(exc))
+    if (status is not None and int(status) >= 500) or any(text in message for text in TRANSIENT_MESSAGES):
+        return EETransientError(str(exc))
+    if isinstance(exc, NETWORK_EXCEPTIONS):
+        return EETransientError(str(exc))
+    return EEPermanentError(str(exc))
+
+
+# Lua: adquirir un lugar si hay menos leases vigentes que el límite actual
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('zremrangebyscore', KEYS[1], '-inf', now)
+local limit = tonumber(redis.call('get', KEYS[2]) or ARGV[3])
+if redis.call('zcard', KEYS[1]) < math.floor(limit) then
+    redis.call('zadd', KEYS[1], now + tonumber(ARGV[4]), ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Lua: liberar el lugar y ajustar el límite (aumento aditivo / reducción multiplicativa)
+_RELEASE_SCRIPT = """
+redis.call('zrem', KEYS[1], ARGV[1])
+local limit = tonumber(redis.call('get', KEYS[2]) or ARGV[3])
+if ARGV[2] == 'quota' then
+    limit = math.max(tonumber(ARGV[4]), limit * tonumber(ARGV[6]))
+elseif ARGV[2] == 'ok' then
+    limit = math.min(tonumber(ARGV[5]), limit + tonumber(ARGV[7]) / limit)
+end
+redis.call('set', KEYS[2], limit)
+return tostring(limit)
+"""
+
+
+class AIMDLimiter:
+    """
+    Límite de llamadas concurrentes a EE compartido por todos los workers.
+    Cada llamada toma un lease con vencimiento (si un worker muere, su lugar
+    se libera solo). Cada éxito suma increase/límite (≈ +increase por ventana)
+    y cada error de cuota multiplica el límite por decrease.
+    """
+
+    def __init__(self, redis_factory, name='ee', initial=4, minimum=1, maximum=40,
+                 increase=1.0, decrease=0.5, lease_seconds=600, poll_interval=0.5):
+        self.redis_factory = redis_factory
+        self.leases_key = f"biomass:aimd:{name}:leases"
+        self.limit_key = f"biomass:aimd:{name}:limit"
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+    def acquire(self):
+        lease = uuid.uuid4().hex
+        client = self.redis_factory()
+        while not client.eval(
+            _ACQUIRE_SCRIPT, 2, self.leases_key, self.limit_key,
+            time.time(), lease, self.initial, self.lease_seconds,
+        ):
+            time.sleep(self.poll_interval * (0.5 + random.random()))
+        return lease
+
+    def release(self, lease, outcome):
+        """
+        outcome: 'ok', 'quota' u 'other' (no cambia el límite).
+        """
+        limit = self.redis_factory().eval(
+            _RELEASE_SCRIPT, 2, self.leases_key, self.limit_key,
+            lease, outcome, self.initial, self.minimum, self.maximum,
+            self.decrease, self.increase,
+        )
+        return float(limit)
+
+    def current_limit(self):
+        value = self.redis_factory().get(self.limit_key)
+        return float(value) if value is not None else float(self.initial)
+
+
+class EEClient:
+    """
+    Ejecuta llamadas a EE con clasificación de errores, reintentos con backoff
+    exponencial con jitter (full jitter) y, si se configura, el limitador AIMD.
+    """
+
+    def __init__(self, limiter=None, max_retries=5, base_delay=1.0, max_delay=60.0, sleep=time.sleep):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            lease = self.limiter.acquire() if self.limiter else None
+            outcome = 'other'
+            try:
+                result = fn(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            except EE_CALL_EXCEPTIONS as exc:
+                error = classify_ee_exception(exc)
+                if isinstance(error, EEQuotaError):
+                    outcome = 'quota'
+                if isinstance(error, EEPermanentError) or attempt >= self.max_retries:
+                    if error is exc:
+                        raise
+                    raise error from exc
+            finally:
+                if lease is not None:
+                    self.limiter.release(lease, outcome)
+            self.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def get_info(self, computed_object):
+        return self.call(computed_object.getInfo)
+
+
+# Cliente por defecto (sin limitador); la app lo reemplaza con set_ee_client
+_client = EEClient()
+
+
+def get_ee_client():
+    return _client
+
+
+def set_ee_client(client):
+    global _client
+    _client = client
@@ -2,8 +2,19 @@ import ee
 import numpy as np
 import pandas as pd
 
-# Inicializa Earth Engine (esto se hace una vez)
-ee.Initialize(project="ee-ortesis1221")
+from core.ml_models.ee_client import get_ee_client
+
+_ee_initialized = False
+
+def initialize_ee():
+    """
+    Inicializa Earth Engine una vez por proceso, en el primer uso (los AOIs que
+    se resuelven con la fuente local no necesitan red).
+    """
+    global _ee_initialized
+    if not _ee_initialized:
+        ee.Initialize(project="ee-ortesis1221")
+        _ee_initialized = True
 
 def get_geometry_from_geojson(geojson):
     # Si es FeatureCollection, toma la geometría del primer feature
@@ -18,28 +29,56 @@ def get_geometry_from_geojson(geojson):
     else:
         raise ValueError("Formato de GeoJSON no reconocido")
 
-def extract_features_from_geojson(geojson, year: int, scale=100) -> pd.DataFrame:
-
-    start_date = '2019-01-01'
-    end_date   = '2022-12-31'
-    # 1. Definir el área de interés
-    geometry = get_geometry_from_geojson(geojson)
-    aoi = (ee.FeatureCollection(geojson).geometry()
+def to_ee_geometry(geojson):
+    # Convierte FeatureCollection / Feature / Geometry GeoJSON en ee.Geometry
+    initialize_ee()
+    return (ee.FeatureCollection(geojson).geometry()
        if geojson.get('type') == 'FeatureCollection'
        else ee.Geometry(geojson['geometry'] if geojson.get('type')=='Feature'
                         else geojson))
 
-    # 2. Colecciones y procesamiento (igual que tu código)
-    s2  = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")     
-    csp = ee.ImageCollection('GOOGLE/CLOUD_SCORE_PLUS/V1/S2_HARMONIZED')
-    s2_proj = ee.Image(s2.first()).select('B4').projection()
+S2_COLLECTION = "COPERNICUS/S2_SR_HARMONIZED"
+CSP_COLLECTION = 'GOOGLE/CLOUD_SCORE_PLUS/V1/S2_HARMONIZED'
+
+_s2_projection = None
 
-    def link_collection(img):
-        cs_img = csp.filterDate(img.date(), img.date().advance(1, 'day')).first()
-        return img.addBands(cs_img)
+def get_s2_projection():
+    """
+    Proyección por defecto de la composición S2 (B4 de la primera imagen de la
+    colección). Es constante, así que se consulta una vez por proceso y se
+    reutiliza como ee.Projection literal en lugar de recalcular s2.first().
+    """
+    global _s2_projection
+    if _s2_projection is None:
+        initialize_ee()
+        info = get_ee_client().get_info(ee.Image(ee.ImageCollection(S2_COLLECTION).first()).select('B4').projection())
+        _s2_projection = ee.Projection(info['crs'], info['transform'])
+    return _s2_projection
+
+def build_s2_composite(region, start, end):
+    """
+    Mediana Sentinel-2 (enmascarada con Cloud Score+, escalada y con índices)
+    de las imágenes entre start (incluida) y end (excluida).
+    """
+    # Colecciones y procesamiento
+    s2 = (ee.ImageCollection(S2_COLLECTION)
+            .filterBounds(region)
+            .filterDate(start, end)
+            .select('B.*'))
+    csp = (ee.ImageCollection(CSP_COLLECTION)
+            .filterBounds(region)
+            .filterDate(start, end)
+            .select('cs'))
+
+    # Unir cada imagen S2 con su Cloud Score+ por system:index (join en el servidor)
+    joined = ee.Join.saveFirst('cs_img').apply(
+        s2, csp, ee.Filter.equals(leftField='system:index', rightField='system:index')
+    )
 
     def mask_clouds(img):
-        return img.updateMask(img.select('cs').gte(0.5))
+        img = ee.Image(img)
+        cs = ee.Image(img.get('cs_img'))
+        return img.updateMask(cs.gte(0.5))
 
     def scale_bands(img):
         return img.multiply(0.0001).copyProperties(img, ['system:time_start'])
@@ -59,34 +98,82 @@ def extract_features_from_geojson(geojson, year: int, scale=100) -> pd.DataFrame
         ).rename('bsi')
         return img.addBands([ndvi,mndwi,ndbi,evi,bsi])
 
-    s2_comp = (s2.filterBounds(aoi)
-                .filterDate(f"{year}-01-01", f"{year}-12-31")
-                .map(link_collection)
+    return (ee.ImageCollection(joined)
                 .map(mask_clouds)
-                .select('B.*')
                 .map(scale_bands)
                 .map(add_indices)
                 .median()
-                .setDefaultProjection(s2_proj)
+                .setDefaultProjection(get_s2_projection())
                 )
-    
-    #print("s2_comp: ", s2_comp)
-    
+
+def build_dem_bands(region):
+    """
+    Elevación ('dem') y pendiente ('slope') de Copernicus GLO-30.
+    """
     dem_ic = (ee.ImageCollection('COPERNICUS/DEM/GLO30')
-           .filterBounds(aoi).select('DEM'))
+           .filterBounds(region).select('DEM'))
     dem_proj  = dem_ic.first().select(0).projection()
     elev      = dem_ic.mosaic().rename('dem').setDefaultProjection(dem_proj)
     slope     = ee.Terrain.slope(elev)
-    dem_bands = elev.addBands(slope)   
+    return elev.addBands(slope)
+
+def build_stacked_image(region, year: int, grid_scale=100):
+    """
+    Imagen con las bandas del modelo (Sentinel-2 + índices + DEM/pendiente)
+    para el año indicado, sobre la región dada (ee.Geometry).
+    """
+    s2_comp = build_s2_composite(region, f"{year}-01-01", f"{year}-12-31")
+    
+    #print("s2_comp: ", s2_comp)
 
-    grid_scale   = 100
     grid_proj    = ee.Projection('EPSG:3857').atScale(grid_scale)
 
-    stacked = s2_comp.addBands(dem_bands).reproject(grid_proj)
+    return s2_comp.addBands(build_dem_bands(region)).reproject(grid_proj)
 
-    #print("stacked: ", stacked.getInfo())
+# Periodos por año de las series sub-anuales
+PERIOD_GRANULARITIES = {'month': 12, 'season': 4}
+
+def period_ranges(year: int, granularity: str):
+    """
+    [(periodo, inicio, fin)] del año: meses 1-12 o trimestres 1-4 (fin excluido).
+    """
+    months_per_period = 12 // PERIOD_GRANULARITIES[granularity]
+    ranges = []
+    for period in range(1, PERIOD_GRANULARITIES[granularity] + 1):
+        first_month = (period - 1) * months_per_period + 1
+        next_month = first_month + months_per_period
+        end = f"{year + 1}-01-01" if next_month > 12 else f"{year}-{next_month:02d}-01"
+        ranges.append((period, f"{year}-{first_month:02d}-01", end))
+    return ranges
+
+def period_prefix(period):
+    return f"p{period:02d}_"
 
-    #print("stacked: ", stacked)
+def build_period_image(region, year: int, granularity: str, grid_scale=100):
+    """
+    Una sola imagen con la composición de cada periodo del año como bandas
+    con prefijo (p01_B2, p01_ndvi, ..., p12_bsi) más DEM/pendiente una vez.
+    Un periodo sin imágenes no aporta bandas.
+    """
+    composites = []
+    for period, start, end in period_ranges(year, granularity):
+        composite = build_s2_composite(region, start, end)
+        prefix = ee.String(period_prefix(period))
+        composites.append(composite.rename(composite.bandNames().map(lambda name: prefix.cat(name))))
+
+    grid_proj = ee.Projection('EPSG:3857').atScale(grid_scale)
+    return ee.Image.cat(composites).addBands(build_dem_bands(region)).reproject(grid_proj)
+
+def extract_features_from_geojson(geojson, year: int, scale=100) -> pd.DataFrame:
+
+    # 1. Definir el área de interés
+    aoi = to_ee_geometry(geojson)
+
+    # 2. Composición del año
+    grid_scale   = 100
+    stacked = build_stacked_image(aoi, year, grid_scale)
+
+    #print("stacked: ", stacked.getInfo())
 
     # 3. Extraer los valores de los píxeles dentro del polígono
     # Puedes limitar el número de muestras con 'numPixels' si el área es muy grande
@@ -102,7 +189,7 @@ def extract_features_from_geojson(geojson, year: int, scale=100) -> pd.DataFrame
     samples = stacked.sample(region=aoi, scale=grid_scale, numPixels=1000, geometries=False)
 
     #print('Muestras extraídas:', samples.size().getInfo())
-    features = samples.getInfo()['features']
+    features = get_ee_client().get_info(samples)['features']
     if not features:
         #raise ValueError("No se extrajeron muestras. Revisa el área o el año.")
         #print("No se extrajeron muestras. Revisa el área o el año.", year)
@@ -112,6 +199,132 @@ def extract_features_from_geojson(geojson, year: int, scale=100) -> pd.DataFrame
 
     return df
 
+def columns_to_matrix(columns):
+    """
+    Listas por columna -> matriz (muestras, columnas) float32 C-contigua,
+    llenando una columna a la vez (sin un dict por muestra).
+    """
+    n_samples = len(columns[0]) if columns else 0
+    X = np.empty((n_samples, len(columns)), dtype=np.float32)
+    for j, values in enumerate(columns):
+        X[:, j] = values
+    return X
+
+def extract_feature_matrix(geojson, year: int, feature_names, scale=100, num_pixels=1000):
+    """
+    Igual que extract_features_from_geojson, pero trae las muestras en forma
+    columnar: reduceColumns(toList) devuelve una lista por banda en el orden de
+    feature_names, sin el JSON de cada Feature (type, id, geometry, properties).
+    Devuelve una matriz float32 (muestras, len(feature_names)) o None.
+    """
+    aoi = to_ee_geometry(geojson)
+    stacked = build_stacked_image(aoi, year, scale)
+    samples = stacked.sample(region=aoi, scale=scale, numPixels=num_pixels, geometries=False)
+
+    feature_names = list(feature_names)
+    columns = get_ee_client().get_info(samples.reduceColumns(
+        reducer=ee.Reducer.toList().repeat(len(feature_names)),
+        selectors=feature_names,
+    ))['list']
+    if not columns or not columns[0]:
+        return None
+    return columns_to_matrix(columns)
+
+def split_columns_by_aoi(columns, aoi_ids):
+    """
+    Columnas de reduceColumns (las de las bandas y al final la de aoi_id) ->
+    {aoi_id: matriz float32 con sus muestras, o None si no tuvo muestras}.
+    """
+    results = {aoi_id: None for aoi_id in aoi_ids}
+    if not columns or not columns[0]:
+        return results
+    X = columns_to_matrix(columns[:-1])
+    sample_aoi = np.asarray(columns[-1], dtype=np.int64)
+    for aoi_id in aoi_ids:
+        rows = sample_aoi == int(aoi_id)
+        if rows.any():
+            results[aoi_id] = X[rows]
+    return results
+
+def extract_feature_matrices_batch(geojsons: dict, year: int, feature_names, scale=100, num_pixels=1000) -> dict:
+    """
+    Muestras de varios AOIs en una sola petición a Earth Engine.
+
+    geojsons: {aoi_id: geojson}. La composición del año se construye una sola vez
+    sobre el bounding box de la unión de los AOIs; cada AOI se muestrea con el
+    mismo criterio que extract_feature_matrix (hasta num_pixels píxeles) y las
+    muestras se traen en forma columnar con su aoi_id, como en extract_feature_matrix.
+    Devuelve {aoi_id: matriz float32 (muestras, len(feature_names)) o None}.
+    """
+    regions = ee.FeatureCollection([
+        ee.Feature(to_ee_geometry(geojson), {'aoi_id': aoi_id})
+        for aoi_id, geojson in geojsons.items()
+    ])
+    stacked = build_stacked_image(regions.geometry().bounds(), year, scale)
+
+    def sample_region(feature):
+        # sampleRegions muestrearía todos los píxeles; se conserva el límite numPixels por AOI
+        return (stacked.sample(region=feature.geometry(), scale=scale,
+                               numPixels=num_pixels, geometries=False)
+                .map(lambda f: f.set('aoi_id', feature.get('aoi_id'))))
+
+    selectors = list(feature_names) + ['aoi_id']
+    columns = get_ee_client().get_info(regions.map(sample_region).flatten().reduceColumns(
+        reducer=ee.Reducer.toList().repeat(len(selectors)),
+        selectors=selectors,
+    ))['list']
+    return split_columns_by_aoi(columns, list(geojsons))
+
+# Valor de los píxeles enmascarados en las muestras por periodo: reduceColumns
+# necesita un valor en cada columna para no desalinear las listas
+PERIOD_NODATA = -99999
+
+def extract_period_features(geojson, year: int, granularity: str, feature_names, scale=100, num_pixels=1000) -> dict:
+    """
+    Muestras de todos los periodos (meses o trimestres) del año en una sola
+    petición a Earth Engine: se muestrean los mismos píxeles de la imagen de
+    build_period_image y se traen en forma columnar (un reduceColumns sobre
+    todas las bandas pNN_), como en extract_feature_matrix. Las columnas se
+    separan localmente por prefijo.
+    Devuelve {periodo: matriz float32 (muestras, len(feature_names)), o None}.
+    En cada periodo se descartan los píxeles enmascarados (nubes) de ese periodo.
+    """
+    aoi = to_ee_geometry(geojson)
+    image = build_period_image(aoi, year, granularity, scale)
+    # Sin descartar nulos: un píxel nublado en un mes no debe perderse en los demás
+    samples = image.unmask(PERIOD_NODATA).sample(region=aoi, scale=scale, numPixels=num_pixels,
+                                                 geometries=False)
+
+    # Un periodo sin imágenes no aporta bandas: los nombres vienen en la misma petición
+    band_names = image.bandNames()
+    info = get_ee_client().get_info(ee.Dictionary({
+        'bands': band_names,
+        'columns': samples.reduceColumns(
+            reducer=ee.Reducer.toList().repeat(band_names.size()),
+            selectors=band_names,
+        ).get('list'),
+    }))
+    periods = [period for period, _, _ in period_ranges(year, granularity)]
+    results = {period: None for period in periods}
+    columns = info['columns']
+    if not columns or not columns[0]:
+        return results
+
+    X = columns_to_matrix(columns)
+    X[X == PERIOD_NODATA] = np.nan
+    band_index = {name: j for j, name in enumerate(info['bands'])}
+    for period in periods:
+        prefix = period_prefix(period)
+        # Bandas del periodo con prefijo; DEM y pendiente sin prefijo, comunes a todos
+        indices = [band_index.get(prefix + name, band_index.get(name)) for name in feature_names]
+        if None in indices:
+            continue
+        part = X[:, indices]
+        part = part[~np.isnan(part).any(axis=1)]
+        if len(part):
+            results[period] = np.ascontiguousarray(part)
+    return results
+
 # from joblib import load
 # import json
 # from datetime import datetime
@@ -0,0 +1,271 @@
+"""
+Fuente de características local: mosaicos Sentinel-2 + DEM ya descargados.
+
+Alternativa a Earth Engine para las regiones que se analizan seguido. Cada
+región es un directorio con un stack de bandas por año, en la misma grilla que
+usa el pipeline de EE (EPSG:3857, 100 m) y con la mediana anual de S2 ya
+enmascarada por nubes:
+
+    <dir>/<año>.npy + <año>.json   arreglo (bandas, filas, columnas) leído con memmap
+    <dir>/<año>.tif                GeoTIFF multibanda (requiere rasterio)
+
+Metadatos (.json, o tags del GeoTIFF con los nombres en las descripciones):
+    {"bands": ["B1", ..., "B12", "dem"], "transform": [x0, dx, 0, y0, 0, dy],
+     "scale": 0.0001, "nodata": 0}
+transform es el geotransform de GDAL (norte arriba, dy negativo) y scale se
+aplica a las bandas B*.
+
+Solo se leen del disco los píxeles muestreados; los índices (ndvi, mndwi, ndbi,
+evi, bsi) y la pendiente se calculan con NumPy con las mismas fórmulas que
+build_s2_composite / ee.Terrain.slope, y el DataFrame tiene las mismas columnas
+que extract_features_from_geojson.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS = 6378137.0
+
+
+def lonlat_to_mercator(lon, lat):
+    """
+    EPSG:4326 -> EPSG:3857 (metros).
+    """
+    x = EARTH_RADIUS * np.radians(lon)
+    y = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    return x, y
+
+
+def geojson_rings(geojson):
+    """
+    Anillos (exteriores y huecos) de un Polygon/MultiPolygon, Feature o
+    FeatureCollection como arreglos (n, 2) lon/lat.
+    """
+    if geojson.get('type') == 'FeatureCollection':
+        return [ring for feature in geojson['features'] for ring in geojson_rings(feature['geometry'])]
+    if geojson.get('type') == 'Feature':
+        return geojson_rings(geojson['geometry'])
+    if geojson.get('type') == 'Polygon':
+        polygons = [geojson['coordinates']]
+    elif geojson.get('type') == 'MultiPolygon':
+        polygons = geojson['coordinates']
+    else:
+        raise ValueError("Formato de GeoJSON no reconocido")
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon]
+
+
+def rasterize_rings(rings, n_rows, n_cols):
+    """
+    Máscara (n_rows, n_cols) de los píxeles cuyo centro cae dentro de los
+    anillos (coordenadas en píxeles: columna, fila). Regla par-impar por línea
+    de barrido, así los huecos quedan fuera.
+    """
+    edges = np.concatenate([np.column_stack([ring[:-1], ring[1:]]) for ring in rings])
+    x1, y1, x2, y2 = edges.T
+    mask = np.zeros((n_rows, n_cols), dtype=bool)
+    for row in range(n_rows):
+        yc = row + 0.5
+        crossing = (y1 <= yc) != (y2 <= yc)
+        if not crossing.any():
+            continue
+        xs = np.sort(x1[crossing] + (yc - y1[crossing]) * (x2[crossing] - x1[crossing]) / (y2[crossing] - y1[crossing]))
+        starts = np.clip(np.ceil(xs[0::2] - 0.5).astype(np.int64), 0, n_cols)
+        stops = np.clip(np.ceil(xs[1::2] - 0.5).astype(np.int64), 0, n_cols)
+        for start, stop in zip(starts, stops):
+            mask[row, start:stop] = True
+    return mask
+
+
+def add_indices(bands):
+    """
+    Índices espectrales de build_s2_composite sobre arreglos de reflectancia.
+    """
+    def normalized_difference(a, b):
+        return (a - b) / (a + b)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'ndvi': normalized_difference(bands['B8'], bands['B4']),
+            'mndwi': normalized_difference(bands['B3'], bands['B11']),
+            'ndbi': normalized_difference(bands['B11'], bands['B8']),
+            'evi': 2.5 * ((bands['B8'] - bands['B4']) / (bands['B8'] + 6 * bands['B4'] - 7.5 * bands['B2'] + 1)),
+            'bsi': normalized_difference(bands['B11'] + bands['B4'], bands['B8'] + bands['B2']),
+        }
+
+
+class RasterStack:
+    """
+    Stack de bandas de una región-año. read(rows, cols) devuelve solo los
+    píxeles pedidos (float64, NaN fuera del stack o en nodata).
+    """
+
+    def __init__(self, data, bands, transform, scale=0.0001, nodata=None):
+        if transform[2] or transform[4]:
+            raise ValueError("Solo se soportan grillas norte arriba (sin rotación)")
+        self.data = data
+        self.bands = list(bands)
+        self.transform = transform
+        self.scale = scale
+        self.nodata = nodata
+
+    @classmethod
+    def open(cls, base_path):
+        if os.path.exists(base_path + '.npy'):
+            with open(base_path + '.json') as f:
+                meta = json.load(f)
+            return cls(np.load(base_path + '.npy', mmap_mode='r'), meta['bands'], meta['transform'],
+                       meta.get('scale', 0.0001), meta.get('nodata'))
+        if os.path.exists(base_path + '.tif'):
+            return cls._open_geotiff(base_path + '.tif')
+        return None
+
+    @classmethod
+    def _open_geotiff(cls, path):
+        import rasterio
+
+        src = rasterio.open(path)
+        tags = src.tags()
+        return cls(_GeoTIFFBands(src), src.descriptions, src.transform.to_gdal(),
+                   float(tags.get('scale', 0.0001)), src.nodata)
+
+    @property
+    def shape(self):
+        return self.data.shape[1:]
+
+    def to_pixel(self, x, y):
+        """
+        Coordenadas EPSG:3857 -> (columna, fila) fraccionales.
+        """
+        x0, dx, _, y0, _, dy = self.transform
+        return (x - x0) / dx, (y - y0) / dy
+
+    def read(self, band, rows, cols):
+        values = np.full(rows.shape, np.nan)
+        n_rows, n_cols = self.shape
+        inside = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+        raw = self.data[self.bands.index(band)][rows[inside], cols[inside]]
+        values[inside] = raw
+        if self.nodata is not None:
+            values[inside & (values == self.nodata)] = np.nan
+        if band.startswith('B'):
+            values *= self.scale
+        return values
+
+
+class _GeoTIFFBands:
+    """
+    Acceso data[banda][filas, columnas] a un GeoTIFF leyendo solo la ventana
+    que contiene los píxeles pedidos.
+    """
+
+    def __init__(self, src):
+        self.src = src
+        self.shape = (src.count, src.height, src.width)
+
+    def __getitem__(self, band):
+        return _GeoTIFFBand(self.src, band + 1)
+
+
+class _GeoTIFFBand:
+
+    def __init__(self, src, index):
+        self.src = src
+        self.index = index
+
+    def __getitem__(self, key):
+        from rasterio.windows import Window
+
+        rows, cols = key
+        if rows.size == 0:
+            return np.empty(0)
+        row0, col0 = rows.min(), cols.min()
+        window = Window(col0, row0, cols.max() - col0 + 1, rows.max() - row0 + 1)
+        return self.src.read(self.index, window=window)[rows - row0, cols - col0]
+
+
+class LocalFeatureSource:
+    """
+    regions: [{"name": ..., "bbox": [minx, miny, maxx, maxy] (lon/lat), "path": dir}].
+    Un AOI usa la primera región cuyo bbox lo contiene y que tiene el stack del año.
+    """
+
+    def __init__(self, regions):
+        self.regions = regions
+        self._stacks = {}
+
+    def _stack(self, region, year):
+        key = (region['path'], year)
+        if key not in self._stacks:
+            stack = RasterStack.open(os.path.join(region['path'], str(year)))
+            # Solo se cachean los stacks abiertos: un mosaico que se agrega después
+            # se usa sin reiniciar el worker
+            if stack is None:
+                return None
+            self._stacks[key] = stack
+        return self._stacks[key]
+
+    def find_stack(self, geojson, year):
+        coords = np.concatenate(geojson_rings(geojson))
+        minx, miny = coords.min(axis=0)
+        maxx, maxy = coords.max(axis=0)
+        for region in self.regions:
+            rminx, rminy, rmaxx, rmaxy = region['bbox']
+            if rminx <= minx and rminy <= miny and maxx <= rmaxx and maxy <= rmaxy:
+                stack = self._stack(region, year)
+                if stack is not None:
+                    return stack
+        return None
+
+    def covers(self, geojson, year):
+        return self.find_stack(geojson, year) is not None
+
+    def extract(self, geojson, year, num_pixels=1000, seed=0):
+        """
+        Mismo contrato que extract_features_from_geojson: DataFrame con hasta
+        num_pixels píxeles al azar dentro del AOI (sin nulos), o None.
+        """
+        stack = self.find_stack(geojson, year)
+        if stack is None:
+            raise ValueError(f"No hay stack local que cubra el AOI para {year}")
+
+        # Anillos en píxeles y ventana del AOI (con 1 píxel de margen para la pendiente)
+        rings = []
+        for ring in geojson_rings(geojson):
+            cols, rows = stack.to_pixel(*lonlat_to_mercator(ring[:, 0], ring[:, 1]))
+            rings.append(np.column_stack([cols, rows]))
+        all_points = np.concatenate(rings)
+        col0, row0 = np.floor(all_points.min(axis=0)).astype(int) - 1
+        col1, row1 = np.ceil(all_points.max(axis=0)).astype(int) + 1
+        mask = rasterize_rings([ring - (col0, row0) for ring in rings], row1 - row0, col1 - col0)
+
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return None
+        rng = np.random.default_rng(seed)
+        if candidates.size > num_pixels:
+            candidates = np.sort(rng.choice(candidates, num_pixels, replace=False))
+        rows, cols = np.divmod(candidates, mask.shape[1])
+        rows += row0
+        cols += col0
+
+        columns = {band: stack.read(band, rows, cols) for band in stack.bands if band != 'dem'}
+        columns.update(add_indices(columns))
+        columns['dem'] = stack.read('dem', rows, cols)
+
+        # DEM de los vecinos para la pendiente; tamaño del píxel corregido por la escala de Mercator
+        neighbors = {
+            (dr, dc): stack.read('dem', rows + dr, cols + dc)
+            for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))
+        }
+        x0, dx, _, y0, _, dy = stack.transform
+        lat = np.degrees(2 * np.arctan(np.exp((y0 + (rows + 0.5) * dy) / EARTH_RADIUS)) - np.pi / 2)
+        ground = np.cos(np.radians(lat))
+        dz_dx = (neighbors[(0, 1)] - neighbors[(0, -1)]) / (2 * abs(dx) * ground)
+        dz_dy = (neighbors[(-1, 0)] - neighbors[(1, 0)]) / (2 * abs(dy) * ground)
+        columns['slope'] = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+
+        df = pd.DataFrame(columns).replace([np.inf, -np.inf], np.nan).dropna().reset_index(drop=True)
+        return df if not df.empty else None
+
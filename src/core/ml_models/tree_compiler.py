@@ -0,0 +1,215 @@
+"""
+Compilador de ensambles de árboles de sklearn a arreglos planos de NumPy.
+
+Todos los nodos de todos los árboles se guardan en arreglos contiguos
+(feature, threshold, children, value) y la predicción recorre todos los
+árboles a la vez, por bloques de filas, sin pasar por el predict genérico de sklearn.
+En cada nivel se avanzan solo los pares (fila, árbol) que no han llegado a una hoja.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SUPPORTED_MODELS = (
+    'DecisionTreeRegressor',
+    'ExtraTreeRegressor',
+    'RandomForestRegressor',
+    'ExtraTreesRegressor',
+    'GradientBoostingRegressor',
+)
+
+
+class CompiledTreeEnsemble:
+    """
+    Evaluador vectorizado de un ensamble de árboles de regresión.
+    La predicción es base + scale * combinación (suma o media) de las hojas.
+    children guarda [izquierdo, derecho] de cada nodo intercalados (2*i, 2*i+1).
+    """
+
+    def __init__(self, feature, threshold, children, value, missing_left, is_leaf,
+                 roots, base=0.0, scale=1.0, average=True, feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.missing_left = missing_left
+        self.is_leaf = is_leaf
+        self.roots = roots
+        self.base = base
+        self.scale = scale
+        self.average = average
+        self.feature_names = feature_names
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _as_array(self, X):
+        if self.feature_names is not None and hasattr(X, 'columns'):
+            X = X[self.feature_names]
+        # sklearn evalúa los árboles sobre X en float32
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def leaf_values(self, X):
+        """
+        Valor de la hoja alcanzada en cada árbol: matriz (n_filas, n_árboles).
+        """
+        X = self._as_array(X)
+        n_rows, n_features = X.shape
+        n_trees = self.n_trees
+        flat_X = X.ravel()
+        has_nan = np.isnan(flat_X).any()
+
+        leaves = np.empty(n_rows * n_trees, dtype=np.int32)
+        pending = np.arange(n_rows * n_trees, dtype=np.intp)
+        nodes = np.tile(self.roots, n_rows)
+        offsets = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, n_trees)
+
+        # Árboles de un solo nodo
+        done = self.is_leaf[nodes]
+        leaves[pending[done]] = nodes[done]
+        pending, nodes, offsets = pending[~done], nodes[~done], offsets[~done]
+
+        while pending.size:
+            x = flat_X[offsets + self.feature[nodes]]
+            go_right = x > self.threshold[nodes]
+            if has_nan:
+                missing = np.isnan(x)
+                go_right[missing] = ~self.missing_left[nodes[missing]]
+            nodes = self.children[2 * nodes + go_right]
+
+            done = self.is_leaf[nodes]
+            if done.any():
+                leaves[pending[done]] = nodes[done]
+                keep = ~done
+                pending, nodes, offsets = pending[keep], nodes[keep], offsets[keep]
+
+        return self.value[leaves].reshape(n_rows, n_trees)
+
+    def predict_with_std(self, X, chunk_size=16384, n_threads=None):
+        """
+        Predicción y desviación estándar entre árboles por muestra, en la misma
+        pasada. Solo tiene sentido para ensambles promediados (bosques).
+        """
+        if not self.average:
+            raise ValueError("La dispersión entre árboles solo aplica a ensambles promediados")
+        X = self._as_array(X)
+        n_rows = X.shape[0]
+        mean = np.empty(n_rows, dtype=np.float64)
+        std = np.empty(n_rows, dtype=np.float64)
+        starts = range(0, n_rows, chunk_size)
+
+        def run(start):
+            leaves = self.leaf_values(X[start:start + chunk_size])
+            mean[start:start + chunk_size] = self.base + self.scale * leaves.mean(axis=1)
+            std[start:start + chunk_size] = self.scale * leaves.std(axis=1)
+
+        if n_threads and n_threads > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                list(pool.map(run, starts))
+        else:
+            for start in starts:
+                run(start)
+        return mean, std
+
+    def _predict_chunk(self, X):
+        leaves = self.leaf_values(X)
+        combined = leaves.mean(axis=1) if self.average else leaves.sum(axis=1)
+        return self.base + self.scale * combined
+
+    def predict(self, X, chunk_size=16384, n_threads=None):
+        """
+        Predice por bloques de chunk_size filas (memoria acotada a
+        chunk_size x n_árboles). Con n_threads > 1 los bloques se evalúan en
+        un pool de hilos (NumPy libera el GIL en las operaciones vectoriales).
+        """
+        X = self._as_array(X)
+        n_rows = X.shape[0]
+        out = np.empty(n_rows, dtype=np.float64)
+        starts = range(0, n_rows, chunk_size)
+
+        def run(start):
+            out[start:start + chunk_size] = self._predict_chunk(X[start:start + chunk_size])
+
+        if n_threads and n_threads > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                list(pool.map(run, starts))
+        else:
+            for start in starts:
+                run(start)
+        return out
+
+
+def _float32_thresholds(threshold):
+    """
+    Umbral float32 equivalente: x32 <= t64 si y solo si x32 <= t32, con t32 el
+    mayor float32 que no supera t64. Así la comparación no promueve a float64.
+    """
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+def _tree_arrays(tree, offset):
+    """
+    Arreglos de un sklearn.tree._tree.Tree con índices desplazados por offset.
+    """
+    is_leaf = tree.children_left == -1
+    feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+    threshold = _float32_thresholds(np.where(is_leaf, np.inf, tree.threshold))
+    children = np.empty(2 * tree.node_count, dtype=np.int32)
+    children[0::2] = np.where(is_leaf, -1, tree.children_left + offset)
+    children[1::2] = np.where(is_leaf, -1, tree.children_right + offset)
+    value = tree.value[:, 0, 0].astype(np.float64)
+    if hasattr(tree, 'missing_go_to_left'):
+        missing_left = np.asarray(tree.missing_go_to_left, dtype=bool) & ~is_leaf
+    else:
+        missing_left = np.zeros(tree.node_count, dtype=bool)
+    return feature, threshold, children, value, missing_left, is_leaf
+
+
+def compile_model(model):
+    """
+    Compila un regresor de árboles de sklearn a CompiledTreeEnsemble.
+    Lanza ValueError si el tipo de modelo no está soportado.
+    """
+    name = type(model).__name__
+    if name not in SUPPORTED_MODELS:
+        raise ValueError(f"Modelo no soportado por el compilador: {name}")
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Solo se soportan modelos de una salida")
+
+    base, scale, average = 0.0, 1.0, True
+    if name in ('DecisionTreeRegressor', 'ExtraTreeRegressor'):
+        trees = [model.tree_]
+    elif name == 'GradientBoostingRegressor':
+        trees = [est.tree_ for est in model.estimators_[:, 0]]
+        scale, average = model.learning_rate, False
+        if model.init_ != 'zero':
+            base = float(np.ravel(model.init_.predict(np.zeros((1, model.n_features_in_))))[0])
+    else:
+        trees = [est.tree_ for est in model.estimators_]
+
+    parts = []
+    roots = []
+    offset = 0
+    for tree in trees:
+        roots.append(offset)
+        parts.append(_tree_arrays(tree, offset))
+        offset += tree.node_count
+
+    feature, threshold, children, value, missing_left, is_leaf = zip(*parts)
+    return CompiledTreeEnsemble(
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        children=np.concatenate(children),
+        value=np.concatenate(value),
+        missing_left=np.concatenate(missing_left),
+        is_leaf=np.concatenate(is_leaf),
+        roots=np.asarray(roots, dtype=np.int32),
+        base=base,
+        scale=scale,
+        average=average,
+        feature_names=list(getattr(model, 'feature_names_in_', [])) or None,
+    )
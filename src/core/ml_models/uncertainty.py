@@ -0,0 +1,41 @@
+"""
+Incertidumbre de la predicción de biomasa.
+
+La dispersión entre árboles de un bosque aproxima la incertidumbre del modelo
+por muestra; el intervalo de la media del AOI se estima con bootstrap sobre las
+predicciones por muestra (incertidumbre por muestreo de píxeles).
+"""
+import numpy as np
+
+
+def forest_predict_with_std(model, X):
+    """
+    Predicción (media de los árboles) y desviación estándar entre árboles por
+    muestra con sklearn. Equivale a model.predict más la dispersión, sin evaluar
+    el bosque dos veces.
+    """
+    if not hasattr(model, 'estimators_') or type(model).__name__ not in (
+        'RandomForestRegressor', 'ExtraTreesRegressor'
+    ):
+        return model.predict(X), None
+    if hasattr(X, 'columns'):
+        X = X[model.feature_names_in_]
+    # Los árboles internos se ajustan sin nombres de columnas y en float32
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    per_tree = np.empty((X.shape[0], len(model.estimators_)), dtype=np.float64)
+    for i, tree in enumerate(model.estimators_):
+        per_tree[:, i] = tree.predict(X, check_input=False)
+    return per_tree.mean(axis=1), per_tree.std(axis=1)
+
+
+def bootstrap_mean_ci(values, n_boot=1000, alpha=0.05, seed=0):
+    """
+    Intervalo de confianza (1 - alpha) de la media por bootstrap percentil.
+    Todas las réplicas se remuestrean en una sola operación vectorizada.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, values.size, size=(n_boot, values.size))
+    means = values[indices].mean(axis=1)
+    low, high = np.percentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(low), float(high)
@@ -0,0 +1,202 @@
+"""
+Perfilado de peticiones HTTP.
+
+RequestProfilingMiddleware mide por petición el número de consultas SQL, el
+tiempo en SQL, el tiempo total y (opcional) el pico de memoria asignada con
+tracemalloc, y lo devuelve en la cabecera Server-Timing (visible en la pestaña
+Network del navegador).
+
+Opcionalmente perfila una muestra de peticiones con cProfile, elegidas por
+porcentaje (PROFILING_SAMPLE_RATE) o con la cabecera X-Profile igual a
+PROFILING_HEADER_TOKEN, y guarda el .prof en PROFILING_DIR. Los .prof se leen
+con pstats, snakeviz o flameprof (flamegraph).
+
+Atiende vistas síncronas y asíncronas sin adaptarlas. tracemalloc se arranca
+una vez al crear el middleware; el pico se toma por petición con reset_peak().
+
+Si REQUEST_PROFILING es False el middleware se desactiva al arrancar
+(MiddlewareNotUsed) y no agrega ningún costo.
+"""
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+class QueryTimer:
+    """
+    execute_wrapper que cuenta las consultas y acumula su duración.
+    No depende de DEBUG (connection.queries).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Las vistas asíncronas se miden sin pasar por sync_to_async/async_to_sync
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # tracemalloc se arranca una sola vez: detenerlo por petición rompería
+        # la medición de las peticiones concurrentes
+        self.trace_memory = settings.PROFILING_TRACEMALLOC
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def should_profile(self, request):
+        token = settings.PROFILING_HEADER_TOKEN
+        if token and request.headers.get('X-Profile') == token:
+            return True
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        measurement = _Measurement(self.should_profile(request), self.trace_memory)
+        wrappers = _execute_wrappers(measurement.timer)
+        measurement.start()
+        try:
+            with wrappers:
+                response = measurement.run(self.get_response, request)
+        finally:
+            measurement.stop()
+        return measurement.annotate(request, response)
+
+    async def __acall__(self, request):
+        measurement = _Measurement(self.should_profile(request), self.trace_memory)
+        # Las consultas del ORM asíncrono corren en el hilo de sync_to_async:
+        # el execute_wrapper se instala en las conexiones de ese hilo
+        wrappers = _execute_wrappers(measurement.timer)
+        await sync_to_async(wrappers.__enter__)()
+        measurement.start()
+        try:
+            response = await measurement.arun(self.get_response, request)
+        finally:
+            measurement.stop()
+            await sync_to_async(wrappers.__exit__)(None, None, None)
+        return measurement.annotate(request, response)
+
+
+# Un solo pico de memoria medido a la vez: reset_peak() es global al proceso
+_memory_lock = threading.Lock()
+
+
+class _Measurement:
+    """
+    Métricas de una petición: consultas, tiempos, pico de memoria y cProfile.
+    Con peticiones concurrentes solo una mide la memoria (las demás omiten la
+    métrica mem) y su pico incluye lo que asignan las otras: para un pico
+    exacto, perfilar con un solo hilo.
+    """
+
+    def __init__(self, profile, trace_memory):
+        self.timer = QueryTimer()
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        self.memory_measured = False
+        self.peak = None
+
+    def start(self):
+        if self.trace_memory and tracemalloc.is_tracing() and _memory_lock.acquire(blocking=False):
+            self.memory_measured = True
+            tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+
+    def run(self, get_response, request):
+        if self.profiler is None:
+            return get_response(request)
+        self.profiler.enable()
+        try:
+            return get_response(request)
+        finally:
+            self.profiler.disable()
+
+    async def arun(self, get_response, request):
+        if self.profiler is None:
+            return await get_response(request)
+        self.profiler.enable()
+        try:
+            return await get_response(request)
+        finally:
+            self.profiler.disable()
+
+    def stop(self):
+        self.total = time.perf_counter() - self.started
+        if self.memory_measured:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            _memory_lock.release()
+
+    def annotate(self, request, response):
+        metrics = [
+            f'db;desc="{self.timer.count} queries";dur={self.timer.duration * 1000:.1f}',
+            f'app;dur={(self.total - self.timer.duration) * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ]
+        if self.peak is not None:
+            metrics.append(f'mem;desc="peak {self.peak / 1024:.0f} KiB"')
+        if self.profiler is not None:
+            filename = dump_profile(self.profiler, request, self.total)
+            metrics.append(f'profile;desc="{filename}"')
+
+        previous = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join(([previous] if previous else []) + metrics)
+        # El frontend está en otro origen: sin esto el navegador oculta Server-Timing
+        response['Timing-Allow-Origin'] = '*'
+        return response
+
+
+class _execute_wrappers:
+    """
+    Instala el mismo execute_wrapper en todas las conexiones configuradas.
+    """
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+
+    def __enter__(self):
+        # Las conexiones son por hilo: se toman en el hilo que las va a usar
+        self.contexts = [connections[alias].execute_wrapper(self.wrapper) for alias in connections]
+        for context in self.contexts:
+            context.__enter__()
+
+    def __exit__(self, *exc_info):
+        for context in reversed(self.contexts):
+            context.__exit__(*exc_info)
+
+
+def dump_profile(profiler, request, total):
+    """
+    Guarda el perfil como PROFILING_DIR/<epoch_ms>-<método>-<ruta>-<ms>.prof
+    y devuelve el nombre del archivo.
+    """
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    path = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+    filename = f"{int(time.time() * 1000)}-{request.method}-{path[:80]}-{total * 1000:.0f}ms.prof"
+    profiler.dump_stats(os.path.join(settings.PROFILING_DIR, filename))
+    return filename
@@ -11,9 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import json
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -59,6 +61,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'geoapp.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -132,10 +135,40 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'biomass.api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'biomass.api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     #'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     #'PAGE_SIZE': 10,
 }
 
+# Decimales de los floats en las respuestas JSON (None = sin redondear)
+JSON_FLOAT_PRECISION = int(os.environ['JSON_FLOAT_PRECISION']) if os.getenv('JSON_FLOAT_PRECISION') else None
+
+# Decimales por defecto de las geometrías cuantizadas (?geometry_format=geojson-q|twkb|delta); 6 ≈ 10 cm
+GEOMETRY_PRECISION = int(os.getenv('GEOMETRY_PRECISION', 6))
+
+# Fuente de características: 'ee' (Earth Engine), 'local' (mosaicos en disco) o
+# 'auto' (local si alguna región cubre el AOI). Regiones locales como JSON:
+# [{"name": "...", "bbox": [minx, miny, maxx, maxy], "path": "/data/mosaics/..."}]
+FEATURE_SOURCE = os.getenv('FEATURE_SOURCE', 'auto')
+LOCAL_FEATURE_REGIONS = json.loads(os.getenv('LOCAL_FEATURE_REGIONS', '[]'))
+
+# Caché (Redis): la usan las vistas asíncronas para respuestas que no cambian
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+ASYNC_VIEWS_CACHE_TIMEOUT = int(os.getenv('ASYNC_VIEWS_CACHE_TIMEOUT', 60 * 60))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -192,16 +225,113 @@ SOCIALACCOUNT_STORE_TOKENS = True
 
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
+# Redis usado para coordinar vistas y workers (locks, límites de tasa)
+REDIS_URL = os.getenv('REDIS_URL', CELERY_BROKER_URL)
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Prioridades en el broker Redis (0 = más alta), una lista por nivel; las usa el
+# reparto entre usuarios de biomass.api.tasks.fair_share_priority
+ANALYSIS_PRIORITY_LEVELS = 10
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(ANALYSIS_PRIORITY_LEVELS)),
+}
+CELERY_TASK_DEFAULT_PRIORITY = 0
 
 # Task routing
+# Los análisis se encolan en la cola pequeña o grande según su costo estimado
+# (km² x años, ver biomass.api.tasks.analysis_queue). Cada cola tiene su pool:
+#   celery -A geoapp worker -Q biomass_small -c 8 -n small@%h
+#   celery -A geoapp worker -Q biomass_large -c 2 -n large@%h
+#   celery -A geoapp worker -Q biomass_maintenance -c 1 -n maintenance@%h
+ANALYSIS_QUEUE_SMALL = 'biomass_small'
+ANALYSIS_QUEUE_LARGE = 'biomass_large'
+MAINTENANCE_QUEUE = 'biomass_maintenance'
+ANALYSIS_LARGE_COST_THRESHOLD = float(os.getenv('ANALYSIS_LARGE_COST_THRESHOLD', 5000))
+
+CELERY_TASK_DEFAULT_QUEUE = ANALYSIS_QUEUE_SMALL
 CELERY_TASK_ROUTES = {
-    'biomass.tasks.*': {'queue': 'biomass_queue'},
+    'biomass.api.tasks.analyze_geojson_task': {'queue': ANALYSIS_QUEUE_SMALL},
+    'biomass.api.tasks.analyze_period_series_task': {'queue': ANALYSIS_QUEUE_SMALL},
+    'biomass.api.tasks.refresh_current_year_batch_task': {'queue': ANALYSIS_QUEUE_SMALL},
+    'biomass.api.tasks.batch_refresh_aois': {'queue': MAINTENANCE_QUEUE},
+    'biomass.api.tasks.refresh_analytics_view': {'queue': MAINTENANCE_QUEUE},
+}
+# Tareas largas: cada proceso toma un mensaje a la vez
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Límites por usuario al encolar análisis (biomass.api.throttles): solicitudes por
+# minuto, análisis en curso a la vez y Retry-After (s) cuando se alcanza el máximo en curso
+ANALYSIS_RATE_PER_MINUTE = int(os.getenv('ANALYSIS_RATE_PER_MINUTE', 10))
+ANALYSIS_MAX_IN_FLIGHT = int(os.getenv('ANALYSIS_MAX_IN_FLIGHT', 3))
+ANALYSIS_IN_FLIGHT_RETRY_AFTER = int(os.getenv('ANALYSIS_IN_FLIGHT_RETRY_AFTER', 60))
+
+# Presupuesto total de un análisis (segundos) según la cola y límite por año.
+# Al agotarse, los años restantes se reportan como error y se guardan los calculados.
+ANALYSIS_TIME_BUDGETS = {
+    ANALYSIS_QUEUE_SMALL: int(os.getenv('ANALYSIS_TIME_BUDGET_SMALL', 15 * 60)),
+    ANALYSIS_QUEUE_LARGE: int(os.getenv('ANALYSIS_TIME_BUDGET_LARGE', 2 * 60 * 60)),
+    'default': int(os.getenv('ANALYSIS_TIME_BUDGET_SMALL', 15 * 60)),
 }
+ANALYSIS_YEAR_TIME_LIMIT = int(os.getenv('ANALYSIS_YEAR_TIME_LIMIT', 10 * 60))
+
+# Un análisis del usuario encolado hace más que esto ya no cuenta como en curso
+# (la tarea se perdió sin actualizar el AOI): tiempo límite de la tarea más espera en cola
+ANALYSIS_IN_FLIGHT_STALE_AFTER = int(os.getenv('ANALYSIS_IN_FLIGHT_STALE_AFTER', max(ANALYSIS_TIME_BUDGETS.values()) + 30 * 60))
+
+# Earth Engine: concurrencia AIMD compartida (Redis) entre todos los workers,
+# reintentos por llamada y reintentos de la tarea si la cuota sigue agotada
+EE_CONCURRENCY_INITIAL = int(os.getenv('EE_CONCURRENCY_INITIAL', 4))
+EE_CONCURRENCY_MIN = int(os.getenv('EE_CONCURRENCY_MIN', 1))
+EE_CONCURRENCY_MAX = int(os.getenv('EE_CONCURRENCY_MAX', 40))
+EE_MAX_RETRIES = int(os.getenv('EE_MAX_RETRIES', 5))
+EE_QUOTA_TASK_RETRIES = int(os.getenv('EE_QUOTA_TASK_RETRIES', 3))
+EE_QUOTA_RETRY_COUNTDOWN = int(os.getenv('EE_QUOTA_RETRY_COUNTDOWN', 5 * 60))
+
+# Tareas periódicas (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'batch-refresh-aois': {
+        'task': 'biomass.api.tasks.batch_refresh_aois',
+        'schedule': crontab(hour=3, minute=0, day_of_week='mon'),
+    },
+}
+
+# Actualización masiva: AOIs por bloque, encolados por segundo (cuota de
+# Earth Engine) y ráfaga permitida del token bucket
+BATCH_REFRESH_CHUNK_SIZE = int(os.getenv('BATCH_REFRESH_CHUNK_SIZE', 100))
+BATCH_REFRESH_RATE = float(os.getenv('BATCH_REFRESH_RATE', 0.5))
+BATCH_REFRESH_BURST = int(os.getenv('BATCH_REFRESH_BURST', 5))
+# AOIs por petición a Earth Engine en el refresco del año en curso
+BATCH_REFRESH_EE_BATCH_SIZE = int(os.getenv('BATCH_REFRESH_EE_BATCH_SIZE', 25))
+BATCH_REFRESH_CHECKPOINT_TTL = int(os.getenv('BATCH_REFRESH_CHECKPOINT_TTL', 14 * 24 * 60 * 60))
+
+# Máximo de vértices de la geometría que se envía a Earth Engine.
+# Las geometrías más complejas se simplifican antes de la extracción (0 = sin límite).
+AOI_MAX_VERTICES = int(os.getenv('AOI_MAX_VERTICES', 2000))
+
+# Predicción con el evaluador NumPy compilado (core/ml_models/tree_compiler.py)
+# en lugar de model.predict. Medir antes con `manage.py bench_tree_evaluator`.
+COMPILED_MODEL_PREDICT = os.getenv('COMPILED_MODEL_PREDICT', 'False').lower() == 'true'
+COMPILED_MODEL_THREADS = int(os.getenv('COMPILED_MODEL_THREADS', 1))
+
+# Analítica agregada: leer de la vista materializada biomass_aoi_year_carbon
+# (se refresca ANALYTICS_REFRESH_DELAY segundos después de terminar un análisis)
+ANALYTICS_USE_MATERIALIZED_VIEW = os.getenv('ANALYTICS_USE_MATERIALIZED_VIEW', 'False').lower() == 'true'
+ANALYTICS_REFRESH_DELAY = int(os.getenv('ANALYTICS_REFRESH_DELAY', 60))
+
+# Segundos que se mantiene el lock single-flight de un análisis en curso
+ANALYSIS_LOCK_TTL = int(os.getenv('ANALYSIS_LOCK_TTL', 2 * 60 * 60))
+
+# Perfilado de peticiones (Server-Timing con SQL, tiempo total y memoria).
+# cProfile se activa por porcentaje o con la cabecera X-Profile: <token>
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'False').lower() == 'true'
+PROFILING_TRACEMALLOC = os.getenv('PROFILING_TRACEMALLOC', 'False').lower() == 'true'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_HEADER_TOKEN = os.getenv('PROFILING_HEADER_TOKEN', '')
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
 
 SITE_ID = 1
 